@@ -0,0 +1,38 @@
+"""Cost per record of fingerprinting, by hash algorithm.
+
+The baseline is the old behaviour: SHA-256 of the raw SQS body.
+"""
+import json
+
+from pydantic import TypeAdapter
+
+from benchmarks.samples import STORAGE_PAYLOADS
+from benchmarks.samples import per_call_us
+from common.registry import DiscriminatedStoragePayload
+from common.utils import HASH_ALGORITHMS
+from common.utils import canonical_json
+from common.utils import get_fingerprint
+from common.utils import get_stable_hash
+
+
+def main() -> None:
+    adapter = TypeAdapter(DiscriminatedStoragePayload)
+
+    print(f"{'webhook':<16}{'algorithm':<14}{'us/record':>10}")
+    for webhook_id, raw in STORAGE_PAYLOADS.items():
+        body = json.dumps(raw)
+        model = adapter.validate_python(raw)
+
+        us = per_call_us(lambda: get_stable_hash(body))
+        print(f"{webhook_id:<16}{'raw sha256':<14}{us:>10.2f}")
+
+        us = per_call_us(lambda: canonical_json(model))
+        print(f"{webhook_id:<16}{'(canonical)':<14}{us:>10.2f}")
+
+        for algorithm in HASH_ALGORITHMS:
+            us = per_call_us(lambda: get_fingerprint(model, algorithm))
+            print(f"{webhook_id:<16}{algorithm:<14}{us:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
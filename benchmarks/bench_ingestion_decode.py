@@ -0,0 +1,49 @@
+"""Per-record CPU cost of the ingestion handler's decode stage by batch size.
+
+The old stage ran json.loads, validate_python and a hash per record; the new
+one validates the whole batch with a single validate_json call.
+"""
+import json
+
+from benchmarks.samples import STORAGE_PAYLOADS
+from benchmarks.samples import load_service
+from benchmarks.samples import per_call_us
+from common.utils import get_fingerprint
+
+BATCH_SIZES = (5, 100, 1000)
+
+
+def old_decode(handler, records):
+    """What the handler did per record before decode_batch"""
+    decoded = []
+    for record in records:
+        payload = handler.adapter.validate_python(json.loads(record["body"]))
+        decoded.append((record["messageId"], payload, get_fingerprint(payload)))
+    return decoded
+
+
+def make_records(count: int) -> list:
+    payloads = list(STORAGE_PAYLOADS.values())
+    return [
+        {"messageId": f"m{i}", "body": json.dumps(payloads[i % len(payloads)])}
+        for i in range(count)
+    ]
+
+
+def main() -> None:
+    handler = load_service("ingestion-handler")
+
+    print(f"{'batch':>6}{'old us/rec':>12}{'new us/rec':>12}{'validate only':>15}")
+    for size in BATCH_SIZES:
+        records = make_records(size)
+        bodies = [r["body"] for r in records]
+        number = max(1, 2000 // size)
+
+        old = per_call_us(lambda: old_decode(handler, records), number=number) / size
+        new = per_call_us(lambda: handler.decode_batch(records), number=number) / size
+        validate = per_call_us(lambda: handler._validate_bodies(bodies), number=number) / size
+        print(f"{size:>6}{old:>12.2f}{new:>12.2f}{validate:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
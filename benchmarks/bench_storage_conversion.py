@@ -0,0 +1,51 @@
+"""Ingest model to storage message body, per webhook type.
+
+Compares the old revalidate-then-json.dumps route with dump_storage_json.
+"""
+import json
+
+from pydantic import TypeAdapter
+
+from benchmarks.samples import INGEST_PAYLOADS
+from benchmarks.samples import per_call_us
+from common.models import BillingIngest
+from common.models import BillingStorage
+from common.models import LeadIngest
+from common.models import LeadStorage
+from common.models import UserSignupIngest
+from common.models import UserSignupStorage
+from common.registry import DiscriminatedIngestionPayload
+from common.registry import dump_storage_json
+
+
+def transmute_and_dump(ingest_data) -> str:
+    """What the webhook handler used to do"""
+    if isinstance(ingest_data, LeadIngest):
+        storage = LeadStorage.model_validate(ingest_data, from_attributes=True)
+    elif isinstance(ingest_data, BillingIngest):
+        storage = BillingStorage.model_validate(ingest_data, from_attributes=True)
+    elif isinstance(ingest_data, UserSignupIngest):
+        storage = UserSignupStorage.model_validate(ingest_data, from_attributes=True)
+    else:
+        raise ValueError("Unknown payload type")
+    return json.dumps(storage.model_dump())
+
+
+def main() -> None:
+    adapter = TypeAdapter(DiscriminatedIngestionPayload)
+
+    print(f"{'webhook':<16}{'old us':>10}{'new us':>10}{'speedup':>10}")
+    for webhook_id, payload in INGEST_PAYLOADS.items():
+        model = adapter.validate_python(payload)
+        # The old route leaked secret_key: model_validate hands back subclass instances as is
+        old_body = json.loads(transmute_and_dump(model))
+        old_body.pop("secret_key")
+        assert old_body == json.loads(dump_storage_json(model))
+
+        old = per_call_us(lambda: transmute_and_dump(model))
+        new = per_call_us(lambda: dump_storage_json(model))
+        print(f"{webhook_id:<16}{old:>10.2f}{new:>10.2f}{old / new:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Per-request cost of POST /webhook through Mangum/FastAPI vs the raw fast path.
+
+SQS is stubbed out, so this measures only our own overhead.
+"""
+import json
+import os
+
+from benchmarks.samples import INGEST_PAYLOADS
+from benchmarks.samples import load_service
+from benchmarks.samples import per_call_us
+
+
+class StubSQS:
+    def send_message_batch(self, QueueUrl, Entries):
+        return {
+            "Successful": [{"Id": e["Id"], "MessageId": "msg"} for e in Entries],
+            "Failed": [],
+        }
+
+
+def function_url_event(body: str) -> dict:
+    return {
+        "version": "2.0",
+        "routeKey": "$default",
+        "rawPath": "/webhook",
+        "rawQueryString": "",
+        "headers": {"content-type": "application/json", "host": "example.com"},
+        "requestContext": {
+            "http": {
+                "method": "POST",
+                "path": "/webhook",
+                "protocol": "HTTP/1.1",
+                "sourceIp": "127.0.0.1",
+                "userAgent": "bench",
+            },
+            "domainName": "bench.lambda-url.eu-north-1.on.aws",
+            "requestId": "bench",
+            "stage": "$default",
+        },
+        "body": body,
+        "isBase64Encoded": False,
+    }
+
+
+def main() -> None:
+    os.environ.setdefault("QUEUE_URL", "https://example.com/queue")
+    # Every call re-sends the same payload, so switch off batching delay and dedupe
+    os.environ["SQS_BATCH_WINDOW_MS"] = "0"
+    os.environ["DEDUPE_MAX_ENTRIES"] = "0"
+
+    handler = load_service("webhook-handler")
+    sqs = StubSQS()
+    handler.sqs_batcher.client_factory = lambda: sqs
+    handler.logger.disabled = True
+
+    print(f"{'webhook':<16}{'mangum us':>12}{'fast us':>12}{'speedup':>10}")
+    for webhook_id, payload in INGEST_PAYLOADS.items():
+        event = function_url_event(json.dumps(payload))
+        assert handler.handler(event, None)["statusCode"] == 202
+
+        slow = per_call_us(lambda: handler.asgi_handler(event, None), number=2000)
+        fast = per_call_us(lambda: handler.handler(event, None), number=2000)
+        print(f"{webhook_id:<16}{slow:>12.1f}{fast:>12.1f}{slow / fast:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Bytes and CPU cost of queue message bodies, plain JSON against the compact codec.
+
+Per webhook type: body size, encode time in the webhook handler and decode
+plus validation time in the ingestion handler, for one body and per body in
+a batch of 100.
+"""
+import json
+
+from pydantic import TypeAdapter
+
+from benchmarks.samples import INGEST_PAYLOADS
+from benchmarks.samples import load_service
+from benchmarks.samples import per_call_us
+from common import codec
+from common.registry import DiscriminatedIngestionPayload
+from common.registry import dump_storage_json
+
+BATCH = 100
+
+
+def main() -> None:
+    ingestion = load_service("ingestion-handler")
+    ingest_adapter = TypeAdapter(DiscriminatedIngestionPayload)
+
+    print(
+        f"{'webhook':<16}{'format':<9}{'bytes':>7}{'encode us':>11}"
+        f"{'decode us':>11}{'batch us/rec':>14}"
+    )
+    for webhook_id, raw in INGEST_PAYLOADS.items():
+        data = ingest_adapter.validate_python(raw)
+        legacy = dump_storage_json(data).decode()
+        compact = codec.encode(data).decode()
+
+        rows = (
+            (
+                "json",
+                legacy,
+                lambda: dump_storage_json(data),
+                lambda: ingestion._validate_bodies([legacy]),
+                lambda: ingestion._validate_bodies([legacy] * BATCH),
+            ),
+            (
+                "compact",
+                compact,
+                lambda: codec.encode(data),
+                lambda: ingestion._validate_bodies([codec.decode(compact)]),
+                lambda: ingestion._validate_bodies(
+                    [codec.decode(compact) for _ in range(BATCH)]
+                ),
+            ),
+        )
+        for fmt, body, encode, decode, decode_batch in rows:
+            encode_us = per_call_us(encode)
+            decode_us = per_call_us(decode)
+            batch_us = per_call_us(decode_batch, number=200) / BATCH
+            print(
+                f"{webhook_id:<16}{fmt:<9}{len(body.encode()):>7}"
+                f"{encode_us:>11.2f}{decode_us:>11.2f}{batch_us:>14.2f}"
+            )
+
+    # Sanity check: both formats land on the same storage payload
+    for webhook_id, raw in INGEST_PAYLOADS.items():
+        data = ingest_adapter.validate_python(raw)
+        plain = ingestion.adapter.validate_json(dump_storage_json(data))
+        assert ingestion.adapter.validate_python(codec.decode(codec.encode(data))) == plain
+        assert json.loads(dump_storage_json(data))["webhook_id"] == webhook_id
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Shared payloads and helpers for the benchmarks.
+
+Run benchmarks from the repository root, e.g.
+``python -m benchmarks.bench_fingerprint``.
+"""
+import importlib.util
+import os
+import timeit
+from types import ModuleType
+from typing import Callable
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+INGEST_PAYLOADS = {
+    "lead_ingest": {
+        "webhook_id": "lead_ingest",
+        "secret_key": "super-secret-123",
+        "lead_id": "LD-0001",
+        "email": "zote@themighty.com",
+        "status": "glorious",
+    },
+    "billing_update": {
+        "webhook_id": "billing_update",
+        "secret_key": "money-talks-99",
+        "customer_id": "cust_007",
+        "amount": 123.45,
+        "currency": "USD",
+        "transaction_id": "txn_001",
+    },
+    "user_signup": {
+        "webhook_id": "user_signup",
+        "secret_key": "welcome-hero-00",
+        "username": "zote",
+        "email": "zote@themighty.com",
+        "source_campaign": "spring_launch",
+        "is_premium": True,
+    },
+}
+
+STORAGE_PAYLOADS = {
+    webhook_id: {k: v for k, v in payload.items() if k != "secret_key"}
+    for webhook_id, payload in INGEST_PAYLOADS.items()
+}
+
+
+def load_service(service: str, module_name: str | None = None) -> ModuleType:
+    """Import services/<service>/handler.py under a unique module name"""
+    path = os.path.join(ROOT, "services", service, "handler.py")
+    name = module_name or service.replace("-", "_")
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def per_call_us(func: Callable[[], object], number: int = 20000, repeat: int = 5) -> float:
+    """Best of ``repeat`` runs, in microseconds per call"""
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e6
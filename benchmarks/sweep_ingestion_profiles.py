@@ -0,0 +1,114 @@
+"""Replay a synthetic SQS load through the ingestion handler for each profile.
+
+DynamoDB is replaced by a stub that sleeps to simulate a transaction round
+trip, so the numbers show how batch size, invocation concurrency and write
+lanes trade off, not absolute AWS throughput. The batching window only adds
+latency and is not simulated.
+
+    python -m benchmarks.sweep_ingestion_profiles --records 5000 --latency-ms 10
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.samples import ROOT
+from benchmarks.samples import STORAGE_PAYLOADS
+from benchmarks.samples import load_service
+
+sys.path.append(os.path.join(ROOT, "iac"))
+from profiles import PROFILES  # noqa: E402
+
+
+class StubDynamoClient:
+    def __init__(self, latency_s: float, per_item_s: float) -> None:
+        self.latency_s = latency_s
+        self.per_item_s = per_item_s
+
+    def transact_write_items(self, TransactItems):
+        time.sleep(self.latency_s + self.per_item_s * len(TransactItems))
+        return {}
+
+
+def make_records(count: int, partitions: int) -> list:
+    payloads = list(STORAGE_PAYLOADS.values())
+    records = []
+    for i in range(count):
+        body = dict(payloads[i % len(payloads)])
+        # Unique sort keys spread over a fixed number of partitions
+        for key in ("lead_id", "transaction_id", "username"):
+            if key in body:
+                body[key] = f"{body[key]}-{i}"
+        for key in ("email", "customer_id"):
+            if key in body:
+                body[key] = f"user{i % partitions}@example.com"
+        records.append({"messageId": f"m{i}", "body": json.dumps(body)})
+    return records
+
+
+def simulated_containers(profile, args) -> int:
+    return min(profile.queue.max_concurrency or args.max_containers, args.max_containers)
+
+
+def run_profile(profile, records, args) -> float:
+    containers = simulated_containers(profile, args)
+    client = StubDynamoClient(args.latency_ms / 1000, args.per_item_ms / 1000)
+
+    # One module per simulated container, like separate Lambda environments
+    local = threading.local()
+
+    def invoke(batch):
+        if not hasattr(local, "handler"):
+            handler = load_service("ingestion-handler", f"ingest_{threading.get_ident()}")
+            handler.INGEST_CONCURRENCY = profile.queue.write_concurrency
+            handler.TABLE = types.SimpleNamespace(
+                name="data-table", meta=types.SimpleNamespace(client=client)
+            )
+            local.handler = handler
+        result = local.handler.handler({"Records": batch}, None)
+        assert not result["batchItemFailures"]
+
+    size = profile.queue.batch_size
+    batches = [records[i : i + size] for i in range(0, len(records), size)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=containers) as pool:
+        list(pool.map(invoke, batches))
+    elapsed = time.perf_counter() - start
+
+    return len(records) / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument("--partitions", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=8.0)
+    parser.add_argument("--per-item-ms", type=float, default=0.2)
+    parser.add_argument(
+        "--max-containers",
+        type=int,
+        default=20,
+        help="Stand-in for unlimited queue concurrency",
+    )
+    parser.add_argument("profiles", nargs="*", default=list(PROFILES))
+    args = parser.parse_args()
+
+    records = make_records(args.records, args.partitions)
+
+    print(f"{'profile':<10}{'batch':>7}{'invocations':>13}{'lanes':>7}{'records/s':>12}")
+    for name in args.profiles:
+        profile = PROFILES[name]
+        rate = run_profile(profile, records, args)
+        print(
+            f"{name:<10}{profile.queue.batch_size:>7}{simulated_containers(profile, args):>13}"
+            f"{profile.queue.write_concurrency:>7}{rate:>12.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
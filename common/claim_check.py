@@ -0,0 +1,90 @@
+"""Keeps SQS messages small: big bodies are compressed, huge ones parked in S3.
+
+How a body was encoded travels in the ``body_encoding`` message attribute, so
+plain messages, including any queued before this existed, carry none.
+"""
+import base64
+import gzip
+import hashlib
+import json
+from typing import Callable
+from typing import Dict
+from typing import Tuple
+
+from common.sqs import record_attributes
+from common.sqs import string_attributes
+
+BODY_ENCODING = "body_encoding"
+
+# Body is base64 of the gzipped payload
+GZIP_BASE64 = "gzip+base64"
+# Body is {"bucket": ..., "key": ...} of a gzipped payload in S3
+S3_POINTER = "s3+gzip"
+
+
+def message_attributes(encoding: str | None) -> Dict[str, dict] | None:
+    """MessageAttributes for SendMessage(Batch), None for a plain body"""
+    return string_attributes({BODY_ENCODING: encoding})
+
+
+def record_encoding(record: dict) -> str | None:
+    """body_encoding of a record in a Lambda SQS event"""
+    return record_attributes(record).get(BODY_ENCODING)
+
+
+def payload_key(data: bytes, prefix: str = "payloads") -> str:
+    """Content addressed key, so a payload queued twice is stored once"""
+    return f"{prefix}/{hashlib.sha256(data).hexdigest()}.json.gz"
+
+
+def encode_body(
+    body: bytes,
+    compress_min_bytes: int,
+    offload_min_bytes: int,
+    offload: Callable[[bytes], Tuple[str, str]] | None = None,
+) -> Tuple[str, str | None]:
+    """Pick the cheapest encoding of a message body that fits.
+
+    Bodies from ``compress_min_bytes`` are gzipped if that makes them smaller.
+    Anything still at least ``offload_min_bytes`` is handed to ``offload``,
+    which stores the gzipped bytes and returns their (bucket, key).
+
+    Returns:
+        The message body and its encoding, None for a plain body
+    """
+    if len(body) < min(compress_min_bytes, offload_min_bytes):
+        return body.decode("utf-8"), None
+
+    # mtime=0 so the same payload always compresses to the same bytes
+    compressed = gzip.compress(body, compresslevel=6, mtime=0)
+    encoded = base64.b64encode(compressed).decode("ascii")
+
+    message, encoding = body.decode("utf-8"), None
+    if len(body) >= compress_min_bytes and len(encoded) < len(body):
+        message, encoding = encoded, GZIP_BASE64
+
+    if offload is not None and len(message) >= offload_min_bytes:
+        bucket, key = offload(compressed)
+        return json.dumps({"bucket": bucket, "key": key}), S3_POINTER
+
+    return message, encoding
+
+
+def decode_body(
+    body: str,
+    encoding: str | None,
+    fetch: Callable[[str, str], bytes] | None = None,
+) -> str:
+    """Undo encode_body, fetching parked payloads with ``fetch(bucket, key)``
+
+    Raises:
+        ValueError for an encoding this code doesn't know
+    """
+    if encoding is None:
+        return body
+    if encoding == GZIP_BASE64:
+        return gzip.decompress(base64.b64decode(body)).decode("utf-8")
+    if encoding == S3_POINTER and fetch is not None:
+        pointer = json.loads(body)
+        return gzip.decompress(fetch(pointer["bucket"], pointer["key"])).decode("utf-8")
+    raise ValueError(f"Cannot decode a body with encoding {encoding}")
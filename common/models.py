@@ -1,11 +1,14 @@
-from typing import Annotated
 from typing import Literal
-from typing import Union
 
 from pydantic import BaseModel
 from pydantic import Field
+from pydantic import ValidationInfo
 from pydantic import model_validator
 
+from common.secret_providers import SecretProvider
+from common.secret_providers import StaticSecretProvider
+from common.secret_providers import secrets_match
+
 
 SUPER_SECRET_PASSWORDS = {
     "lead_ingest": "super-secret-123",
@@ -14,13 +17,22 @@ SUPER_SECRET_PASSWORDS = {
 }
 
 
+# Used when validation isn't given a provider through its context
+_secret_provider: SecretProvider = StaticSecretProvider(SUPER_SECRET_PASSWORDS)
+
+
+def set_secret_provider(provider: SecretProvider) -> None:
+    """Replace the default provider, e.g. with one backed by Secrets Manager"""
+    global _secret_provider
+    _secret_provider = provider
+
+
 def get_secret_for_webhook(webhook_id: str) -> str | None:
-    """Return the secret for a webhook id.
+    """Return the secret for a webhook id from the default provider.
 
-    This is deliberately a separate function so tests can monkeypatch
-    it, or it can later be replaced with a call to a secrets manager.
+    This is deliberately a separate function so tests can monkeypatch it.
     """
-    return SUPER_SECRET_PASSWORDS.get(webhook_id)
+    return _secret_provider.get(webhook_id)
 
 
 class StorageBaseModel(BaseModel):
@@ -31,16 +43,21 @@ class WebhookBaseModel(BaseModel):
     secret_key: str = Field(..., description="The poor man's API key")
 
     @model_validator(mode="after")
-    def validate_signature(self) -> "WebhookBaseModel":
+    def validate_signature(self, info: ValidationInfo) -> "WebhookBaseModel":
         webhook_id = getattr(self, "webhook_id", None)
         secret_key = self.secret_key
 
         if not webhook_id:
             raise ValueError("webhook_id is missing from the payload")
 
-        expected_secret = get_secret_for_webhook(webhook_id)
+        # Callers can pass context={"secret_provider": ...} to validation
+        provider = (info.context or {}).get("secret_provider")
+        if provider is not None:
+            expected_secret = provider.get(webhook_id)
+        else:
+            expected_secret = get_secret_for_webhook(webhook_id)
 
-        if secret_key != expected_secret:
+        if not secrets_match(expected_secret, secret_key):
             raise ValueError(f"Invalid signature for webhook type: {webhook_id}")
 
         return self
@@ -79,14 +96,3 @@ class UserSignupStorage(StorageBaseModel):
 
 class UserSignupIngest(UserSignupStorage, WebhookBaseModel):
     pass
-
-
-DiscriminatedIngestionPayload = Annotated[
-    Union[LeadIngest, BillingIngest, UserSignupIngest],
-    Field(discriminator="webhook_id"),
-]
-
-DiscriminatedStoragePayload = Annotated[
-    Union[LeadStorage, BillingStorage, UserSignupStorage],
-    Field(discriminator="webhook_id"),
-]
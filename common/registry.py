@@ -0,0 +1,133 @@
+"""Every webhook type the pipeline knows about, declared in one place.
+
+The discriminated unions, adapters and per type lookups used by the services
+are built from WEBHOOK_TYPES at import. Adding a webhook type means writing
+its models in ``common.models``, declaring it below and giving it a field
+list in the wire schema (``common.codec``); the handlers dispatch on
+``webhook_id`` and pick it up from there.
+"""
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Annotated
+from typing import Dict
+from typing import Tuple
+from typing import Type
+from typing import Union
+
+from pydantic import BaseModel
+from pydantic import Field
+from pydantic import TypeAdapter
+
+from common.models import BillingIngest
+from common.models import BillingStorage
+from common.models import LeadIngest
+from common.models import LeadStorage
+from common.models import StorageBaseModel
+from common.models import UserSignupIngest
+from common.models import UserSignupStorage
+from common.models import WebhookBaseModel
+
+
+@dataclass(frozen=True)
+class WebhookType:
+    webhook_id: str
+    ingest_model: Type[WebhookBaseModel]
+    storage_model: Type[StorageBaseModel]
+    # str.format templates over the storage fields for the item's keys
+    pk: str
+    sk: str
+    # Deploy time environment variable holding this type's secret
+    secret_env: str
+    # Identifies the type in compact queue messages, never reuse one
+    wire_tag: int
+    # Dumps an ingest model through the storage model's serializer, which only
+    # emits storage fields, so secret_key is dropped without revalidating
+    storage_adapter: TypeAdapter = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "storage_adapter", TypeAdapter(self.storage_model))
+
+    def keys(self, payload: BaseModel) -> Tuple[str, str]:
+        """PK and SK of the item a payload is stored as"""
+        fields = payload.__dict__
+        return self.pk.format_map(fields), self.sk.format_map(fields)
+
+
+WEBHOOK_TYPES: Dict[str, WebhookType] = {
+    webhook_type.webhook_id: webhook_type
+    for webhook_type in (
+        WebhookType(
+            webhook_id="lead_ingest",
+            ingest_model=LeadIngest,
+            storage_model=LeadStorage,
+            pk="USER#{email}",
+            sk="LEAD#{lead_id}",
+            secret_env="WEBHOOK_SECRET_INGEST",
+            wire_tag=1,
+        ),
+        WebhookType(
+            webhook_id="billing_update",
+            ingest_model=BillingIngest,
+            storage_model=BillingStorage,
+            pk="USER#{customer_id}",
+            sk="BILL#{transaction_id}",
+            secret_env="WEBHOOK_SECRET_BILLING",
+            wire_tag=2,
+        ),
+        WebhookType(
+            webhook_id="user_signup",
+            ingest_model=UserSignupIngest,
+            storage_model=UserSignupStorage,
+            # Static sk, one profile per user
+            pk="USER#{email}",
+            sk="METADATA",
+            secret_env="WEBHOOK_SECRET_SIGNUP",
+            wire_tag=3,
+        ),
+    )
+}
+
+# Any model, ingest or storage, to its type, for dispatch on a validated payload
+_BY_MODEL: Dict[type, WebhookType] = {
+    model: webhook_type
+    for webhook_type in WEBHOOK_TYPES.values()
+    for model in (webhook_type.ingest_model, webhook_type.storage_model)
+}
+
+DiscriminatedIngestionPayload = Annotated[
+    Union[tuple(t.ingest_model for t in WEBHOOK_TYPES.values())],  # type: ignore[misc]
+    Field(discriminator="webhook_id"),
+]
+
+DiscriminatedStoragePayload = Annotated[
+    Union[tuple(t.storage_model for t in WEBHOOK_TYPES.values())],  # type: ignore[misc]
+    Field(discriminator="webhook_id"),
+]
+
+
+def get_webhook_type(webhook_id: str) -> WebhookType:
+    """
+    Raises:
+        ValueError for a webhook id nobody registered
+    """
+    try:
+        return WEBHOOK_TYPES[webhook_id]
+    except KeyError:
+        raise ValueError(f"Unknown webhook type: {webhook_id}")
+
+
+def webhook_type_of(payload: BaseModel) -> WebhookType:
+    """The registered type of a validated ingest or storage model
+
+    Raises:
+        ValueError for a model that isn't registered
+    """
+    try:
+        return _BY_MODEL[type(payload)]
+    except KeyError:
+        raise ValueError("Unknown payload type")
+
+
+def dump_storage_json(ingest_data: WebhookBaseModel) -> bytes:
+    """Serialise a validated ingest model straight to storage JSON bytes"""
+    return webhook_type_of(ingest_data).storage_adapter.dump_json(ingest_data)
@@ -0,0 +1,100 @@
+import hmac
+import json
+import logging
+import threading
+import time
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Mapping
+
+logger = logging.getLogger("crm_ingestion")
+
+
+def secrets_match(expected: str | None, provided: str | None) -> bool:
+    """Constant time comparison so response timing leaks nothing about the key"""
+    if expected is None or provided is None:
+        return False
+    return hmac.compare_digest(expected.encode("utf-8"), provided.encode("utf-8"))
+
+
+class SecretProvider:
+    """Looks up the shared secret for a webhook type"""
+
+    def get(self, webhook_id: str) -> str | None:
+        raise NotImplementedError
+
+    def prefetch(self) -> None:
+        """Load secrets ahead of the first request, if the provider needs to"""
+
+
+class StaticSecretProvider(SecretProvider):
+    def __init__(self, secrets: Mapping[str, str]) -> None:
+        self.secrets = dict(secrets)
+
+    def get(self, webhook_id: str) -> str | None:
+        return self.secrets.get(webhook_id)
+
+
+class SecretsManagerProvider(SecretProvider):
+    """Secrets Manager backed provider with refresh-ahead caching.
+
+    Only the very first load blocks. Once the TTL has passed the current
+    values keep being served while a background thread fetches new ones, so
+    rotated keys take effect without a cold start or a slow request.
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[[], Any],
+        secret_id: str,
+        ttl_seconds: float = 300,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.client_factory = client_factory
+        self.secret_id = secret_id
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+
+        self._secrets: Dict[str, str] | None = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def prefetch(self) -> None:
+        try:
+            self._load()
+        except Exception:
+            # The first request will try again
+            logger.exception("Failed to prefetch webhook secrets")
+
+    def get(self, webhook_id: str) -> str | None:
+        if self._secrets is None:
+            self._load()
+        elif self.clock() - self._loaded_at >= self.ttl_seconds:
+            self._refresh_in_background()
+
+        return self._secrets.get(webhook_id)  # type: ignore[union-attr]
+
+    def _load(self) -> None:
+        response = self.client_factory().get_secret_value(SecretId=self.secret_id)
+        self._secrets = json.loads(response["SecretString"])
+        self._loaded_at = self.clock()
+
+    def _refresh_in_background(self) -> None:
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        threading.Thread(target=self._refresh, daemon=True).start()
+
+    def _refresh(self) -> None:
+        try:
+            self._load()
+        except Exception:
+            # Keep serving the old values, next request retries
+            logger.exception("Failed to refresh webhook secrets")
+        finally:
+            with self._lock:
+                self._refreshing = False
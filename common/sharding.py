@@ -0,0 +1,106 @@
+"""Spreads a hot partition's writes over several partition keys.
+
+Items under a hot partition key are written to ``{pk}#{n}`` instead, with n
+taken from a hash of the sort key. An item always lands on the same shard, so
+conditional writes stay idempotent. Readers query the original key and every
+shard and merge the results by sort key; the original key still holds
+whatever was written before the partition was sharded.
+
+Hot keys come from HOT_PARTITION_KEYS, a comma separated list of partition
+keys each optionally followed by ``=shards``, e.g.
+``USER#big@example.com,USER#huge@example.com=16``. Writers and readers have to
+agree on it, so set it on both, and only change it while nothing for those
+partitions is in flight: a record retried across the change is written again
+under its new key.
+
+Index keys with only a few values, like a lead's status, are always written
+sharded: the item carries ``{value}#{n}`` in a separate attribute that the
+index is keyed on, and readers query every shard of the value.
+STATUS_INDEX_SHARDS has to match between writers and readers too.
+"""
+import os
+import zlib
+from typing import Dict
+from typing import Iterable
+from typing import List
+
+DEFAULT_SHARDS = int(os.environ.get("PARTITION_SHARDS", "8"))
+
+
+def parse_hot_keys(value: str | None, default_shards: int = DEFAULT_SHARDS) -> Dict[str, int]:
+    """Partition key to shard count from a HOT_PARTITION_KEYS value"""
+    hot: Dict[str, int] = {}
+    for entry in (value or "").split(","):
+        pk, _, shards = entry.strip().partition("=")
+        if pk:
+            hot[pk] = int(shards) if shards else default_shards
+    return hot
+
+
+HOT_PARTITIONS = parse_hot_keys(os.environ.get("HOT_PARTITION_KEYS"))
+
+# Shards of the status-index's hash key, see status_key
+STATUS_INDEX_SHARDS = int(os.environ.get("STATUS_INDEX_SHARDS", "8"))
+
+
+def shard_count(pk: str) -> int:
+    """Shards a partition is spread over, 0 if it isn't"""
+    shards = HOT_PARTITIONS.get(pk, 0)
+    return shards if shards > 1 else 0
+
+
+def write_key(pk: str, sk: str) -> str:
+    """The partition key an item is written under"""
+    shards = shard_count(pk)
+    if not shards:
+        return pk
+    # crc32 rather than hash(), which changes between processes
+    return f"{pk}#{zlib.crc32(sk.encode('utf-8')) % shards}"
+
+
+def status_key(status: str, sk: str) -> str:
+    """The status-index hash key of an item with this status"""
+    return f"{status}#{zlib.crc32(sk.encode('utf-8')) % STATUS_INDEX_SHARDS}"
+
+
+def status_keys(status: str) -> List[str]:
+    """Every status-index hash key holding items with this status"""
+    return [f"{status}#{n}" for n in range(STATUS_INDEX_SHARDS)]
+
+
+def read_keys(pk: str) -> List[str]:
+    """Every partition key an item of ``pk`` may be under, the original first"""
+    return [pk] + [f"{pk}#{n}" for n in range(shard_count(pk))]
+
+
+def logical_key(pk: str) -> str:
+    """Undo write_key, so callers never see a shard suffix"""
+    base, _, suffix = pk.rpartition("#")
+    if suffix.isdigit() and int(suffix) < shard_count(base):
+        return base
+    return pk
+
+
+def unshard(item: dict) -> dict:
+    """An item as callers should see it, under its logical partition key"""
+    pk = item.get("PK")
+    if pk is None:
+        return item
+    logical = logical_key(pk)
+    return item if logical == pk else {**item, "PK": logical}
+
+
+def merge_by_sk(pk: str, results: Iterable[List[dict]]) -> List[dict]:
+    """Merge items read from several keys of ``pk`` into one sorted partition.
+
+    An item found under more than one key keeps its first copy, and every
+    item comes back under ``pk``.
+    """
+    merged: Dict[str, dict] = {}
+    for items in results:
+        for item in items:
+            merged.setdefault(item["SK"], item)
+    return [
+        {**item, "PK": pk} if "PK" in item else item
+        for _, item in sorted(merged.items())
+    ]
@@ -0,0 +1,190 @@
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+# SendMessageBatch hard limits
+MAX_BATCH_ENTRIES = 10
+MAX_BATCH_BYTES = 256 * 1024
+
+
+class SendEntryError(Exception):
+    """Raised for a single entry that SQS reported as failed in a batch response."""
+
+    def __init__(self, code: str, message: str, sender_fault: bool) -> None:
+        super().__init__(f"{code}: {message}")
+        self.code = code
+        self.sender_fault = sender_fault
+
+
+def string_attributes(values: Dict[str, str | None]) -> Dict[str, dict] | None:
+    """MessageAttributes for SendMessage(Batch), leaving out None values"""
+    attributes = {
+        name: {"DataType": "String", "StringValue": value}
+        for name, value in values.items()
+        if value is not None
+    }
+    return attributes or None
+
+
+def record_attributes(record: dict) -> Dict[str, str]:
+    """String message attributes of a record in a Lambda SQS event"""
+    return {
+        name: attribute["stringValue"]
+        for name, attribute in record.get("messageAttributes", {}).items()
+        if attribute.get("stringValue") is not None
+    }
+
+
+def _attributes_size(attributes: Dict[str, dict] | None) -> int:
+    """Message attributes count towards the size limit: name, type and value"""
+    size = 0
+    for name, attribute in (attributes or {}).items():
+        value = attribute.get("StringValue") or attribute.get("BinaryValue") or ""
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        size += len(name.encode("utf-8")) + len(attribute["DataType"]) + len(value)
+    return size
+
+
+def message_size(body: str, attributes: Dict[str, dict] | None = None) -> int:
+    """Bytes a message counts for against the 256 KB request limit"""
+    return len(body.encode("utf-8")) + _attributes_size(attributes)
+
+
+@dataclass
+class _Batch:
+    entries: List[Tuple[Dict[str, Any], Future]] = field(default_factory=list)
+    size: int = 0
+    closed: bool = False
+
+
+class SendMessageBatcher:
+    """Coalesces messages from concurrent callers into SendMessageBatch calls.
+
+    The first caller into an empty batch becomes its leader: it waits up to
+    ``window_seconds`` for other callers to join, then sends the batch. A batch
+    is sent early once it reaches 10 entries or would exceed 256 KB. Every
+    caller blocks until SQS has acknowledged (or rejected) its own entry.
+
+    Waiting only pays off in a server handling many requests at once. A
+    Lambda environment runs one request at a time, so nobody can ever join
+    its batch, and a window there is pure added latency. The default of 0
+    sends straight away.
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[[], Any],
+        queue_url: str | None,
+        window_seconds: float = 0.0,
+        max_entries: int = MAX_BATCH_ENTRIES,
+        max_bytes: int = MAX_BATCH_BYTES,
+    ) -> None:
+        self.client_factory = client_factory
+        self.queue_url = queue_url
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._cond = threading.Condition()
+        self._batch: _Batch | None = None
+
+    def send(self, body: str, attributes: Dict[str, dict] | None = None) -> str:
+        """Send one message and return its MessageId once acknowledged.
+
+        Raises:
+            SendEntryError if SQS rejected this entry
+            Whatever the client raised if the whole batch call failed
+        """
+        return self.submit(body, attributes).result()
+
+    def submit(self, body: str, attributes: Dict[str, dict] | None = None) -> Future:
+        """Queue a message for the next batch and return a future for its MessageId"""
+        size = message_size(body, attributes)
+        if size > self.max_bytes:
+            raise ValueError(f"Message of {size} bytes exceeds the {self.max_bytes} byte limit")
+
+        future: Future = Future()
+        with self._cond:
+            batch = self._batch
+            if batch is not None and batch.size + size > self.max_bytes:
+                # No room left, hand the current batch to its leader
+                self._close(batch)
+                batch = None
+
+            leader = batch is None
+            if batch is None:
+                batch = self._batch = _Batch()
+
+            entry = {"Id": str(len(batch.entries)), "MessageBody": body}
+            if attributes:
+                entry["MessageAttributes"] = attributes
+            batch.entries.append((entry, future))
+            batch.size += size
+
+            if len(batch.entries) >= self.max_entries:
+                self._close(batch)
+
+        if leader:
+            self._lead(batch)
+
+        return future
+
+    def _close(self, batch: _Batch) -> None:
+        """Stop a batch accepting entries and wake its leader. Caller holds the lock."""
+        batch.closed = True
+        if self._batch is batch:
+            self._batch = None
+        self._cond.notify_all()
+
+    def _lead(self, batch: _Batch) -> None:
+        if self.window_seconds <= 0:
+            with self._cond:
+                self._close(batch)
+            self._flush(batch)
+            return
+
+        deadline = time.monotonic() + self.window_seconds
+        with self._cond:
+            while not batch.closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._close(batch)
+                    break
+                self._cond.wait(remaining)
+
+        self._flush(batch)
+
+    def _flush(self, batch: _Batch) -> None:
+        futures = {entry["Id"]: future for entry, future in batch.entries}
+        try:
+            response = self.client_factory().send_message_batch(
+                QueueUrl=self.queue_url, Entries=[entry for entry, _ in batch.entries]
+            )
+        except Exception as e:
+            for future in futures.values():
+                future.set_exception(e)
+            return
+
+        for success in response.get("Successful", []):
+            futures.pop(success["Id"]).set_result(success["MessageId"])
+
+        for failure in response.get("Failed", []):
+            futures.pop(failure["Id"]).set_exception(
+                SendEntryError(
+                    failure.get("Code", "Unknown"),
+                    failure.get("Message", ""),
+                    failure.get("SenderFault", False),
+                )
+            )
+
+        # Anything SQS didn't mention must not leave a caller hanging
+        for future in futures.values():
+            future.set_exception(SendEntryError("Missing", "No result for entry", False))
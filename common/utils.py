@@ -1,6 +1,77 @@
 import hashlib
+import json
+import os
+from decimal import Decimal
+from typing import Any
+from typing import Callable
+from typing import Dict
+
+from pydantic import BaseModel
+
+try:
+    import xxhash
+except ImportError:  # Optional, only needed for the xxh3 algorithm
+    xxhash = None
+
+
+HASH_ALGORITHMS: Dict[str, Callable[[bytes], str]] = {
+    "sha256": lambda data: hashlib.sha256(data).hexdigest(),
+    "blake2b": lambda data: hashlib.blake2b(data, digest_size=32).hexdigest(),
+}
+
+if xxhash is not None:
+    HASH_ALGORITHMS["xxh3_128"] = xxhash.xxh3_128_hexdigest
+
+DEFAULT_HASH_ALGORITHM = os.environ.get("FINGERPRINT_ALGORITHM", "sha256")
+
+# Fields that say nothing about the record itself
+FINGERPRINT_EXCLUDE = frozenset({"secret_key"})
 
 
 def get_stable_hash(data: str) -> str:
     """Creates a deterministic string hash."""
     return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def register_hash_algorithm(name: str, func: Callable[[bytes], str]) -> None:
+    """Make a bytes -> hex digest function available to get_fingerprint"""
+    HASH_ALGORITHMS[name] = func
+
+
+def _normalise(value: Any) -> Any:
+    """Give equal numbers one representation, so 12, 12.0 and Decimal("12.00") match"""
+    kind = type(value)
+    if kind is str or kind is bool or kind is int or value is None:
+        return value
+    if kind is float:
+        # repr of a float is already its shortest round trip form
+        return int(value) if value.is_integer() else value
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, dict):
+        return {str(k): _normalise(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalise(v) for v in value]
+    return str(value)
+
+
+def canonical_json(model: BaseModel) -> bytes:
+    """Serialise a model's relevant fields with sorted keys and normalised numbers"""
+    data = model.model_dump(exclude=set(FINGERPRINT_EXCLUDE))
+    return json.dumps(
+        _normalise(data), sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    ).encode("utf-8")
+
+
+def get_fingerprint(model: BaseModel, algorithm: str | None = None) -> str:
+    """Content hash of a validated model.
+
+    Key order, whitespace and number formatting in the original payload do
+    not affect it, and ingest models hash the same as their storage model.
+    """
+    try:
+        hasher = HASH_ALGORITHMS[algorithm or DEFAULT_HASH_ALGORITHM]
+    except KeyError:
+        raise ValueError(f"Unknown hash algorithm: {algorithm or DEFAULT_HASH_ALGORITHM}")
+
+    return hasher(canonical_json(model))
@@ -7,33 +7,38 @@ import pulumi
 import pulumi_aws as aws
 
 from buckets.code_bucket import CodeBucket
+from buckets.export_bucket import ExportBucket
+from buckets.payload_bucket import PayloadBucket
+from cdc_export import CdcExport
 from data_api import DataAPI
 from database import Database
 from iam.data_api_access import ApiAccessManager
+from profiles import get_profile
 from ingestion_handler import IngestionHandler
 from ingestion_queue import IngestionQueue
 from webhook_handler import WebhookHandler
 
 infra: Dict[str, Any] = {}
 
+# Sizing and concurrency for every function, see profiles/
+profile = get_profile(pulumi.Config())
+pulumi.export("throughput_profile", profile.name)
+
+# Partition keys too busy for one partition, written to and read from shards:
+#   pulumilocal config set hotPartitionKeys "USER#big@example.com,USER#huge@example.com=16"
+hot_partition_keys = pulumi.Config().get("hotPartitionKeys") or ""
+
 # Create bucket for the webhook lambda function code to go in
 infra["code_bucket"] = CodeBucket("crm-code")
 
+# Webhook payloads too big for SQS, the queue only carries a pointer
+infra["payload_bucket"] = PayloadBucket("crm-payloads")
+
 # Ingestion queue for webhook lambda to queue to
-infra["ingestion_queue"] = IngestionQueue("crm-ingestion-sqs")
+infra["ingestion_queue"] = IngestionQueue("crm-ingestion-sqs", profile=profile)
 pulumi.export("ingestion_queue_url", infra["ingestion_queue"].queue.url)
-
-# Lambda to accept incoming webhooks
-infra["webhook_handler"] = WebhookHandler(
-    "crm-webhook",
-    code_bucket=infra["code_bucket"].code_bucket,
-    ingestion_queue=infra["ingestion_queue"].queue,
-)
-pulumi.export("webhook_endpoint", infra["webhook_handler"].lambda_url.function_url)
-pulumi.export("webhook_id", infra["webhook_handler"].webhook_lambda.id)
-pulumi.export("webhook_arn", infra["webhook_handler"].webhook_lambda.arn)
-# pulumi.export("secrets_arn", webhook_secrets_container.arn)
-
+pulumi.export("dead_letter_queue_url", infra["ingestion_queue"].dead_letter_queue.url)
+pulumi.export("quarantine_queue_url", infra["ingestion_queue"].quarantine_queue.url)
 
 # Database for storage
 infra["database"] = Database("database")
@@ -44,11 +49,32 @@ infra["ingestion_handler"] = IngestionHandler(
     "crm-ingest",
     code_bucket=infra["code_bucket"].code_bucket,
     ingestion_queue=infra["ingestion_queue"].queue,
+    quarantine_queue=infra["ingestion_queue"].quarantine_queue,
     database=infra["database"].db,
+    payload_bucket=infra["payload_bucket"].payload_bucket,
+    profile=profile,
+    hot_partition_keys=hot_partition_keys,
 )
 pulumi.export("ingester_id", infra["ingestion_handler"].ingestion_lambda.id)
 pulumi.export("ingester_arn", infra["ingestion_handler"].ingestion_lambda.arn)
 
+# Lambda to accept incoming webhooks, validated against the ingester's secrets.
+# Deployed after the ingester so it never queues a wire format the ingester
+# can't read yet
+infra["webhook_handler"] = WebhookHandler(
+    "crm-webhook",
+    opts=pulumi.ResourceOptions(depends_on=[infra["ingestion_handler"]]),
+    code_bucket=infra["code_bucket"].code_bucket,
+    ingestion_queue=infra["ingestion_queue"].queue,
+    secrets=infra["ingestion_handler"].webhook_secrets_container,
+    payload_bucket=infra["payload_bucket"].payload_bucket,
+    profile=profile,
+)
+pulumi.export("webhook_endpoint", infra["webhook_handler"].lambda_url.function_url)
+pulumi.export("webhook_id", infra["webhook_handler"].webhook_lambda.id)
+pulumi.export("webhook_arn", infra["webhook_handler"].webhook_lambda.arn)
+pulumi.export("secrets_arn", infra["ingestion_handler"].webhook_secrets_container.arn)
+
 # Create the API
 data_api_iam = ApiAccessManager("crm-prod")
 user = data_api_iam.create_user("zote-the-mighty")
@@ -61,12 +87,27 @@ infra["data_api"] = DataAPI(
     "crm-data-api",
     code_bucket=infra["code_bucket"].code_bucket,
     database=infra["database"].db,
-    invoke_users=[user]
+    invoke_users=[user],
+    profile=profile,
+    hot_partition_keys=hot_partition_keys,
 )
 pulumi.export("data_api_url", infra["data_api"].url.function_url)
 pulumi.export("data_api_id", infra["data_api"].data_api_lambda.id)
 pulumi.export("data_api_arn", infra["data_api"].data_api_lambda.arn)
 
+# Change stream of the table, exported to S3 for analytics
+infra["export_bucket"] = ExportBucket("crm-analytics")
+infra["cdc_export"] = CdcExport(
+    "crm-cdc-export",
+    code_bucket=infra["code_bucket"].code_bucket,
+    database=infra["database"].db,
+    export_bucket=infra["export_bucket"].export_bucket,
+    profile=profile,
+)
+pulumi.export("export_bucket", infra["export_bucket"].export_bucket.bucket)
+pulumi.export("cdc_export_arn", infra["cdc_export"].export_lambda.arn)
+pulumi.export("cdc_failure_queue_url", infra["cdc_export"].failure_queue.url)
+
 
 @atexit.register
 def cleanup() -> None:
@@ -0,0 +1,18 @@
+import pulumi
+import pulumi_aws as aws
+
+
+class ExportBucket(pulumi.ComponentResource):
+    def __init__(self, name, opts=None) -> None:
+        """Create a bucket for analytics exports of the table to go in"""
+        super().__init__("crm-app:analytics:bucket", name, {}, opts)
+
+        self.child_opts = pulumi.ResourceOptions(parent=self)
+
+        self.export_bucket = aws.s3.Bucket(
+            f"{name}-export-bucket", force_destroy=True, opts=self.child_opts
+        )
+
+        self.register_outputs(
+            {"bucket_id": self.export_bucket.id, "bucket_arn": self.export_bucket.arn}
+        )
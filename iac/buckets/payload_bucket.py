@@ -0,0 +1,31 @@
+import pulumi
+import pulumi_aws as aws
+
+# Outlives the longest a message can wait in the ingestion queue or its DLQ
+PAYLOAD_EXPIRY_DAYS = 15
+
+
+class PayloadBucket(pulumi.ComponentResource):
+    def __init__(self, name, opts=None) -> None:
+        """Create a bucket for webhook payloads too big to queue"""
+        super().__init__("crm-app:ingestion:bucket", name, {}, opts)
+
+        self.child_opts = pulumi.ResourceOptions(parent=self)
+
+        self.payload_bucket = aws.s3.Bucket(
+            f"{name}-payload-bucket",
+            force_destroy=True,
+            lifecycle_rules=[
+                aws.s3.BucketLifecycleRuleArgs(
+                    enabled=True,
+                    expiration=aws.s3.BucketLifecycleRuleExpirationArgs(
+                        days=PAYLOAD_EXPIRY_DAYS
+                    ),
+                )
+            ],
+            opts=self.child_opts,
+        )
+
+        self.register_outputs(
+            {"bucket_id": self.payload_bucket.id, "bucket_arn": self.payload_bucket.arn}
+        )
@@ -0,0 +1,133 @@
+from typing import List
+
+import pulumi
+import pulumi_aws as aws
+
+from iam.lambda_function import add_db_stream_consumer_policy
+from iam.lambda_function import add_s3_write_policy
+from iam.lambda_function import add_sqs_send_policy
+from iam.lambda_function import create_lambda_role
+from profiles import PROFILES
+from profiles import DEFAULT_PROFILE
+from utils import bundle_directory
+from utils import function_sizing
+
+
+class CdcExport(pulumi.ComponentResource):
+    """Copies every change to the table into time partitioned, gzipped NDJSON
+    in S3, so analytics reads files rather than scanning the table"""
+
+    def __init__(
+        self,
+        name,
+        opts=None,
+        code_bucket=None,
+        database=None,
+        export_bucket=None,
+        profile=None,
+    ) -> None:
+        super().__init__("crm-app:analytics:CdcExport", name, {}, opts)
+
+        requirements = [code_bucket, database, export_bucket]
+        for r in requirements:
+            if r is None:
+                raise ValueError(
+                    "Missing requirement: code bucket, database or export bucket"
+                )
+
+        self.junk: List[str] = []
+
+        self.code_bucket = code_bucket
+        self.db = database
+        self.export_bucket = export_bucket
+        self.profile = profile or PROFILES[DEFAULT_PROFILE]
+
+        self.child_opts = pulumi.ResourceOptions(parent=self)
+
+        # Roles handled by iam module
+        self.role = create_lambda_role(name, self.child_opts)
+        self._stream_policy = add_db_stream_consumer_policy(
+            name, self.role, self.db.stream_arn, opts=self.child_opts  # type: ignore
+        )
+        self._bucket_policy = add_s3_write_policy(
+            name, self.role, self.export_bucket.arn, opts=self.child_opts  # type: ignore
+        )
+
+        # Where batches that kept failing are recorded, by shard and sequence
+        # range, so they can be read back from the stream before it expires
+        self.failure_queue = aws.sqs.Queue(
+            f"{name}-failures-queue",
+            message_retention_seconds=14 * 24 * 60 * 60,
+            opts=self.child_opts,
+        )
+        self._failure_policy = add_sqs_send_policy(
+            name, self.role, self.failure_queue.arn, opts=self.child_opts
+        )
+
+        self.export_lambda = self._create_lambda(name)
+
+        self.register_outputs(
+            {
+                "export_bucket": self.export_bucket.bucket,
+                "failure_queue_url": self.failure_queue.url,
+            }
+        )
+
+    def _create_lambda(self, name) -> aws.lambda_.Function:
+        bundle_name = f"{name}_bundle"
+        bundle_file = f"{bundle_name}.zip"
+        source = "../services/cdc-export"
+        bundle_directory(source, bundle_name)
+
+        self.junk.append(bundle_file)
+
+        code_blob = aws.s3.BucketObject(
+            f"{name}-zip",
+            bucket=self.code_bucket.id,  # type: ignore
+            key=bundle_file,
+            source=pulumi.FileArchive(bundle_file),
+        )
+
+        stream_settings = self.profile.stream
+
+        l = aws.lambda_.Function(
+            f"{name}-function",
+            name=f"{name}-function",
+            role=self.role.arn,
+            runtime="python3.12",
+            handler="handler.handler",
+            s3_bucket=self.code_bucket.id,  # type: ignore
+            s3_key=code_blob.key,
+            opts=self.child_opts,
+            environment=aws.lambda_.FunctionEnvironmentArgs(
+                variables={
+                    "EXPORT_BUCKET": self.export_bucket.bucket,  # type: ignore
+                    "EXPORT_PREFIX": "cdc",
+                }
+            ),
+            **function_sizing(self.profile.cdc_export),
+        )
+
+        # Batch size and window decide how often files are rolled. Failures are
+        # reported per sequence number, which is where the shard resumes. A
+        # batch that keeps failing is split to isolate the bad record, and
+        # given up on after max_retry_attempts rather than blocking the shard
+        # until its records expire
+        aws.lambda_.EventSourceMapping(
+            f"{name}-stream-mapping",
+            event_source_arn=self.db.stream_arn,  # type: ignore
+            function_name=l.name,
+            starting_position="TRIM_HORIZON",
+            batch_size=stream_settings.batch_size,
+            maximum_batching_window_in_seconds=stream_settings.batching_window_seconds,
+            function_response_types=["ReportBatchItemFailures"],
+            maximum_retry_attempts=stream_settings.max_retry_attempts,
+            bisect_batch_on_function_error=True,
+            destination_config=aws.lambda_.EventSourceMappingDestinationConfigArgs(
+                on_failure=aws.lambda_.EventSourceMappingDestinationConfigOnFailureArgs(
+                    destination_arn=self.failure_queue.arn,
+                )
+            ),
+            opts=self.child_opts,
+        )
+        return l
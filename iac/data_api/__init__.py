@@ -6,12 +6,23 @@ import pulumi_aws as aws
 from iam.lambda_function import add_db_read_policy
 from iam.lambda_function import create_lambda_role
 from iam.lambda_function import grant_user_invoke_permission
+from profiles import PROFILES
+from profiles import DEFAULT_PROFILE
+from utils import add_provisioned_concurrency
 from utils import bundle_directory
+from utils import function_sizing
 
 
 class DataAPI(pulumi.ComponentResource):
     def __init__(
-        self, name, opts=None, code_bucket=None, database=None, invoke_users=None,
+        self,
+        name,
+        opts=None,
+        code_bucket=None,
+        database=None,
+        invoke_users=None,
+        profile=None,
+        hot_partition_keys=None,
     ) -> None:
         super().__init__("crm-app:egress:DataAPI", name, {}, opts)
 
@@ -29,6 +40,9 @@ class DataAPI(pulumi.ComponentResource):
 
         self.code_bucket = code_bucket
         self.db = database
+        self.profile = profile or PROFILES[DEFAULT_PROFILE]
+        # Must match the ingester's, so reads cover every shard it writes
+        self.hot_partition_keys = hot_partition_keys or ""
 
         self.child_opts = pulumi.ResourceOptions(parent=self)
 
@@ -39,12 +53,21 @@ class DataAPI(pulumi.ComponentResource):
         )
 
         self.data_api_lambda = self._create_lambda(name)
+        self.alias = add_provisioned_concurrency(
+            name, self.data_api_lambda, self.profile.data_api, self.child_opts
+        )
         self.url = self._create_url(name)
 
         # Allow users to invoke
         self.invoke_permissions = []
         for user in invoke_users:
-            p = grant_user_invoke_permission(name, self.data_api_lambda, user, opts=self.child_opts)
+            p = grant_user_invoke_permission(
+                name,
+                self.data_api_lambda,
+                user,
+                opts=self.child_opts,
+                qualifier=self.alias.name if self.alias else None,
+            )
             self.invoke_permissions.append(p)
 
         self.register_outputs({"data_api_url": self.url})
@@ -74,13 +97,14 @@ class DataAPI(pulumi.ComponentResource):
             handler="handler.handler",
             s3_bucket=self.code_bucket.id,  # type: ignore
             s3_key=code_blob.key,
-            timeout=60,
             opts=self.child_opts,
             environment=aws.lambda_.FunctionEnvironmentArgs(
                 variables={
-                    "TABLE_NAME": self.db.name
+                    "TABLE_NAME": self.db.name,
+                    "HOT_PARTITION_KEYS": self.hot_partition_keys,
                 }
-            )
+            ),
+            **function_sizing(self.profile.data_api),
         )
 
         return l
@@ -88,6 +112,7 @@ class DataAPI(pulumi.ComponentResource):
     def _create_url(self, name) -> aws.lambda_.FunctionUrl:
         egress_url = aws.lambda_.FunctionUrl(f"{name}-url",
             function_name=self.data_api_lambda.name,
+            qualifier=self.alias.name if self.alias else None,
             authorization_type="AWS_IAM",
         )
         return egress_url
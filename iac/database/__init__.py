@@ -18,10 +18,55 @@ class Database(pulumi.ComponentResource):
             attributes=[
                 aws.dynamodb.TableAttributeArgs(name="PK", type="S"),
                 aws.dynamodb.TableAttributeArgs(name="SK", type="S"),
+                aws.dynamodb.TableAttributeArgs(name="lead_id", type="S"),
+                aws.dynamodb.TableAttributeArgs(name="transaction_id", type="S"),
+                aws.dynamodb.TableAttributeArgs(name="customer_id", type="S"),
+                aws.dynamodb.TableAttributeArgs(name="status_shard", type="S"),
             ],
             hash_key="PK",
             range_key="SK",
             billing_mode="PAY_PER_REQUEST",
+            global_secondary_indexes=self._lookup_indexes(),
+            # Feeds the CDC export, keys are always included so removals show up too
+            stream_enabled=True,
+            stream_view_type="NEW_IMAGE",
             opts=self.child_opts,
         )
         return crm_table
+
+    def _lookup_indexes(self) -> list:
+        """Lookups by non-email identifiers. Each attribute only exists on one
+        item type, so the indexes are sparse and only project what support
+        tooling needs"""
+        return [
+            # Leads
+            aws.dynamodb.TableGlobalSecondaryIndexArgs(
+                name="lead_id-index",
+                hash_key="lead_id",
+                projection_type="INCLUDE",
+                non_key_attributes=["email", "status"],
+            ),
+            # Keyed on "{status}#{n}" (common.sharding.status_key), a handful of
+            # statuses alone would put every lead write on a few partitions
+            aws.dynamodb.TableGlobalSecondaryIndexArgs(
+                name="status-index",
+                hash_key="status_shard",
+                range_key="SK",
+                projection_type="INCLUDE",
+                non_key_attributes=["email", "lead_id", "status"],
+            ),
+            # Bills
+            aws.dynamodb.TableGlobalSecondaryIndexArgs(
+                name="transaction_id-index",
+                hash_key="transaction_id",
+                projection_type="INCLUDE",
+                non_key_attributes=["customer_id", "amount", "currency"],
+            ),
+            aws.dynamodb.TableGlobalSecondaryIndexArgs(
+                name="customer_id-index",
+                hash_key="customer_id",
+                range_key="SK",
+                projection_type="INCLUDE",
+                non_key_attributes=["transaction_id", "amount", "currency"],
+            ),
+        ]
@@ -69,7 +69,7 @@ def add_sqs_consumer_policy(name, role, queue_arn, opts) -> aws.iam.RolePolicy:
 
 
 def add_db_read_policy(name, role, db_arn, opts) -> aws.iam.RolePolicy:
-    """Grants read-only access: Get, Query, and Scan."""
+    """Grants read-only access: Get, Query, and Scan, on the table and its indexes."""
     policy_doc = aws.iam.get_policy_document(
         statements=[
             {
@@ -81,7 +81,11 @@ def add_db_read_policy(name, role, db_arn, opts) -> aws.iam.RolePolicy:
                     "dynamodb:DescribeTable",
                 ],
                 "resources": [db_arn],
-            }
+            },
+            {
+                "actions": ["dynamodb:Query"],
+                "resources": [db_arn.apply(lambda arn: f"{arn}/index/*")],
+            },
         ]
     )
 
@@ -113,6 +117,59 @@ def add_db_write_policy(name, role, db_arn, opts) -> aws.iam.RolePolicy:
     )
 
 
+def add_db_stream_consumer_policy(name, role, stream_arn, opts) -> aws.iam.RolePolicy:
+    """Grants reading the table's change stream."""
+    policy_doc = aws.iam.get_policy_document(
+        statements=[
+            {
+                "actions": [
+                    "dynamodb:DescribeStream",
+                    "dynamodb:GetRecords",
+                    "dynamodb:GetShardIterator",
+                    "dynamodb:ListStreams",
+                ],
+                "resources": [stream_arn],
+            }
+        ]
+    )
+
+    return aws.iam.RolePolicy(
+        f"{name}-db-stream-policy", role=role.id, policy=policy_doc.json, opts=opts
+    )
+
+
+def add_s3_write_policy(name, role, bucket_arn, opts) -> aws.iam.RolePolicy:
+    """Grants writing objects into a bucket."""
+    policy_doc = aws.iam.get_policy_document(
+        statements=[
+            {
+                "actions": ["s3:PutObject"],
+                "resources": [bucket_arn.apply(lambda arn: f"{arn}/*")],
+            }
+        ]
+    )
+
+    return aws.iam.RolePolicy(
+        f"{name}-s3-write-policy", role=role.id, policy=policy_doc.json, opts=opts
+    )
+
+
+def add_s3_read_policy(name, role, bucket_arn, opts) -> aws.iam.RolePolicy:
+    """Grants reading objects from a bucket."""
+    policy_doc = aws.iam.get_policy_document(
+        statements=[
+            {
+                "actions": ["s3:GetObject"],
+                "resources": [bucket_arn.apply(lambda arn: f"{arn}/*")],
+            }
+        ]
+    )
+
+    return aws.iam.RolePolicy(
+        f"{name}-s3-read-policy", role=role.id, policy=policy_doc.json, opts=opts
+    )
+
+
 def add_secrets_access_policy(
     name,
     role,
@@ -134,11 +191,12 @@ def add_secrets_access_policy(
         f"{name}-secrets-read-policy", role=role.id, policy=policy_doc.json, opts=opts
     )
 
-def grant_user_invoke_permission(name, lambda_function, user, opts):
+def grant_user_invoke_permission(name, lambda_function, user, opts, qualifier=None):
     return aws.lambda_.Permission(
         f"{name}-{user.literal_name}-allow-iam-url-invoke",
         action="lambda:InvokeFunctionUrl",
         function=lambda_function.name,
+        qualifier=qualifier,
         principal=user.user.arn,
         function_url_auth_type="AWS_IAM",
         opts=opts
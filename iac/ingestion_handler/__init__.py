@@ -5,31 +5,53 @@ from typing import List
 import pulumi
 import pulumi_aws as aws
 
+from common.registry import WEBHOOK_TYPES
 from iam.lambda_function import add_db_write_policy
+from iam.lambda_function import add_s3_read_policy
+from iam.lambda_function import add_s3_write_policy
 from iam.lambda_function import add_secrets_access_policy
 from iam.lambda_function import add_sqs_consumer_policy
+from iam.lambda_function import add_sqs_send_policy
 from iam.lambda_function import create_lambda_role
+from profiles import PROFILES
+from profiles import DEFAULT_PROFILE
+from utils import add_provisioned_concurrency
 from utils import bundle_directory
+from utils import function_sizing
 
 
 class IngestionHandler(pulumi.ComponentResource):
     def __init__(
-        self, name, opts=None, code_bucket=None, ingestion_queue=None, database=None
+        self,
+        name,
+        opts=None,
+        code_bucket=None,
+        ingestion_queue=None,
+        quarantine_queue=None,
+        database=None,
+        payload_bucket=None,
+        profile=None,
+        hot_partition_keys=None,
     ) -> None:
         super().__init__("crm-app:ingestion:IngestionHandler", name, {}, opts)
 
-        requirements = [code_bucket, ingestion_queue, database]
+        requirements = [code_bucket, ingestion_queue, quarantine_queue, database]
         for r in requirements:
             if r is None:
                 raise ValueError(
-                    "Missing requirement: code bucket, ingestion queue or database"
+                    "Missing requirement: code bucket, ingestion queue, quarantine queue or database"
                 )
 
         self.junk: List[str] = []
 
         self.code_bucket = code_bucket
         self.queue = ingestion_queue
+        self.quarantine_queue = quarantine_queue
         self.db = database
+        self.payload_bucket = payload_bucket
+        self.profile = profile or PROFILES[DEFAULT_PROFILE]
+        # Partition keys whose writes are sharded, see common/sharding.py
+        self.hot_partition_keys = hot_partition_keys or ""
 
         self.child_opts = pulumi.ResourceOptions(parent=self)
 
@@ -40,17 +62,43 @@ class IngestionHandler(pulumi.ComponentResource):
         self._consumer_policy = add_sqs_consumer_policy(
             name, self.role, self.queue.arn, self.child_opts  # type: ignore
         )
+        self._quarantine_policy = add_sqs_send_policy(
+            name, self.role, self.quarantine_queue.arn, self.child_opts  # type: ignore
+        )
         self._database_policy = add_db_write_policy(
             name, self.role, self.db.arn, opts=self.child_opts  # type: ignore
         )
         self._secrets_policy = add_secrets_access_policy(
             name, self.role, self.webhook_secrets_container.arn, opts=self.child_opts  # type: ignore
         )
+        if self.payload_bucket is not None:
+            # Claim checked payloads the webhook parked there, and quarantine
+            # messages too big for the queue
+            self._payload_policy = add_s3_read_policy(
+                name, self.role, self.payload_bucket.arn, opts=self.child_opts
+            )
+            self._payload_write_policy = add_s3_write_policy(
+                name, self.role, self.payload_bucket.arn, opts=self.child_opts
+            )
 
         self.ingestion_lambda = self._create_lambda(name)
 
         self.register_outputs({"secrets_arn": self.webhook_secrets_container.arn})
 
+    def _environment(self, queue_settings) -> dict:
+        variables = {
+            "DATABASE_NAME": self.db.name,  # type: ignore
+            "SECRET_ID": self.webhook_secrets_container.id,
+            "INGEST_CONCURRENCY": str(queue_settings.write_concurrency),
+            "INGEST_WRITE_RATE": str(queue_settings.write_rate),
+            "QUARANTINE_QUEUE_URL": self.quarantine_queue.id,  # type: ignore
+            "HOT_PARTITION_KEYS": self.hot_partition_keys,
+        }
+        if self.payload_bucket is not None:
+            # Without it a quarantine message too big for the queue is retried
+            variables["PAYLOAD_BUCKET"] = self.payload_bucket.bucket
+        return variables
+
     def _create_lambda(self, name) -> aws.lambda_.Function:
         """Dumb, package and upload to bucket
         Better using Docker but no ECR with LocalStack"""
@@ -68,6 +116,8 @@ class IngestionHandler(pulumi.ComponentResource):
             source=pulumi.FileArchive(bundle_file),
         )
 
+        queue_settings = self.profile.queue
+
         l = aws.lambda_.Function(
             f"{name}-function",
             name=f"{name}-function",
@@ -76,22 +126,30 @@ class IngestionHandler(pulumi.ComponentResource):
             handler="handler.handler",
             s3_bucket=self.code_bucket.id,  # type: ignore
             s3_key=code_blob.key,
-            timeout=60,
             opts=self.child_opts,
             environment=aws.lambda_.FunctionEnvironmentArgs(
-                variables={
-                    "DATABASE_NAME": self.db.name,  # type: ignore
-                    "SECRET_ID": self.webhook_secrets_container.id,
-                }
+                variables=self._environment(queue_settings)
             ),
+            **function_sizing(self.profile.ingestion),
+        )
+        alias = add_provisioned_concurrency(
+            name, l, self.profile.ingestion, self.child_opts
         )
 
+        scaling_config = None
+        if queue_settings.max_concurrency is not None:
+            scaling_config = aws.lambda_.EventSourceMappingScalingConfigArgs(
+                maximum_concurrency=queue_settings.max_concurrency
+            )
+
         # Set up queue as a source
         aws.lambda_.EventSourceMapping(
             f"{name}-sqs-mapping",
             event_source_arn=self.queue.arn,  # type: ignore
-            function_name=l.name,
-            batch_size=5,
+            function_name=alias.arn if alias else l.name,
+            batch_size=queue_settings.batch_size,
+            maximum_batching_window_in_seconds=queue_settings.batching_window_seconds,
+            scaling_config=scaling_config,
             function_response_types=["ReportBatchItemFailures"],
             opts=self.child_opts,
         )
@@ -99,11 +157,8 @@ class IngestionHandler(pulumi.ComponentResource):
 
     def _setup_secrets(self):
         """Setup secrets manager for 'poor man's API keys'"""
-        required_vars = [
-            "WEBHOOK_SECRET_INGEST",
-            "WEBHOOK_SECRET_BILLING",
-            "WEBHOOK_SECRET_SIGNUP",
-        ]
+        # One secret per registered webhook type
+        required_vars = [t.secret_env for t in WEBHOOK_TYPES.values()]
         missing = [v for v in required_vars if not os.getenv(v)]
 
         if missing:
@@ -122,11 +177,7 @@ class IngestionHandler(pulumi.ComponentResource):
             "crm-webhook-secrets-v1",
             secret_id=webhook_secrets_container.id,
             secret_string=json.dumps(
-                {
-                    "lead_ingest": os.getenv("WEBHOOK_SECRET_INGEST"),
-                    "billing_update": os.getenv("WEBHOOK_SECRET_BILLING"),
-                    "user_signup": os.getenv("WEBHOOK_SECRET_SIGNUP"),
-                }
+                {t.webhook_id: os.getenv(t.secret_env) for t in WEBHOOK_TYPES.values()}
             ),
             opts=self.child_opts,
         )
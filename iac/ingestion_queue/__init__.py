@@ -1,12 +1,26 @@
+import json
+
 import pulumi
 import pulumi_aws as aws
 
+from profiles import PROFILES
+from profiles import DEFAULT_PROFILE
+
+# Longest SQS will keep a message, for anything waiting on a human
+MAX_RETENTION_SECONDS = 14 * 24 * 60 * 60
+
 
 class IngestionQueue(pulumi.ComponentResource):
-    def __init__(self, name, opts=None) -> None:
+    def __init__(self, name, opts=None, profile=None) -> None:
         super().__init__("crm-app:ingestion:IngestionQueue", name, {}, opts)
 
         self.child_opts = pulumi.ResourceOptions(parent=self)
+        self.profile = profile or PROFILES[DEFAULT_PROFILE]
+
+        # Messages that kept failing, replayed with tools/redrive.py
+        self.dead_letter_queue = self._create_holding_queue(f"{name}-dlq")
+        # Messages the ingester knows can never succeed, with their error
+        self.quarantine_queue = self._create_holding_queue(f"{name}-quarantine")
 
         self.queue = self._create_queue(name)
 
@@ -17,12 +31,31 @@ class IngestionQueue(pulumi.ComponentResource):
             {
                 "queue_arn": self.arn,
                 "queue_url": self.url,
+                "dead_letter_queue_url": self.dead_letter_queue.id,
+                "quarantine_queue_url": self.quarantine_queue.id,
             }
         )
 
     def _create_queue(self, name) -> aws.sqs.Queue:
         """Set up SQS"""
         q = aws.sqs.Queue(
-            f"{name}-queue", visibility_timeout_seconds=300, opts=self.child_opts
+            f"{name}-queue",
+            visibility_timeout_seconds=300,
+            redrive_policy=self.dead_letter_queue.arn.apply(
+                lambda arn: json.dumps(
+                    {
+                        "deadLetterTargetArn": arn,
+                        "maxReceiveCount": self.profile.queue.max_receive_count,
+                    }
+                )
+            ),
+            opts=self.child_opts,
         )
         return q
+
+    def _create_holding_queue(self, name) -> aws.sqs.Queue:
+        return aws.sqs.Queue(
+            f"{name}-queue",
+            message_retention_seconds=MAX_RETENTION_SECONDS,
+            opts=self.child_opts,
+        )
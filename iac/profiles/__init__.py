@@ -0,0 +1,113 @@
+"""Named throughput profiles, selected with the ``throughputProfile`` stack config.
+
+Kept free of Pulumi imports so local tooling can read the same numbers.
+
+    pulumilocal config set throughputProfile burst
+"""
+from dataclasses import dataclass
+from dataclasses import field
+
+
+@dataclass(frozen=True)
+class FunctionSettings:
+    memory_mb: int = 128
+    timeout: int = 30
+    # -1 leaves the function on the unreserved account pool
+    reserved_concurrency: int = -1
+    # Above 0 publishes a version and keeps this many environments warm
+    provisioned_concurrency: int = 0
+
+
+@dataclass(frozen=True)
+class QueueSettings:
+    batch_size: int = 5
+    # Anything above 10 records per batch needs a window of at least 1 second
+    batching_window_seconds: int = 0
+    # Cap on concurrent ingestion invocations the queue can drive, None for no cap
+    max_concurrency: int | None = None
+    # Partition lanes each invocation writes in parallel (INGEST_CONCURRENCY)
+    write_concurrency: int = 1
+    # Items a second each invocation starts writing at, before it adapts
+    write_rate: int = 1000
+    # Deliveries before a message is moved to the dead letter queue
+    max_receive_count: int = 5
+
+
+@dataclass(frozen=True)
+class StreamSettings:
+    # Records per CDC export invocation, so roughly per file
+    batch_size: int = 1000
+    # How long changes are gathered before a file is written, up to 300.
+    # With batch_size this is what sizes files, an invocation carries 6 MB at most
+    batching_window_seconds: int = 60
+    # Retries of a failing batch, halved each time, before its sequence range
+    # goes to the failure queue and the shard moves on
+    max_retry_attempts: int = 5
+
+
+@dataclass(frozen=True)
+class ThroughputProfile:
+    name: str
+    webhook: FunctionSettings = field(default_factory=FunctionSettings)
+    ingestion: FunctionSettings = field(default_factory=FunctionSettings)
+    data_api: FunctionSettings = field(default_factory=FunctionSettings)
+    cdc_export: FunctionSettings = field(default_factory=FunctionSettings)
+    queue: QueueSettings = field(default_factory=QueueSettings)
+    stream: StreamSettings = field(default_factory=StreamSettings)
+
+
+PROFILES = {
+    # Matches what was deployed before profiles existed
+    "dev": ThroughputProfile(
+        name="dev",
+        webhook=FunctionSettings(timeout=30),
+        ingestion=FunctionSettings(timeout=60),
+        data_api=FunctionSettings(timeout=60),
+        cdc_export=FunctionSettings(timeout=60),
+        queue=QueueSettings(batch_size=5),
+        stream=StreamSettings(batch_size=100, batching_window_seconds=10),
+    ),
+    # Short, spiky vendor imports: wide fan out, big batches, warm webhooks
+    "burst": ThroughputProfile(
+        name="burst",
+        webhook=FunctionSettings(memory_mb=512, timeout=10, provisioned_concurrency=5),
+        ingestion=FunctionSettings(memory_mb=1024, timeout=45),
+        data_api=FunctionSettings(memory_mb=256, timeout=30),
+        cdc_export=FunctionSettings(memory_mb=1024, timeout=120),
+        queue=QueueSettings(
+            batch_size=100,
+            batching_window_seconds=1,
+            max_concurrency=50,
+            write_concurrency=8,
+            write_rate=4000,
+        ),
+    ),
+    # Constant background load: bounded concurrency so DynamoDB isn't swamped
+    "steady": ThroughputProfile(
+        name="steady",
+        webhook=FunctionSettings(memory_mb=256, timeout=10, reserved_concurrency=20),
+        ingestion=FunctionSettings(memory_mb=512, timeout=45, reserved_concurrency=10),
+        data_api=FunctionSettings(memory_mb=256, timeout=30, reserved_concurrency=10),
+        cdc_export=FunctionSettings(memory_mb=512, timeout=120),
+        queue=QueueSettings(
+            batch_size=25,
+            batching_window_seconds=5,
+            max_concurrency=10,
+            write_concurrency=4,
+        ),
+        stream=StreamSettings(batching_window_seconds=300),
+    ),
+}
+
+DEFAULT_PROFILE = "dev"
+
+
+def get_profile(config) -> ThroughputProfile:
+    """Look up the profile named by a pulumi.Config's ``throughputProfile``"""
+    name = config.get("throughputProfile") or DEFAULT_PROFILE
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown throughput profile '{name}', choose from: {', '.join(PROFILES)}"
+        )
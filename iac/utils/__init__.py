@@ -4,6 +4,8 @@ import subprocess
 import sys
 import tempfile
 
+import pulumi_aws as aws
+
 
 def bundle_directory(source: str, bundle_name: str, common: str = "../common") -> None:
     """Bundles source directory into a zip of bundle name
@@ -46,3 +48,37 @@ def bundle_directory(source: str, bundle_name: str, common: str = "../common") -
             raise Exception(f"No requirements.txt found in {source}")
 
         shutil.make_archive(bundle_name, "zip", build)
+
+
+def function_sizing(settings) -> dict:
+    """Lambda Function arguments for a profile's FunctionSettings"""
+    return {
+        "memory_size": settings.memory_mb,
+        "timeout": settings.timeout,
+        "reserved_concurrent_executions": settings.reserved_concurrency,
+        # Provisioned concurrency needs a published version to attach to
+        "publish": settings.provisioned_concurrency > 0,
+    }
+
+
+def add_provisioned_concurrency(name, function, settings, opts):
+    """Keep a 'live' alias of the latest version warm.
+    Returns the alias, or None if the profile doesn't provision any"""
+    if settings.provisioned_concurrency <= 0:
+        return None
+
+    alias = aws.lambda_.Alias(
+        f"{name}-live",
+        name="live",
+        function_name=function.name,
+        function_version=function.version,
+        opts=opts,
+    )
+    aws.lambda_.ProvisionedConcurrencyConfig(
+        f"{name}-provisioned",
+        function_name=function.name,
+        qualifier=alias.name,
+        provisioned_concurrent_executions=settings.provisioned_concurrency,
+        opts=opts,
+    )
+    return alias
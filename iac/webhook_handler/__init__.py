@@ -3,13 +3,28 @@ from typing import List
 import pulumi
 import pulumi_aws as aws
 
+from iam.lambda_function import add_s3_write_policy
+from iam.lambda_function import add_secrets_access_policy
 from iam.lambda_function import add_sqs_send_policy
 from iam.lambda_function import create_lambda_role
+from profiles import PROFILES
+from profiles import DEFAULT_PROFILE
+from utils import add_provisioned_concurrency
 from utils import bundle_directory
+from utils import function_sizing
 
 
 class WebhookHandler(pulumi.ComponentResource):
-    def __init__(self, name, opts=None, code_bucket=None, ingestion_queue=None) -> None:
+    def __init__(
+        self,
+        name,
+        opts=None,
+        code_bucket=None,
+        ingestion_queue=None,
+        secrets=None,
+        payload_bucket=None,
+        profile=None,
+    ) -> None:
         super().__init__("crm-app:ingestion:WebhookHandler", name, {}, opts)
 
         if code_bucket is None or ingestion_queue is None:
@@ -21,6 +36,9 @@ class WebhookHandler(pulumi.ComponentResource):
 
         self.code_bucket = code_bucket
         self.queue = ingestion_queue
+        self.secrets = secrets
+        self.payload_bucket = payload_bucket
+        self.profile = profile or PROFILES[DEFAULT_PROFILE]
 
         self.child_opts = pulumi.ResourceOptions(parent=self)
 
@@ -29,8 +47,19 @@ class WebhookHandler(pulumi.ComponentResource):
         self.policy = add_sqs_send_policy(
             name, self.role, self.queue.arn, self.child_opts
         )
+        if self.secrets is not None:
+            self._secrets_policy = add_secrets_access_policy(
+                name, self.role, self.secrets.arn, opts=self.child_opts
+            )
+        if self.payload_bucket is not None:
+            self._payload_policy = add_s3_write_policy(
+                name, self.role, self.payload_bucket.arn, opts=self.child_opts
+            )
 
         self.webhook_lambda = self._create_lambda(name)
+        self.alias = add_provisioned_concurrency(
+            name, self.webhook_lambda, self.profile.webhook, self.child_opts
+        )
         self.lambda_url = self._create_lambda_url(name)
 
         self.register_outputs({"url": self.lambda_url.function_url})
@@ -60,15 +89,26 @@ class WebhookHandler(pulumi.ComponentResource):
             handler="handler.handler",
             s3_bucket=self.code_bucket.id,
             s3_key=code_blob.key,
-            timeout=30,
             opts=self.child_opts,
-            environment={"variables": {"QUEUE_URL": self.queue.id}},
+            environment={"variables": self._environment()},
+            **function_sizing(self.profile.webhook),
         )
 
+    def _environment(self) -> dict:
+        variables = {"QUEUE_URL": self.queue.id}
+        if self.secrets is not None:
+            # Without it the handler falls back to the built in secrets
+            variables["SECRETS_ARN"] = self.secrets.arn
+        if self.payload_bucket is not None:
+            # Without it oversized payloads are rejected by SQS
+            variables["PAYLOAD_BUCKET"] = self.payload_bucket.bucket
+        return variables
+
     def _create_lambda_url(self, name) -> aws.lambda_.FunctionUrl:
         url = aws.lambda_.FunctionUrl(
             name,
             function_name=self.webhook_lambda.name,
+            qualifier=self.alias.name if self.alias else None,
             authorization_type="NONE",
             opts=self.child_opts,
         )
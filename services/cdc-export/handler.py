@@ -0,0 +1,143 @@
+import base64
+import datetime
+import gzip
+import json
+import logging
+import os
+from dataclasses import dataclass
+from dataclasses import field
+from decimal import Decimal
+from typing import List
+
+import boto3
+from boto3.dynamodb.types import Binary
+from boto3.dynamodb.types import TypeDeserializer
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+EXPORT_BUCKET = os.environ.get("EXPORT_BUCKET", "cdc-export")
+EXPORT_PREFIX = os.environ.get("EXPORT_PREFIX", "cdc").strip("/")
+
+deserializer = TypeDeserializer()
+
+S3 = None
+
+
+def get_s3():
+    """Lazy load the S3 client"""
+    global S3
+    if S3 is None:
+        S3 = boto3.client("s3")
+
+    return S3
+
+
+@dataclass
+class ExportFile:
+    """A run of consecutive stream records bound for one S3 object"""
+
+    partition: str
+    lines: List[bytes] = field(default_factory=list)
+    first_sequence: str = ""
+    last_sequence: str = ""
+
+    @property
+    def key(self) -> str:
+        # Named after the records it holds, so a retried batch overwrites
+        # rather than duplicates
+        return (
+            f"{EXPORT_PREFIX}/{self.partition}/"
+            f"{self.first_sequence}-{self.last_sequence}.ndjson.gz"
+        )
+
+    def add(self, sequence_number: str, line: bytes) -> None:
+        if not self.lines:
+            self.first_sequence = sequence_number
+        self.last_sequence = sequence_number
+        self.lines.append(line)
+
+    def body(self) -> bytes:
+        return gzip.compress(b"".join(self.lines))
+
+
+def _json_default(value):
+    # Everything the deserializer produces that json doesn't know about
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=str)
+    if isinstance(value, Binary):
+        return base64.b64encode(value.value).decode("ascii")
+    raise TypeError(f"Cannot serialise {type(value).__name__}")
+
+
+def _deserialize(image: dict | None) -> dict | None:
+    if image is None:
+        return None
+    return deserializer.deserialize({"M": image})
+
+
+def event_time(record: dict) -> datetime.datetime:
+    seconds = record["dynamodb"].get("ApproximateCreationDateTime", 0)
+    return datetime.datetime.fromtimestamp(float(seconds), tz=datetime.timezone.utc)
+
+
+def to_row(record: dict) -> dict:
+    """Flatten a stream record into the exported shape.
+
+    ``item`` is the new image, or None when the item was removed.
+    """
+    change = record["dynamodb"]
+    return {
+        "op": record["eventName"],
+        "sequence_number": change["SequenceNumber"],
+        "event_time": event_time(record).isoformat(),
+        "keys": _deserialize(change["Keys"]),
+        "item": _deserialize(change.get("NewImage")),
+    }
+
+
+def plan_files(records: List[dict]) -> List[ExportFile]:
+    """Group records into files in stream order.
+
+    A file only ever holds consecutive records, and is rolled when the hour
+    changes, so every file maps to a contiguous run of sequence numbers.
+    There is no size limit: an invocation carries at most 6 MB, so the
+    stream batch size and window are what decide how big files get.
+    """
+    files: List[ExportFile] = []
+    current = None
+    for record in records:
+        partition = event_time(record).strftime("dt=%Y-%m-%d/hour=%H")
+        line = json.dumps(to_row(record), default=_json_default).encode("utf-8") + b"\n"
+
+        if current is None or current.partition != partition:
+            current = ExportFile(partition)
+            files.append(current)
+
+        current.add(record["dynamodb"]["SequenceNumber"], line)
+
+    return files
+
+
+def handler(event, context):
+    files = plan_files(event["Records"])
+
+    for export in files:
+        try:
+            get_s3().put_object(
+                Bucket=EXPORT_BUCKET,
+                Key=export.key,
+                Body=export.body(),
+                ContentType="application/x-ndjson",
+            )
+        except Exception as e:
+            logger.error(f"Failed to write {export.key}: {e}")
+            # The shard is checkpointed just before this file and resumes here,
+            # everything already written is behind the checkpoint
+            return {"batchItemFailures": [{"itemIdentifier": export.first_sequence}]}
+
+        logger.info(f"Exported {len(export.lines)} changes to {export.key}")
+
+    return {"batchItemFailures": []}
@@ -0,0 +1,125 @@
+import gzip
+import importlib.util
+import json
+import os
+from decimal import Decimal
+
+from boto3.dynamodb.types import TypeSerializer
+
+HANDLER_PATH = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "handler.py")
+)
+
+serializer = TypeSerializer()
+
+# 2026-03-01T10:59:59Z
+BASE_TIME = 1772362799
+
+
+class FakeS3:
+    def __init__(self, fail_on=None):
+        self.objects = {}
+        self.fail_on = fail_on
+
+    def put_object(self, Bucket, Key, Body, ContentType):
+        if self.fail_on is not None and len(self.objects) == self.fail_on:
+            raise RuntimeError("SlowDown")
+        self.objects[Key] = Body
+
+
+def _import_handler(fail_on=None):
+    """Import the exporter by path with an in-memory bucket."""
+    spec = importlib.util.spec_from_file_location("cdc_export_handler", HANDLER_PATH)
+    handler = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(handler)
+
+    s3 = FakeS3(fail_on)
+    handler.S3 = s3
+    return handler, s3
+
+
+def _record(sequence, event_name="INSERT", offset=0, **attributes):
+    """A stream record as Lambda delivers it, for a lead item"""
+    keys = {"PK": "USER#a@example.com", "SK": f"LEAD#{sequence}"}
+    change = {
+        "ApproximateCreationDateTime": BASE_TIME + offset,
+        "Keys": {k: serializer.serialize(v) for k, v in keys.items()},
+        "SequenceNumber": f"{sequence:021d}",
+        "SizeBytes": 100,
+        "StreamViewType": "NEW_IMAGE",
+    }
+    if event_name != "REMOVE":
+        item = {**keys, "score": Decimal("1.5"), "tags": {"a", "b"}, **attributes}
+        change["NewImage"] = {k: serializer.serialize(v) for k, v in item.items()}
+
+    return {
+        "eventID": str(sequence),
+        "eventName": event_name,
+        "eventSource": "aws:dynamodb",
+        "dynamodb": change,
+    }
+
+
+def _rows(body):
+    return [json.loads(line) for line in gzip.decompress(body).splitlines()]
+
+
+def test_changes_written_as_hourly_ndjson():
+    handler, s3 = _import_handler()
+
+    records = [
+        _record(1),
+        _record(2, "MODIFY", status="won"),
+        # Next hour
+        _record(3, "REMOVE", offset=1),
+    ]
+    assert handler.handler({"Records": records}, None) == {"batchItemFailures": []}
+
+    assert sorted(s3.objects) == [
+        "cdc/dt=2026-03-01/hour=10/000000000000000000001-000000000000000000002.ndjson.gz",
+        "cdc/dt=2026-03-01/hour=11/000000000000000000003-000000000000000000003.ndjson.gz",
+    ]
+
+    first, second = (_rows(s3.objects[key]) for key in sorted(s3.objects))
+    assert first[0]["op"] == "INSERT"
+    assert first[0]["item"]["score"] == 1.5
+    assert first[0]["item"]["tags"] == ["a", "b"]
+    assert first[1]["item"]["status"] == "won"
+    assert second == [
+        {
+            "op": "REMOVE",
+            "sequence_number": "000000000000000000003",
+            "event_time": "2026-03-01T11:00:00+00:00",
+            "keys": {"PK": "USER#a@example.com", "SK": "LEAD#3"},
+            "item": None,
+        }
+    ]
+
+
+def test_one_file_per_hour_of_a_batch():
+    handler, _s3 = _import_handler()
+
+    # However big the batch, it is only split where the hour changes
+    files = handler.plan_files([_record(i, tag="x" * 10_000) for i in range(10)])
+    assert len(files) == 1
+
+    files = handler.plan_files([_record(i, offset=i) for i in range(10)])
+    assert len(files) == 2
+    # Every record lands exactly once, in order
+    sequences = [row["sequence_number"] for f in files for row in _rows(f.body())]
+    assert sequences == [f"{i:021d}" for i in range(10)]
+
+
+def test_checkpoint_at_first_failed_file():
+    handler, s3 = _import_handler(fail_on=1)
+
+    records = [_record(1), _record(2, offset=1), _record(3, offset=3601)]
+    assert handler.handler({"Records": records}, None) == {
+        "batchItemFailures": [{"itemIdentifier": "000000000000000000002"}]
+    }
+    assert len(s3.objects) == 1
+
+    # Lambda redelivers from the checkpoint, the finished file isn't rewritten
+    s3.fail_on = None
+    assert handler.handler({"Records": records[1:]}, None) == {"batchItemFailures": []}
+    assert len(s3.objects) == 3
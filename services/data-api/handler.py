@@ -1,18 +1,147 @@
+import base64
+import binascii
+import json
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from decimal import Decimal
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Literal
+
 import boto3
+import botocore.exceptions
 
 from fastapi import FastAPI
+from fastapi import Header
 from fastapi import HTTPException
 from fastapi import Query
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from mangum import Mangum
 from pydantic import BaseModel
+from pydantic import Field
+from pydantic import field_serializer
 from boto3.dynamodb.conditions import Key
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.middleware.gzip import IdentityResponder
+
+try:
+    import brotli
+except ImportError:  # In requirements.txt, without it only gzip is offered
+    brotli = None
 
+from common.cache import LRUCache
 from common.models import LeadStorage
+from common.sharding import merge_by_sk
+from common.sharding import read_keys
+from common.sharding import shard_count
+from common.sharding import status_keys
+from common.sharding import unshard
+from common.utils import get_stable_hash
 
 TABLE_NAME = os.environ.get("TABLE_NAME", "data-table")
 
+# Sparse GSIs declared by the Database component, by hash key attribute
+INDEX_KEYS = {
+    "lead_id-index": "lead_id",
+    "transaction_id-index": "transaction_id",
+    "customer_id-index": "customer_id",
+    "status-index": "status_shard",
+}
+
+# Whole partitions are cached for the life of a warm container
+partition_cache = LRUCache(
+    max_size=int(os.environ.get("LEADS_CACHE_SIZE", "256")),
+    ttl_seconds=float(os.environ.get("LEADS_CACHE_TTL_SECONDS", "5")),
+)
+
+# Multi-key lookups: how many keys per call, and how many queries in flight
+BATCH_GET_MAX_KEYS = int(os.environ.get("BATCH_GET_MAX_KEYS", "500"))
+BATCH_GET_CONCURRENCY = int(os.environ.get("BATCH_GET_CONCURRENCY", "16"))
+BATCH_GET_TIMEOUT_SECONDS = float(os.environ.get("BATCH_GET_TIMEOUT_SECONDS", "20"))
+
+# Hot partitions are read from all their shards at once (see common.sharding),
+# on a pool of their own so a batchGet full of them can't starve itself
+SHARD_READ_CONCURRENCY = int(os.environ.get("SHARD_READ_CONCURRENCY", "16"))
+# Items read from each shard per page when paging through a hot partition
+SHARD_PAGE_SIZE = int(os.environ.get("SHARD_PAGE_SIZE", "500"))
+
+# Responses smaller than this are sent uncompressed
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Attribute names accepted by ?fields=
+FIELD_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+MAX_FIELDS = 32
+
+# Enough of an item to tell whether it changed, every ingested item has a record_hash
+HASH_FIELDS = ["PK", "SK", "record_hash"]
+
+# Errors worth retrying later rather than reporting as failures
+THROTTLING_ERRORS = {
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+}
+
+
+class BrotliResponder(IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app, minimum_size: int, quality: int = BROTLI_QUALITY) -> None:
+        super().__init__(app, minimum_size)
+        self.compressor = brotli.Compressor(quality=quality)
+
+    async def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        data = self.compressor.process(body)
+        return data + (self.compressor.flush() if more_body else self.compressor.finish())
+
+
+def _accepted_encodings(header: str) -> set:
+    """Codings from an Accept-Encoding header, leaving out any with q=0"""
+    accepted = set()
+    for part in header.split(","):
+        coding, _, params = part.partition(";")
+        quality = params.strip().lower().removeprefix("q=")
+        if quality and quality.strip("0.") == "":
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+class CompressionMiddleware:
+    """Compress responses over ``minimum_size`` with br or gzip, as the client accepts.
+
+    gzip is Starlette's own middleware, br is preferred when brotli is installed.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size, compresslevel=GZIP_LEVEL)
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accepted = _accepted_encodings(Headers(scope=scope).get("Accept-Encoding", ""))
+        if brotli is not None and "br" in accepted:
+            await BrotliResponder(self.app, self.minimum_size)(scope, receive, send)
+        elif "gzip" in accepted:
+            await self.gzip(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+
 app = FastAPI(title="CRM Egress API")
+app.add_middleware(CompressionMiddleware)
 
 dynamodb = None
 def get_db():
@@ -21,6 +150,20 @@ def get_db():
         dynamodb = boto3.resource("dynamodb")
     return dynamodb
 
+executor = None
+def get_executor():
+    global executor
+    if executor is None:
+        executor = ThreadPoolExecutor(max_workers=BATCH_GET_CONCURRENCY)
+    return executor
+
+shard_executor = None
+def get_shard_executor():
+    global shard_executor
+    if shard_executor is None:
+        shard_executor = ThreadPoolExecutor(max_workers=SHARD_READ_CONCURRENCY)
+    return shard_executor
+
 table = None
 def get_table():
     global table
@@ -28,24 +171,580 @@ def get_table():
         table = get_db().Table(TABLE_NAME)
     return table
 
-@app.get("/leads")
-async def get_leads(email: str = Query(..., description="The user email to query")):
+
+def encode_cursor(last_key: dict) -> str:
+    """Turn a LastEvaluatedKey into an opaque continuation token"""
+    raw = json.dumps(last_key, default=_json_default, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> dict:
     try:
-        # Query by PK (Partition Key)
-        response = get_table().query(
-            KeyConditionExpression=Key("PK").eq(f"USER#{email}")
+        return json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (binascii.Error, UnicodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def parse_fields(fields: str | None) -> List[str] | None:
+    """Split ?fields= into attribute names, 400 if any of them isn't one"""
+    if not fields:
+        return None
+
+    names = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    if not names or len(names) > MAX_FIELDS:
+        raise HTTPException(
+            status_code=400, detail=f"fields takes 1 to {MAX_FIELDS} attribute names"
         )
-        
-        items = response.get("Items", [])
-        if not items:
-            return []
-            
+    for name in names:
+        if not FIELD_NAME.match(name):
+            raise HTTPException(status_code=400, detail=f"Invalid field: {name}")
+    return names
+
+
+def project(items: list, fields: List[str] | None) -> list:
+    """Keep only ``fields`` of each item, without touching the originals"""
+    if not fields:
         return items
+    return [{f: item[f] for f in fields if f in item} for item in items]
+
+
+def with_hash_fields(fields: List[str] | None) -> List[str] | None:
+    """Widen a projection so the items can still be hashed into an ETag"""
+    if not fields:
+        return None
+    return list(dict.fromkeys(fields + HASH_FIELDS))
+
+
+def compute_etag(items: list) -> str:
+    """Strong ETag for a list of items, from their keys and record hashes.
+
+    Items written by the ingestion handler never change under the same hash,
+    so the hashes stand in for the content. Anything without one is hashed
+    whole.
+    """
+    lines = []
+    for item in items:
+        digest = item.get("record_hash")
+        if digest is None:
+            digest = json.dumps(item, default=_json_default, sort_keys=True)
+        lines.append(f"{item.get('PK')}|{item.get('SK')}|{digest}")
+    return f'"{get_stable_hash(chr(10).join(lines))}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """If-None-Match comparison, which is weak, so W/ prefixes are ignored"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+
+
+def not_modified(etag: str, response: Response | None = None) -> Response:
+    headers = {"ETag": etag}
+    if response is not None and "X-Next-Cursor" in response.headers:
+        headers["X-Next-Cursor"] = response.headers["X-Next-Cursor"]
+    return Response(status_code=304, headers=headers)
+
+
+def _json_default(value):
+    # DynamoDB hands numbers back as Decimal
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Cannot serialise {type(value).__name__}")
+
+
+def _projection(fields: List[str] | None) -> dict:
+    """Query arguments reading only ``fields``, all attributes for None"""
+    if not fields:
+        return {}
+    # Placeholders, so names like "status" don't clash with reserved words
+    names = {f"#f{i}": name for i, name in enumerate(fields)}
+    return {"ProjectionExpression": ",".join(names), "ExpressionAttributeNames": names}
+
+
+def query_pages(
+    pk: str,
+    start_key: dict | None = None,
+    limit: int | None = None,
+    index: str | None = None,
+    fields: List[str] | None = None,
+) -> Iterator[tuple[list, dict | None]]:
+    """Lazily follow LastEvaluatedKey through a partition.
+
+    Yields each page's items with the key to resume after it, stopping once
+    the partition is exhausted or ``limit`` items have been returned. With
+    ``index`` the partition is that GSI's, keyed by its hash attribute, and
+    with ``fields`` only those attributes are read. A hot partition of the
+    table is paged through across all its shards by scatter_pages.
+    """
+    if index is None and shard_count(pk):
+        return scatter_pages(pk, start_key, limit, fields)
+    return _key_pages(pk, start_key, limit, index, fields)
+
+
+def _key_pages(
+    pk: str,
+    start_key: dict | None,
+    limit: int | None,
+    index: str | None,
+    fields: List[str] | None,
+) -> Iterator[tuple[list, dict | None]]:
+    remaining = limit
+    while True:
+        kwargs = {"KeyConditionExpression": Key(INDEX_KEYS.get(index, "PK")).eq(pk)}
+        if index:
+            kwargs["IndexName"] = index
+        kwargs.update(_projection(fields))
+        if start_key:
+            kwargs["ExclusiveStartKey"] = start_key
+        if remaining is not None:
+            kwargs["Limit"] = remaining
+
+        response = get_table().query(**kwargs)
+        items = response.get("Items", [])
+        start_key = response.get("LastEvaluatedKey")
+        yield items, start_key
+
+        if remaining is not None:
+            remaining -= len(items)
+            if remaining <= 0:
+                return
+        if not start_key:
+            return
+
+
+def _query_after(
+    pk: str, after: str | None, limit: int, fields: List[str] | None
+) -> tuple[list, bool]:
+    """Up to ``limit`` items of one key with an SK past ``after``, and whether there are more"""
+    condition = Key("PK").eq(pk)
+    if after is not None:
+        condition = condition & Key("SK").gt(after)
+    response = get_table().query(
+        KeyConditionExpression=condition, Limit=limit, **_projection(fields)
+    )
+    return response.get("Items", []), "LastEvaluatedKey" in response
+
+
+def scatter_pages(
+    pk: str,
+    start_key: dict | None = None,
+    limit: int | None = None,
+    fields: List[str] | None = None,
+    page_size: int | None = None,
+) -> Iterator[tuple[list, dict | None]]:
+    """query_pages for a hot partition, merging all its keys in SK order.
+
+    Every page queries each key concurrently for the items after the last
+    SK returned so far, and keeps the merged items up to the last SK any
+    key with more to come has reached. The key to resume from has the shape
+    of a LastEvaluatedKey on ``pk``, so cursors look the same as for any
+    other partition.
+    """
+    page_size = page_size or SHARD_PAGE_SIZE
+    # Merging needs the SK, even if the caller didn't ask for it
+    strip_sk = bool(fields) and "SK" not in fields
+    query_fields = fields + ["SK"] if strip_sk else fields
+
+    after = start_key.get("SK") if start_key else None
+    remaining = limit
+    while True:
+        size = page_size if remaining is None else min(page_size, remaining)
+        futures = [
+            get_shard_executor().submit(_query_after, key, after, size, query_fields)
+            for key in read_keys(pk)
+        ]
+        responses = [future.result() for future in futures]
+
+        merged = merge_by_sk(pk, (items for items, _ in responses))
+        # A key with more to come may still hold anything past its last item
+        bound = min((items[-1]["SK"] for items, more in responses if more and items), default=None)
+        items = [item for item in merged if bound is None or item["SK"] <= bound][:size]
+        more = len(items) < len(merged) or any(more for _, more in responses)
+
+        last_key = {"PK": pk, "SK": items[-1]["SK"]} if items and more else None
+        if strip_sk:
+            yield [{k: v for k, v in item.items() if k != "SK"} for item in items], last_key
+        else:
+            yield items, last_key
+
+        if remaining is not None:
+            remaining -= len(items)
+            if remaining <= 0:
+                return
+        if last_key is None:
+            return
+        after = last_key["SK"]
+
+
+def scatter_index(
+    keys: List[str], index: str, positions: dict, limit: int | None = None
+) -> tuple[list, dict | None]:
+    """Read an index whose values are spread over several hash keys.
+
+    Every key still to be read is queried concurrently and the results are
+    merged in sort key order. ``positions`` maps a key to the index key to
+    resume after, or None once it is exhausted; keys missing from it start
+    from the beginning. Returns up to ``limit`` items, and the positions to
+    carry on from, or None when every key has been read.
+    """
+    pending = [key for key in keys if positions.get(key, {}) is not None]
+
+    def read_key(key: str) -> tuple[list, dict | None]:
+        items: list = []
+        last_key = None
+        for page, last_key in _key_pages(key, positions.get(key), limit, index, None):
+            items.extend(page)
+        return items, last_key
+
+    futures = {key: get_shard_executor().submit(read_key, key) for key in pending}
+    results = {key: future.result() for key, future in futures.items()}
+
+    def order(item: dict) -> tuple:
+        return item["SK"], item["PK"]
+
+    merged = sorted((item for items, _ in results.values() for item in items), key=order)
+    chosen = {id(item) for item in (merged if limit is None else merged[:limit])}
+
+    # Each key gives up the run of its items that made the cut, and resumes
+    # after the last of them. Keys order ties on SK their own way, so this can
+    # come to fewer than ``limit`` items, never to a skipped one.
+    hash_key = INDEX_KEYS[index]
+    taken: list = []
+    next_positions = dict(positions)
+    for key, (items, last_key) in results.items():
+        count = 0
+        while count < len(items) and id(items[count]) in chosen:
+            count += 1
+        taken.extend(items[:count])
+        if count == len(items):
+            next_positions[key] = last_key
+        elif count:
+            last = items[count - 1]
+            next_positions[key] = {k: last[k] for k in ("PK", "SK", hash_key)}
+    taken.sort(key=order)
+
+    if all(next_positions.get(key, {}) is None for key in keys):
+        return taken, None
+    return taken, next_positions
+
+
+def read_all(pk: str, fields: List[str] | None = None) -> list:
+    """Every item in a partition, a hot one read from all its shards at once"""
+    if not shard_count(pk):
+        return [item for page, _ in query_pages(pk, fields=fields) for item in page]
+
+    def read_key(key: str) -> list:
+        return [item for page, _ in _key_pages(key, None, None, None, fields) for item in page]
+
+    futures = [get_shard_executor().submit(read_key, key) for key in read_keys(pk)]
+    return merge_by_sk(pk, (future.result() for future in futures))
+
+
+def _cache_directives(cache_control: str | None) -> set:
+    return {d.strip().lower() for d in (cache_control or "").split(",")}
+
+
+def read_partition(
+    pk: str, cache_control: str | None = None, fields: List[str] | None = None
+) -> list:
+    """Read a whole partition through the warm container cache.
+
+    ``Cache-Control: no-cache`` skips the lookup but refreshes the entry,
+    ``no-store`` leaves the cache alone entirely. With ``fields`` items are
+    only guaranteed to carry those and HASH_FIELDS, it is up to the caller
+    to project them: a cached partition is returned whole, otherwise the
+    projection is pushed down to DynamoDB and the partial items are not
+    cached.
+    """
+    directives = _cache_directives(cache_control)
+    use_cached = not directives & {"no-cache", "no-store"}
+
+    if use_cached:
+        items = partition_cache.get(pk)
+        if items is not None:
+            return items
+
+    if fields:
+        return read_all(pk, with_hash_fields(fields))
+
+    items = read_all(pk)
+
+    if "no-store" not in directives:
+        partition_cache.set(pk, items)
+
+    return items
+
+
+def _stream_ndjson(pages: Iterator[tuple[list, dict | None]]) -> Iterator[str]:
+    for items, _ in pages:
+        for item in items:
+            yield json.dumps(item, default=_json_default) + "\n"
+
+
+def collect_pages(
+    pk: str,
+    response: Response,
+    limit: int | None,
+    cursor: str | None,
+    index: str | None = None,
+    fields: List[str] | None = None,
+) -> list:
+    """Read up to ``limit`` items from a partition, setting X-Next-Cursor if more remain"""
+    start_key = decode_cursor(cursor) if cursor else None
+    try:
+        items = []
+        last_key = None
+        for page, last_key in query_pages(pk, start_key, limit, index=index, fields=fields):
+            items.extend(page)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if last_key and limit is not None:
+        response.headers["X-Next-Cursor"] = encode_cursor(last_key)
+
+    if index is not None:
+        # Index entries carry the table key as written, shard suffix and all
+        items = [unshard(item) for item in items]
+
+    return items
+
+
+@app.get("/leads")
+async def get_leads(
+    response: Response,
+    email: str = Query(..., description="The user email to query"),
+    limit: int | None = Query(None, ge=1, le=1000, description="Maximum items to return"),
+    cursor: str | None = Query(None, description="Continuation token from X-Next-Cursor"),
+    format: Literal["json", "ndjson"] = Query("json", description="Response format"),
+    fields: str | None = Query(
+        None, description="Comma separated attributes to return, e.g. lead_id,status"
+    ),
+    cache_control: str | None = Header(None),
+    if_none_match: str | None = Header(None),
+):
+    """Items in a user's partition.
+
+    JSON responses carry an ETag, and a matching If-None-Match gets a 304
+    instead of the body. The items are still read (or come from the cache):
+    DynamoDB charges for the whole item whatever the projection, so a keys
+    only pre-check would cost a full read again whenever the ETag differs.
+    """
+    pk = f"USER#{email}"
+    projection = parse_fields(fields)
+
+    if format == "ndjson":
+        if limit is not None:
+            # A page is bounded, so it is read up front to give it X-Next-Cursor
+            items = collect_pages(pk, response, limit, cursor, fields=projection)
+            headers = {}
+            if "X-Next-Cursor" in response.headers:
+                headers["X-Next-Cursor"] = response.headers["X-Next-Cursor"]
+            return StreamingResponse(
+                _stream_ndjson(iter([(items, None)])),
+                media_type="application/x-ndjson",
+                headers=headers,
+            )
+
+        start_key = decode_cursor(cursor) if cursor else None
+        # Pages are fetched as the client reads, so memory stays flat
+        return StreamingResponse(
+            _stream_ndjson(query_pages(pk, start_key, limit, fields=projection)),
+            media_type="application/x-ndjson",
+        )
+
+    if cursor is None and limit is None:
+        try:
+            items = read_partition(pk, cache_control, projection)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    else:
+        items = collect_pages(
+            pk, response, limit, cursor, fields=with_hash_fields(projection)
+        )
+
+    etag = compute_etag(items)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, response)
+
+    response.headers["ETag"] = etag
+    return project(items, projection)
+
+
+class BatchGetRequest(BaseModel):
+    emails: List[str] = Field(..., min_length=1, max_length=BATCH_GET_MAX_KEYS)
+
+
+class BatchGetResponse(BaseModel):
+    results: Dict[str, list] = Field(default_factory=dict)
+    errors: Dict[str, str] = Field(default_factory=dict)
+    # Throttled or out of time, safe to send again
+    unprocessed: List[str] = Field(default_factory=list)
+
+    @field_serializer("results")
+    def _encode_results(self, results: Dict[str, list]) -> dict:
+        # Pydantic writes the items' Decimals as strings, encode them the
+        # way /leads does so numbers stay numbers
+        return jsonable_encoder(results)
+
+
+@app.post("/leads:batchGet")
+def batch_get_leads(
+    request: BatchGetRequest, cache_control: str | None = Header(None)
+) -> BatchGetResponse:
+    """Look up many emails at once, grouped by email.
+
+    Partitions are queried concurrently, and through the same cache as
+    /leads. A failed key doesn't fail the call, it is reported per key.
+    """
+    emails = list(dict.fromkeys(request.emails))
+    futures = {
+        email: get_executor().submit(read_partition, f"USER#{email}", cache_control)
+        for email in emails
+    }
+    wait(futures.values(), timeout=BATCH_GET_TIMEOUT_SECONDS)
+
+    result = BatchGetResponse()
+    for email, future in futures.items():
+        if not future.done():
+            future.cancel()
+            result.unprocessed.append(email)
+            continue
+
+        error = future.exception()
+        if error is None:
+            result.results[email] = future.result()
+        elif (
+            isinstance(error, botocore.exceptions.ClientError)
+            and error.response.get("Error", {}).get("Code") in THROTTLING_ERRORS
+        ):
+            result.unprocessed.append(email)
+        else:
+            result.errors[email] = str(error)
+
+    return result
+
+
+@app.get("/leads/by-id/{lead_id}")
+async def get_lead_by_id(lead_id: str, response: Response):
+    """Leads with this lead_id, with their email and status"""
+    return collect_pages(lead_id, response, None, None, index="lead_id-index")
+
+
+@app.get("/leads/by-status/{lead_status}")
+async def get_leads_by_status(
+    lead_status: str,
+    response: Response,
+    limit: int | None = Query(None, ge=1, le=1000, description="Maximum items to return"),
+    cursor: str | None = Query(None, description="Continuation token from X-Next-Cursor"),
+):
+    """Leads currently in a status, with their email and lead_id.
+
+    The index spreads each status over several hash keys (status_key), which
+    are read concurrently and merged in sort key order.
+    """
+    positions = decode_cursor(cursor) if cursor else {}
+    if not isinstance(positions, dict):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    try:
+        items, positions = scatter_index(
+            status_keys(lead_status), "status-index", positions, limit
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    if positions is not None and limit is not None:
+        response.headers["X-Next-Cursor"] = encode_cursor(positions)
+
+    # Index entries carry the table key as written, shard suffix and all
+    return [
+        {k: v for k, v in unshard(item).items() if k != "status_shard"} for item in items
+    ]
+
+
+@app.get("/billing/by-transaction/{transaction_id}")
+async def get_bill_by_transaction(transaction_id: str, response: Response):
+    """The bill for a transaction, with its customer, amount and currency"""
+    return collect_pages(
+        transaction_id, response, None, None, index="transaction_id-index"
+    )
+
+
+@app.get("/billing/by-customer/{customer_id}")
+async def get_bills_by_customer(
+    customer_id: str,
+    response: Response,
+    limit: int | None = Query(None, ge=1, le=1000, description="Maximum items to return"),
+    cursor: str | None = Query(None, description="Continuation token from X-Next-Cursor"),
+):
+    """A customer's bills, with transaction_id, amount and currency"""
+    return collect_pages(customer_id, response, limit, cursor, index="customer_id-index")
+
+
+@app.get("/billing/totals/{customer_id}")
+async def get_billing_totals(
+    customer_id: str,
+    currency: str | None = Query(None, description="Only this currency"),
+):
+    """Running totals of a customer's bills per currency.
+
+    Kept up to date at ingest time, so this reads one item per currency (per
+    shard, for a hot customer) rather than every bill.
+    """
+    pk = f"USER#{customer_id}"
+
+    def get_total(key: str, sk: str) -> list:
+        item = get_table().get_item(Key={"PK": key, "SK": sk}).get("Item")
+        return [item] if item else []
+
+    def query_totals(key: str) -> list:
+        return get_table().query(
+            KeyConditionExpression=Key("PK").eq(key) & Key("SK").begins_with("AGG#BILLING#")
+        ).get("Items", [])
+
+    try:
+        if currency:
+            sk = f"AGG#BILLING#{currency}"
+            # A hot customer has a share of the total on every shard
+            futures = [get_shard_executor().submit(get_total, key, sk) for key in read_keys(pk)]
+        else:
+            futures = [get_shard_executor().submit(query_totals, key) for key in read_keys(pk)]
+        items = [item for future in futures for item in future.result()]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    # Totals of a sharded partition are split between its keys, and add up
+    totals: Dict[str, dict] = {}
+    for item in items:
+        total = totals.setdefault(item["currency"], {"total_amount": 0, "bill_count": 0})
+        total["total_amount"] += item["total_amount"]
+        total["bill_count"] += item["bill_count"]
+
+    return {
+        "customer_id": customer_id,
+        "totals": {
+            cur: {name: _json_default(value) for name, value in total.items()}
+            for cur, total in totals.items()
+        },
+    }
+
+
 @app.get("/health")
 async def health():
-    return {"status": "Operational"}
+    return {"status": "Operational", "cache": partition_cache.stats()}
+
+asgi_handler = Mangum(app)
+
+
+def handler(event, context):
+    response = asgi_handler(event, context)
+
+    # Mangum passes a JSON body through as text whenever it decodes as UTF-8,
+    # which a compressed body occasionally does. The Function URL needs it in base64.
+    headers = response.get("headers") or {}
+    if "content-encoding" in headers and not response.get("isBase64Encoded"):
+        response["body"] = base64.b64encode(response["body"].encode("utf-8")).decode("ascii")
+        response["isBase64Encoded"] = True
 
-handler = Mangum(app)
\ No newline at end of file
+    return response
@@ -1,16 +1,41 @@
 import json
 import logging
 import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import cached_property
+from decimal import Decimal
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Tuple
 
 import boto3
+import botocore.config
 import botocore.exceptions
 from pydantic import TypeAdapter
+from pydantic import ValidationError
 
-from common.models import DiscriminatedStoragePayload as StoragePayload
-from common.models import LeadStorage
+from common import codec
+from common.claim_check import S3_POINTER
+from common.claim_check import decode_body
+from common.claim_check import encode_body
+from common.claim_check import message_attributes
+from common.claim_check import payload_key
+from common.claim_check import record_encoding
 from common.models import BillingStorage
-from common.models import UserSignupStorage
-from common.utils import get_stable_hash
+from common.models import LeadStorage
+from common.registry import DiscriminatedStoragePayload as StoragePayload
+from common.registry import get_webhook_type
+from common.sharding import status_key
+from common.sharding import write_key
+from common.sqs import MAX_BATCH_BYTES
+from common.sqs import message_size
+from common.sqs import record_attributes
+from common.utils import get_fingerprint
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -18,92 +43,811 @@ logger.setLevel(logging.INFO)
 # Create an adapter for our Union type
 adapter = TypeAdapter(StoragePayload)
 
+# Validates a whole batch of bodies joined into one JSON array
+batch_adapter = TypeAdapter(List[StoragePayload])
+
+# TransactWriteItems accepts at most 100 actions per call
+MAX_TRANSACTION_ITEMS = 100
+
+# and at most 4 MB per request. Sizes are measured before the client adds
+# DynamoDB's type tags, so leave room for them
+MAX_TRANSACTION_BYTES = 3 * 1024 * 1024
+
+# Every write is conditional on the item not existing yet
+IDEMPOTENT_CONDITION = "attribute_not_exists(PK) AND attribute_not_exists(SK)"
+
+# Number of partition lanes written in parallel, 1 keeps everything serial
+INGEST_CONCURRENCY = max(1, int(os.environ.get("INGEST_CONCURRENCY", "1")))
+
+# Records that can never succeed go here with their error, rather than
+# being retried until they land in the dead letter queue
+QUARANTINE_QUEUE_URL = os.environ.get("QUARANTINE_QUEUE_URL")
+
+# SendMessageBatch accepts at most 10 entries per call
+MAX_SEND_ENTRIES = 10
+
+# Quarantine messages are encoded like the webhook's: gzipped from the first
+# size and, with PAYLOAD_BUCKET, parked in S3 from the second
+SQS_COMPRESS_MIN_BYTES = int(os.environ.get("SQS_COMPRESS_MIN_BYTES", str(8 * 1024)))
+SQS_OFFLOAD_MIN_BYTES = int(os.environ.get("SQS_OFFLOAD_MIN_BYTES", str(192 * 1024)))
+PAYLOAD_BUCKET = os.environ.get("PAYLOAD_BUCKET")
+
+# DynamoDB telling us to slow down, for the whole call or per transaction item
+THROTTLING_ERRORS = {
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+}
+THROTTLING_REASONS = {"ThrottlingError", "ProvisionedThroughputExceeded"}
+
+# Cancellation reasons that say nothing about the unit itself
+RETRYABLE_REASONS = {"None", "TransactionConflict"} | THROTTLING_REASONS
+
+# Write rate in items per second: where it starts, and its bounds
+INGEST_WRITE_RATE = float(os.environ.get("INGEST_WRITE_RATE", "1000"))
+MIN_WRITE_RATE = 25.0
+MAX_WRITE_RATE = 40000.0
+
+# Throttled or conflicting transactions are retried this many times within an
+# invocation
+MAX_WRITE_ATTEMPTS = int(os.environ.get("MAX_WRITE_ATTEMPTS", "6"))
+BACKOFF_BASE_SECONDS = 0.05
+BACKOFF_MAX_SECONDS = 2.0
+
+# Time kept back from the invocation's budget to report what wasn't written
+DEADLINE_MARGIN_MS = int(os.environ.get("DEADLINE_MARGIN_MS", "3000"))
+
+# Payloads parked in S3 by the webhook are fetched this many at a time
+PAYLOAD_FETCH_CONCURRENCY = max(1, int(os.environ.get("PAYLOAD_FETCH_CONCURRENCY", "8")))
+
 TABLE = None
 
+EXECUTOR = None
+
+FETCH_EXECUTOR = None
+
+SQS = None
+
+S3 = None
+
 
 def get_table():
     """Lazy load table"""
     global TABLE
     if TABLE is None:
         table_name = os.environ.get("TABLE_NAME", "data-table")
-        TABLE = boto3.resource("dynamodb").Table(table_name)
+        config = botocore.config.Config(
+            # One connection per worker so they don't queue on the shared client
+            max_pool_connections=max(10, INGEST_CONCURRENCY),
+            # Throttling is retried by save_to_db, which knows the time budget
+            retries={"mode": "standard", "max_attempts": 2},
+            # Both SDK attempts of a hung call fit in the margin kept back at
+            # the deadline, rather than the 60s default outliving the invocation
+            connect_timeout=DEADLINE_MARGIN_MS / 1000 / 6,
+            read_timeout=DEADLINE_MARGIN_MS / 1000 / 3,
+        )
+        TABLE = boto3.resource("dynamodb", config=config).Table(table_name)
 
     return TABLE
 
 
-def save_to_db(payload, pk, sk, uid):
-    table = get_table()
-    try:
-        table.put_item(
-            Item={"PK": pk, "SK": sk, "record_hash": uid, **payload.model_dump()},
+def get_executor() -> ThreadPoolExecutor:
+    """Lazy load the worker pool, kept for the life of the container"""
+    global EXECUTOR
+    if EXECUTOR is None:
+        EXECUTOR = ThreadPoolExecutor(max_workers=INGEST_CONCURRENCY)
+
+    return EXECUTOR
+
+
+class WriteGovernor:
+    """Token bucket in front of DynamoDB writes whose rate adapts to throttling.
+
+    The rate grows by ``increase`` items a second for every successful write
+    and halves when DynamoDB throttles (at most once per ``cooldown`` so a
+    burst of throttles from parallel lanes counts once). Kept at module level
+    so a warm container remembers what the table could take.
+    """
+
+    def __init__(
+        self,
+        rate: float = INGEST_WRITE_RATE,
+        min_rate: float = MIN_WRITE_RATE,
+        max_rate: float = MAX_WRITE_RATE,
+        increase: float = 50.0,
+        decrease: float = 0.5,
+        cooldown: float = 0.5,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ) -> None:
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate = min(max(rate, min_rate), max_rate)
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.clock = clock
+        self.sleep = sleep
+
+        self.tokens = self.rate
+        self.updated = clock()
+        self.last_decrease = float("-inf")
+        self._lock = threading.Lock()
+
+    def acquire(self, count: int, deadline: float | None = None) -> bool:
+        """Wait for room to write ``count`` items.
+
+        A write bigger than the bucket goes once the bucket is full. Returns
+        False, without waiting, if there won't be room before ``deadline``.
+        """
+        while True:
+            with self._lock:
+                now = self.clock()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                needed = min(count, self.rate)
+                if self.tokens >= needed:
+                    self.tokens -= count
+                    return True
+                wait = (needed - self.tokens) / self.rate
+
+            if deadline is not None and self.clock() + wait > deadline:
+                return False
+            self.sleep(wait)
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self) -> None:
+        with self._lock:
+            now = self.clock()
+            if now - self.last_decrease < self.cooldown:
+                return
+            self.last_decrease = now
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            # Nothing saved up either, the next write waits for the new rate
+            self.tokens = min(self.tokens, 0.0)
+            self.updated = now
+
+
+governor = WriteGovernor()
+
+
+def get_fetch_executor() -> ThreadPoolExecutor:
+    """Lazy load the pool used to fetch parked payloads"""
+    global FETCH_EXECUTOR
+    if FETCH_EXECUTOR is None:
+        FETCH_EXECUTOR = ThreadPoolExecutor(max_workers=PAYLOAD_FETCH_CONCURRENCY)
+
+    return FETCH_EXECUTOR
+
+
+def get_s3():
+    """Lazy load the S3 client used for parked payloads"""
+    global S3
+    if S3 is None:
+        S3 = boto3.client("s3")
+
+    return S3
+
+
+def fetch_payload(bucket: str, key: str) -> bytes:
+    return get_s3().get_object(Bucket=bucket, Key=key)["Body"].read()
+
+
+def offload_payload(data: bytes) -> Tuple[str, str]:
+    """Park a compressed quarantine message in S3 and return where it went"""
+    key = payload_key(data, prefix="quarantine")
+    get_s3().put_object(Bucket=PAYLOAD_BUCKET, Key=key, Body=data)
+    return PAYLOAD_BUCKET, key
+
+
+def get_sqs():
+    """Lazy load the SQS client used for quarantining"""
+    global SQS
+    if SQS is None:
+        SQS = boto3.client("sqs")
+
+    return SQS
+
+
+@dataclass
+class DecodedRecord:
+    """A validated SQS record, ready for the write stage"""
+
+    message_id: str
+    payload: StoragePayload
+    fingerprint: str
+
+
+@dataclass
+class WriteUnit:
+    """All the transaction actions produced by a single SQS record"""
+
+    message_id: str
+    actions: List[dict]
+    # Attempts throttled or cancelled by a conflict so far
+    attempts: int = 0
+
+    @property
+    def keys(self) -> set:
+        return {_action_key(a) for a in self.actions}
+
+    @property
+    def partitions(self) -> set:
+        return {pk for pk, _ in self.keys}
+
+    @cached_property
+    def size(self) -> int:
+        """Rough serialised size of the actions, in bytes"""
+        return len(json.dumps(self.actions, default=str))
+
+
+def _action_key(action: dict) -> Tuple[str, str]:
+    body = next(iter(action.values()))
+    key = body.get("Key") or body["Item"]
+    return key["PK"], key["SK"]
+
+
+def put_action(payload, pk: str, sk: str, uid: str) -> dict:
+    """Build an idempotent Put for a transaction, on pk's shard if it is hot"""
+    pk = write_key(pk, sk)
+    # Round trip through JSON so floats become Decimals, which DynamoDB requires
+    attributes = json.loads(payload.model_dump_json(), parse_float=Decimal)
+    return {
+        "Put": {
+            "TableName": get_table().name,
+            "Item": {"PK": pk, "SK": sk, "record_hash": uid, **attributes},
             # Fail if already written
-            ConditionExpression="attribute_not_exists(PK) AND attribute_not_exists(SK)",
-        )
-        logger.info(f"Successfully saved {sk} for {pk}")
-    except botocore.exceptions.ClientError as e:
-        # Avoid sending to dlq
+            "ConditionExpression": IDEMPOTENT_CONDITION,
+        }
+    }
+
+
+def add_action(
+    pk: str, sk: str, increments: dict, uid: str, shard_sk: str | None = None, **attributes
+) -> dict:
+    """Build an atomic ADD of ``increments`` onto an aggregate item.
+
+    It carries no condition of its own. In the same transaction as a
+    put_action it is applied exactly when that Put is, so once per record.
+    ``attributes`` are SET, and record_hash moves to ``uid`` so readers can
+    tell the aggregate changed. Like a Put it goes to pk's shard if it is
+    hot, picked by ``shard_sk`` when given: a hot partition then keeps one
+    copy of the aggregate per shard, which readers add up.
+    """
+    pk = write_key(pk, shard_sk or sk)
+    values = json.loads(json.dumps(increments), parse_float=Decimal)
+    attributes = {**attributes, "record_hash": uid}
+    return {
+        "Update": {
+            "TableName": get_table().name,
+            "Key": {"PK": pk, "SK": sk},
+            "UpdateExpression": "ADD "
+            + ", ".join(f"{name} :add_{name}" for name in values)
+            + " SET "
+            + ", ".join(f"{name} = :set_{name}" for name in attributes),
+            "ExpressionAttributeValues": {
+                **{f":add_{name}": value for name, value in values.items()},
+                **{f":set_{name}": value for name, value in attributes.items()},
+            },
+        }
+    }
+
+
+def _next_transaction(
+    units: List[WriteUnit],
+) -> Tuple[List[WriteUnit], List[WriteUnit]]:
+    """Split off the next transaction's worth of units.
+
+    A transaction may not touch the same item twice, so a unit that collides
+    with one already taken is deferred, along with anything after it on the
+    same partition so per-partition arrival order holds. Units that would
+    take the transaction past MAX_TRANSACTION_BYTES are deferred the same way.
+    """
+    taken: List[WriteUnit] = []
+    deferred: List[WriteUnit] = []
+    size = 0
+    request_bytes = 0
+    seen_keys: set = set()
+    blocked: set = set()
+
+    for unit in units:
         if (
-            e.response.get("Error", {}).get("Code", "")
-            == "ConditionalCheckFailedException"
+            size + len(unit.actions) > MAX_TRANSACTION_ITEMS
+            # The first unit always goes, however big, or it would never be sent
+            or (taken and request_bytes + unit.size > MAX_TRANSACTION_BYTES)
+            or unit.keys & seen_keys
+            or unit.partitions & blocked
         ):
-            logger.info(f"Duplicate ignored for {pk} | {sk}")
+            deferred.append(unit)
+            blocked |= unit.partitions
+            continue
+
+        taken.append(unit)
+        size += len(unit.actions)
+        request_bytes += unit.size
+        seen_keys |= unit.keys
+
+    return taken, deferred
+
+
+def _decode_cancellation(
+    units: List[WriteUnit], reasons: List[dict]
+) -> Tuple[List[WriteUnit], List[WriteUnit]]:
+    """Map cancellation reasons back onto units.
+
+    Returns the units worth retrying (only cancelled because something else
+    failed, or throttled) and the units that really failed. Units whose own condition check
+    failed are duplicates and are dropped.
+    """
+    retry: List[WriteUnit] = []
+    failed: List[WriteUnit] = []
+
+    position = 0
+    for unit in units:
+        codes = [
+            r.get("Code", "None") for r in reasons[position : position + len(unit.actions)]
+        ]
+        position += len(unit.actions)
+
+        if "ConditionalCheckFailed" in codes:
+            logger.info(f"Duplicate ignored for {unit.message_id}")
+        elif all(code in RETRYABLE_REASONS for code in codes):
+            retry.append(unit)
         else:
-            raise e
+            logger.error(f"Transaction rejected {unit.message_id}: {codes}")
+            failed.append(unit)
 
+    return retry, failed
 
-def handler(event, context):
-    dlq = []
-    for record in event["Records"]:
-        message_id = record["messageId"]
+
+def _report_hot_partitions(units: List[WriteUnit], reasons: List[dict]) -> None:
+    """Log the partitions a transaction was throttled on.
+
+    A partition showing up here again and again is a candidate for
+    HOT_PARTITION_KEYS, which spreads its writes over several shards.
+    """
+    keys = [_action_key(action) for unit in units for action in unit.actions]
+    hot = {pk for (pk, _), r in zip(keys, reasons) if r.get("Code") in THROTTLING_REASONS}
+    for pk in sorted(hot):
+        logger.warning(f"Writes throttled on partition {pk}")
+
+
+def _backoff(attempt: int, deadline: float | None) -> bool:
+    """Sleep a jittered, exponentially growing delay before a retry.
+
+    Returns False, without sleeping, if the retry would land past ``deadline``.
+    """
+    delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2**attempt))
+    if deadline is not None and time.monotonic() + delay > deadline:
+        return False
+    time.sleep(delay)
+    return True
+
+
+def _retry_later(batch: List[WriteUnit], deadline: float | None, throttled: bool) -> bool:
+    """Back off after a throttle or a conflict. False if the batch should be
+    given up on.
+
+    Only throttles slow the governor down, a conflict says nothing about the
+    table's capacity.
+    """
+    if throttled:
+        governor.on_throttle()
+    for unit in batch:
+        unit.attempts += 1
+
+    attempt = max(unit.attempts for unit in batch)
+    return attempt < MAX_WRITE_ATTEMPTS and _backoff(attempt, deadline)
+
+
+def save_to_db(units: List[WriteUnit], deadline: float | None = None) -> List[str]:
+    """Write units with as few transactions as possible.
+
+    Writes go through the governor, and throttled or conflicting transactions
+    are retried with backoff, up to MAX_WRITE_ATTEMPTS times. Anything not written by ``deadline`` (a time.monotonic
+    value) is handed back rather than risking the invocation timing out.
+
+    Returns:
+        Message ids of the units that could not be written
+    """
+    client = get_table().meta.client
+    failed: List[str] = []
+
+    pending = list(units)
+    while pending:
+        batch, pending = _next_transaction(pending)
+
+        size = sum(len(unit.actions) for unit in batch)
+        if not governor.acquire(size, deadline):
+            unattempted = batch + pending
+            logger.warning(f"Out of time, returning {len(unattempted)} records unwritten")
+            failed.extend(unit.message_id for unit in unattempted)
+            break
+
+        try:
+            client.transact_write_items(
+                TransactItems=[a for unit in batch for a in unit.actions]
+            )
+            governor.on_success()
+            logger.info(f"Successfully saved {len(batch)} records")
+        except botocore.exceptions.ClientError as e:
+            code = e.response.get("Error", {}).get("Code", "")
+            if code in THROTTLING_ERRORS:
+                if _retry_later(batch, deadline, throttled=True):
+                    pending = batch + pending
+                else:
+                    logger.error(f"Still throttled, giving up on {len(batch)} records")
+                    failed.extend(unit.message_id for unit in batch)
+                continue
+
+            if code != "TransactionCanceledException":
+                logger.error(f"Transaction failed: {e}")
+                failed.extend(unit.message_id for unit in batch)
+                continue
+
+            reasons = e.response.get("CancellationReasons", [])
+            retry, rejected = _decode_cancellation(batch, reasons)
+            failed.extend(unit.message_id for unit in rejected)
+
+            throttled = any(r.get("Code") in THROTTLING_REASONS for r in reasons)
+            if throttled:
+                _report_hot_partitions(batch, reasons)
+            # A cancellation that dropped duplicates or rejected units leaves a
+            # smaller batch to retry straight away. One that left every unit to
+            # retry was down to a throttle or a conflict, and counts as an attempt.
+            contended = throttled or len(retry) == len(batch)
+            if retry and contended and not _retry_later(retry, deadline, throttled):
+                logger.error(f"Still cancelled, giving up on {len(retry)} records")
+                failed.extend(unit.message_id for unit in retry)
+                retry = []
+
+            # Survivors go first so per-partition order is kept
+            pending = retry + pending
+
+    return failed
+
+
+def _split_lanes(units: List[WriteUnit], lanes: int) -> List[List[WriteUnit]]:
+    """Share units between lanes without splitting a partition across them.
+
+    Partitions are handed to the least loaded lane, biggest first, and each
+    lane keeps the arrival order of its units.
+    """
+    by_partition: dict = {}
+    for position, unit in enumerate(units):
+        by_partition.setdefault(min(unit.partitions), []).append((position, unit))
+
+    loads = [[] for _ in range(lanes)]
+    for group in sorted(by_partition.values(), key=len, reverse=True):
+        min(loads, key=len).extend(group)
+
+    return [[unit for _, unit in sorted(lane)] for lane in loads if lane]
+
+
+def _save_lane(units: List[WriteUnit], deadline: float | None = None) -> List[str]:
+    try:
+        return save_to_db(units, deadline)
+    except Exception as e:
+        logger.error(f"Failed to save batch: {e}")
+        return [unit.message_id for unit in units]
+
+
+def save_concurrently(units: List[WriteUnit], deadline: float | None = None) -> List[str]:
+    """Run save_to_db over independent partition lanes in parallel.
+
+    Records for the same partition always share a lane, so they are still
+    applied in arrival order. Lanes share the governor.
+    """
+    lanes = _split_lanes(units, INGEST_CONCURRENCY)
+    if len(lanes) <= 1:
+        return _save_lane(units, deadline)
+
+    # Create the shared client before fanning out
+    get_table()
+
+    failed: List[str] = []
+    for lane_failures in get_executor().map(_save_lane, lanes, [deadline] * len(lanes)):
+        failed.extend(lane_failures)
+
+    return failed
+
+
+def _validate_all(items: list, validate_batch, validate_one) -> list:
+    """Validate items with one batch call, or one by one if any are bad"""
+    try:
+        payloads = validate_batch(items)
+        # A body that isn't a single JSON value would shift everything after it
+        if len(payloads) == len(items):
+            return payloads
+    except ValidationError:
+        pass
+
+    results = []
+    for item in items:
         try:
-            # SQS body is a string, so load it first
-            raw_body = json.loads(record["body"])
+            results.append(validate_one(item))
+        except ValidationError as e:
+            results.append(e)
+    return results
+
+
+def _validate_bodies(bodies: List[str | dict]) -> List[StoragePayload | Exception]:
+    """Validate bodies, one error per bad body.
 
-            # Hash prevents data duplication
-            uid = get_stable_hash(record["body"])
+    Plain JSON bodies are validated straight from JSON with a single
+    validate_json call over the batch, bodies already decoded from the
+    compact wire format with a single validate_python call. If anything in
+    either is bad, its bodies are validated one by one so each error lands
+    on the right record.
+    """
+    results: List[StoragePayload | Exception] = [None] * len(bodies)  # type: ignore[list-item]
+    texts = [i for i, body in enumerate(bodies) if isinstance(body, str)]
+    objects = [i for i, body in enumerate(bodies) if not isinstance(body, str)]
 
-            payload = adapter.validate_python(raw_body)
+    if texts:
+        validated = _validate_all(
+            [bodies[i] for i in texts],
+            lambda items: batch_adapter.validate_json("[" + ",".join(items) + "]"),
+            adapter.validate_json,
+        )
+        for position, result in zip(texts, validated):
+            results[position] = result
+
+    if objects:
+        validated = _validate_all(
+            [bodies[i] for i in objects],
+            batch_adapter.validate_python,
+            adapter.validate_python,
+        )
+        for position, result in zip(objects, validated):
+            results[position] = result
 
-            # Route based on the actual class type
-            if isinstance(payload, LeadStorage):
-                process_lead(payload, uid)
-            elif isinstance(payload, BillingStorage):
-                process_billing(payload, uid)
-            elif isinstance(payload, UserSignupStorage):
-                process_signup(payload, uid)
+    return results
+
+
+def _decode(record: dict) -> str | Exception:
+    try:
+        return decode_body(record["body"], record_encoding(record), fetch_payload)
+    except Exception as e:
+        return e
+
+
+def resolve_bodies(records: List[dict]) -> List[str | Exception]:
+    """The payload JSON of each record, undoing any claim check encoding.
+
+    Compressed bodies are expanded in place, payloads parked in S3 are
+    fetched concurrently. A body that can't be resolved gets its error.
+    """
+    results: List[str | Exception] = [None] * len(records)  # type: ignore[list-item]
+    fetches = {}
+    for position, record in enumerate(records):
+        if record_encoding(record) == S3_POINTER:
+            fetches[position] = get_fetch_executor().submit(_decode, record)
+        else:
+            results[position] = _decode(record)
+
+    for position, future in fetches.items():
+        results[position] = future.result()
+
+    return results
+
+
+def decode_batch(
+    records: List[dict],
+) -> Tuple[List[DecodedRecord], List[Tuple[str, Exception]]]:
+    """Turn SQS records into typed payloads and fingerprints.
+
+    Returns:
+        The decoded records, and (message id, error) for those that failed
+    """
+    decoded: List[DecodedRecord] = []
+    errors: List[Tuple[str, Exception]] = []
+
+    resolved = []
+    for record, body in zip(records, resolve_bodies(records)):
+        if not isinstance(body, Exception) and (
+            record_attributes(record).get(codec.WIRE_FORMAT) == codec.COMPACT
+        ):
+            try:
+                body = codec.decode(body)
+            except ValueError as e:
+                body = e
 
+        if isinstance(body, Exception):
+            logger.error(f"Could not resolve body of {record['messageId']}: {body}")
+            errors.append((record["messageId"], body))
+        else:
+            resolved.append((record, body))
+
+    results = _validate_bodies([body for _, body in resolved])
+    for (record, _), result in zip(resolved, results):
+        if isinstance(result, Exception):
+            errors.append((record["messageId"], result))
+            continue
+
+        # Hash of the canonical payload, immune to key order and whitespace
+        decoded.append(
+            DecodedRecord(record["messageId"], result, get_fingerprint(result))
+        )
+
+    return decoded, errors
+
+
+def is_permanent(error: Exception) -> bool:
+    """Whether retrying a record could ever help.
+
+    A body that doesn't validate or isn't in the wire format it claims will
+    fail the same way every time, anything else (throttling, timeouts, a
+    schema version from a newer producer) is worth retrying.
+    """
+    return isinstance(error, (ValidationError, codec.WireFormatError))
+
+
+def _quarantine_message(record: dict, error: Exception) -> Tuple[str, dict | None]:
+    """Body and MessageAttributes of a record's quarantine message.
+
+    The original body is escaped into the wrapper, which makes it bigger, so
+    the wrapper goes through encode_body like a webhook payload would.
+    """
+    wrapper = {
+        "message_id": record["messageId"],
+        "body": record["body"],
+        # Needed to read the body again, e.g. body_encoding if it was claim checked
+        "attributes": record_attributes(record),
+        "error": str(error),
+    }
+    body, encoding = encode_body(
+        json.dumps(wrapper).encode("utf-8"),
+        SQS_COMPRESS_MIN_BYTES,
+        SQS_OFFLOAD_MIN_BYTES,
+        offload_payload if PAYLOAD_BUCKET else None,
+    )
+    return body, message_attributes(encoding)
+
+
+def quarantine(failures: List[Tuple[dict, Exception]]) -> List[str]:
+    """Park records that can never succeed on the quarantine queue.
+
+    Each message holds the original body and the error, and calls are kept
+    within SendMessageBatch's entry and size limits. Returns the message ids
+    that couldn't be quarantined, which are left to be retried instead.
+    """
+    if not failures:
+        return []
+    if not QUARANTINE_QUEUE_URL:
+        return [record["messageId"] for record, _ in failures]
+
+    unsent: List[str] = []
+    chunks: List[List[Tuple[str, dict]]] = []
+    chunk: List[Tuple[str, dict]] = []
+    size = 0
+    for record, error in failures:
+        try:
+            body, attributes = _quarantine_message(record, error)
         except Exception as e:
-            logger.error(f"Failed to process record {record['messageId']}: {e}")
+            logger.error(f"Failed to park quarantine message for {record['messageId']}: {e}")
+            unsent.append(record["messageId"])
+            continue
+
+        entry_size = message_size(body, attributes)
+        if entry_size > MAX_BATCH_BYTES:
+            logger.error(
+                f"Quarantine message for {record['messageId']} is {entry_size} bytes, "
+                "set PAYLOAD_BUCKET to park it in S3"
+            )
+            unsent.append(record["messageId"])
+            continue
+
+        if chunk and (len(chunk) >= MAX_SEND_ENTRIES or size + entry_size > MAX_BATCH_BYTES):
+            chunks.append(chunk)
+            chunk, size = [], 0
+        entry = {"Id": str(len(chunk)), "MessageBody": body}
+        if attributes:
+            entry["MessageAttributes"] = attributes
+        chunk.append((record["messageId"], entry))
+        size += entry_size
+    if chunk:
+        chunks.append(chunk)
+
+    for chunk in chunks:
+        try:
+            response = get_sqs().send_message_batch(
+                QueueUrl=QUARANTINE_QUEUE_URL, Entries=[entry for _, entry in chunk]
+            )
+            failed = [int(f["Id"]) for f in response.get("Failed", [])]
+        except Exception as e:
+            logger.error(f"Failed to quarantine records: {e}")
+            failed = list(range(len(chunk)))
+
+        unsent.extend(chunk[position][0] for position in failed)
+
+    return unsent
+
+
+def write_deadline(context) -> float | None:
+    """time.monotonic() value by which writing has to stop, None outside Lambda"""
+    remaining = getattr(context, "get_remaining_time_in_millis", None)
+    if remaining is None:
+        return None
+    return time.monotonic() + max(0, remaining() - DEADLINE_MARGIN_MS) / 1000
+
+
+def handler(event, context):
+    deadline = write_deadline(context)
+    dlq = []
+
+    decoded, errors = decode_batch(event["Records"])
+    records = {record["messageId"]: record for record in event["Records"]}
+    poisoned = []
+    for message_id, error in errors:
+        if is_permanent(error):
+            logger.error(f"Quarantining record {message_id}: {error}")
+            poisoned.append((records[message_id], error))
+        else:
+            logger.error(f"Failed to process record {message_id}: {error}")
             dlq.append({"itemIdentifier": message_id})
 
+    dlq.extend({"itemIdentifier": message_id} for message_id in quarantine(poisoned))
+
+    units: List[WriteUnit] = []
+    for record in decoded:
+        payload = record.payload
+        try:
+            process = PROCESSORS.get(payload.webhook_id, process_item)
+            actions = process(payload, record.fingerprint)
+            units.append(WriteUnit(record.message_id, actions))
+
+        except Exception as e:
+            logger.error(f"Failed to process record {record.message_id}: {e}")
+            dlq.append({"itemIdentifier": record.message_id})
+
+    failed = save_concurrently(units, deadline)
+
+    dlq.extend({"itemIdentifier": message_id} for message_id in failed)
+
     return {"batchItemFailures": dlq}
 
 
-def process_lead(payload: LeadStorage, uid: str):
-    logger.info(f"PROCESSING LEAD: {payload.email} - Status: ({payload.status})")
-    save_to_db(
-        payload=payload,
-        pk=f"USER#{payload.email}",
-        sk=f"LEAD#{payload.lead_id}",
-        uid=uid,
-    )
+def process_item(payload: StoragePayload, uid: str) -> List[dict]:
+    """Store a payload as one item, keyed by its webhook type's templates"""
+    pk, sk = get_webhook_type(payload.webhook_id).keys(payload)
+    logger.info(f"PROCESSING {payload.webhook_id}: {pk} {sk}")
+    return [put_action(payload=payload, pk=pk, sk=sk, uid=uid)]
 
 
-def process_billing(payload: BillingStorage, uid: str):
-    logger.info(
-        f"PROCESSING BILLING: {payload.customer_id} - Amount: {payload.amount} {payload.currency}"
-    )
-    save_to_db(
-        payload=payload,
-        pk=f"USER#{payload.customer_id}",
-        sk=f"BILL#{payload.transaction_id}",
-        uid=uid,
+def process_billing(payload: BillingStorage, uid: str) -> List[dict]:
+    actions = process_item(payload, uid)
+    pk, sk = get_webhook_type(payload.webhook_id).keys(payload)
+    # Running total per currency, only counted if the bill is new. On the
+    # bill's own shard, so a hot customer's bills don't all meet on one item
+    actions.append(
+        add_action(
+            pk=pk,
+            sk=f"AGG#BILLING#{payload.currency}",
+            increments={"total_amount": payload.amount, "bill_count": 1},
+            uid=uid,
+            shard_sk=sk,
+            currency=payload.currency,
+        )
     )
+    return actions
 
 
-def process_signup(payload: UserSignupStorage, uid: str):
-    logger.info(
-        f"PROCESSING SIGNUP: {payload.username} - Source Campaign: {payload.source_campaign}"
-    )
-    # Static sk
-    save_to_db(payload=payload, pk=f"USER#{payload.email}", sk="METADATA", uid=uid)
+def process_lead(payload: LeadStorage, uid: str) -> List[dict]:
+    actions = process_item(payload, uid)
+    item = actions[0]["Put"]["Item"]
+    # status-index is keyed on this rather than the status itself, which has
+    # too few values to spread lead writes over the index's partitions
+    item["status_shard"] = status_key(payload.status, item["SK"])
+    return actions
+
+
+# Webhook types that write more than their own item, by webhook_id
+PROCESSORS: Dict[str, Callable[[StoragePayload, str], List[dict]]] = {
+    "billing_update": process_billing,
+    "lead_ingest": process_lead,
+}
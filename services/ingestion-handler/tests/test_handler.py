@@ -0,0 +1,697 @@
+import importlib.util
+import json
+import os
+import secrets
+import types
+
+import botocore.exceptions
+
+from common.claim_check import BODY_ENCODING
+from common.claim_check import S3_POINTER
+from common.claim_check import decode_body
+from common.sqs import MAX_BATCH_BYTES
+from common.sqs import MAX_BATCH_ENTRIES
+from common.sqs import message_size
+
+HANDLER_PATH = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "handler.py")
+)
+
+
+class FakeDynamoClient:
+    """Applies transactions to an in-memory dict with DynamoDB's semantics."""
+
+    def __init__(self):
+        self.items = {}
+        self.calls = []
+
+    def transact_write_items(self, TransactItems):
+        self.calls.append(TransactItems)
+
+        reasons = []
+        for action in TransactItems:
+            item = action.get("Put", {}).get("Item")
+            if item and (item["PK"], item["SK"]) in self.items:
+                reasons.append({"Code": "ConditionalCheckFailed"})
+            else:
+                reasons.append({"Code": "None"})
+
+        if any(r["Code"] != "None" for r in reasons):
+            error = botocore.exceptions.ClientError(
+                {"Error": {"Code": "TransactionCanceledException"}},
+                "TransactWriteItems",
+            )
+            error.response["CancellationReasons"] = reasons
+            raise error
+
+        for action in TransactItems:
+            if "Put" in action:
+                item = action["Put"]["Item"]
+                self.items[(item["PK"], item["SK"])] = item
+            else:
+                self._update(action["Update"])
+        return {}
+
+    def _update(self, update):
+        """Apply an "ADD a :x, ... SET b = :y, ..." update expression"""
+        key = update["Key"]
+        item = self.items.setdefault((key["PK"], key["SK"]), dict(key))
+        values = update["ExpressionAttributeValues"]
+
+        adds, _, sets = update["UpdateExpression"].removeprefix("ADD ").partition(" SET ")
+        for clause in adds.split(","):
+            name, placeholder = clause.split()
+            item[name] = item.get(name, 0) + values[placeholder]
+        for clause in filter(None, sets.split(",")):
+            name, placeholder = (part.strip() for part in clause.split("="))
+            item[name] = values[placeholder]
+
+
+def _import_handler():
+    """Import the ingestion handler by path with an in-memory table."""
+    spec = importlib.util.spec_from_file_location("ingestion_handler", HANDLER_PATH)
+    handler = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(handler)
+
+    client = FakeDynamoClient()
+    handler.TABLE = types.SimpleNamespace(
+        name="data-table", meta=types.SimpleNamespace(client=client)
+    )
+    return handler, client
+
+
+def _record(message_id, body):
+    return {"messageId": message_id, "body": json.dumps(body)}
+
+
+LEAD = {
+    "webhook_id": "lead_ingest",
+    "lead_id": "lead_1",
+    "email": "lead@example.com",
+    "status": "new",
+}
+
+BILL = {
+    "webhook_id": "billing_update",
+    "customer_id": "cust_1",
+    "amount": 12.5,
+    "currency": "USD",
+    "transaction_id": "txn_1",
+}
+
+
+def test_batch_written_in_one_transaction():
+    handler, client = _import_handler()
+
+    event = {"Records": [_record("m1", LEAD), _record("m2", BILL)]}
+    assert handler.handler(event, None) == {"batchItemFailures": []}
+
+    assert len(client.calls) == 1
+    assert ("USER#lead@example.com", "LEAD#lead_1") in client.items
+    assert ("USER#cust_1", "BILL#txn_1") in client.items
+
+
+def test_transactions_kept_under_request_size():
+    handler, client = _import_handler()
+
+    # Ten ~350 KB items are well under 100 actions but over 4 MB together
+    big = "x" * 350_000
+    records = [
+        _record(f"m{i}", {**LEAD, "email": f"user{i}@example.com", "status": big})
+        for i in range(10)
+    ]
+    assert handler.handler({"Records": records}, None) == {"batchItemFailures": []}
+
+    assert len(client.items) == 10
+    assert len(client.calls) > 1
+    for call in client.calls:
+        assert len(json.dumps(call, default=str)) <= handler.MAX_TRANSACTION_BYTES
+
+
+def test_leads_carry_sharded_status_key():
+    from common.sharding import STATUS_INDEX_SHARDS
+
+    handler, client = _import_handler()
+
+    records = [_record(f"m{i}", {**LEAD, "lead_id": f"lead_{i}"}) for i in range(40)]
+    assert handler.handler({"Records": records}, None) == {"batchItemFailures": []}
+
+    shards = {item["status_shard"] for item in client.items.values()}
+    assert shards <= {f"new#{n}" for n in range(STATUS_INDEX_SHARDS)}
+    assert len(shards) > 1
+
+
+def test_duplicates_ignored_and_rest_retried():
+    handler, client = _import_handler()
+    handler.handler({"Records": [_record("m1", LEAD)]}, None)
+
+    second_lead = {**LEAD, "lead_id": "lead_2"}
+    event = {
+        "Records": [
+            _record("m2", LEAD),
+            _record("m3", second_lead),
+            _record("m4", LEAD),
+        ]
+    }
+    assert handler.handler(event, None) == {"batchItemFailures": []}
+    assert ("USER#lead@example.com", "LEAD#lead_2") in client.items
+
+
+def test_invalid_record_reported():
+    handler, _client = _import_handler()
+
+    event = {"Records": [_record("m1", LEAD), {"messageId": "m2", "body": "{"}]}
+    assert handler.handler(event, None) == {
+        "batchItemFailures": [{"itemIdentifier": "m2"}]
+    }
+
+
+def test_real_cancellation_reported(monkeypatch):
+    handler, client = _import_handler()
+
+    def reject(TransactItems):
+        error = botocore.exceptions.ClientError(
+            {"Error": {"Code": "TransactionCanceledException"}}, "TransactWriteItems"
+        )
+        error.response["CancellationReasons"] = [
+            {"Code": "ValidationError"} if i == 0 else {"Code": "None"}
+            for i in range(len(TransactItems))
+        ]
+        raise error
+
+    real = client.transact_write_items
+    calls = []
+
+    def flaky(TransactItems):
+        calls.append(TransactItems)
+        return reject(TransactItems) if len(calls) == 1 else real(TransactItems)
+
+    monkeypatch.setattr(client, "transact_write_items", flaky)
+
+    event = {"Records": [_record("m1", LEAD), _record("m2", BILL)]}
+    assert handler.handler(event, None) == {
+        "batchItemFailures": [{"itemIdentifier": "m1"}]
+    }
+    assert ("USER#cust_1", "BILL#txn_1") in client.items
+
+
+def test_concurrent_lanes_keep_partition_order(monkeypatch):
+    handler, client = _import_handler()
+    monkeypatch.setattr(handler, "INGEST_CONCURRENCY", 4)
+
+    records = []
+    for i in range(20):
+        lead = {**LEAD, "email": f"user{i % 5}@example.com", "lead_id": f"lead_{i}"}
+        records.append(_record(f"m{i}", lead))
+
+    assert handler.handler({"Records": records}, None) == {"batchItemFailures": []}
+    assert len(client.items) == 20
+
+    # Each transaction only ever holds whole partitions, in arrival order
+    for call in client.calls:
+        by_partition = {}
+        for action in call:
+            item = action["Put"]["Item"]
+            by_partition.setdefault(item["PK"], []).append(int(item["lead_id"][5:]))
+        for lead_ids in by_partition.values():
+            assert lead_ids == sorted(lead_ids)
+            assert len(lead_ids) == 4
+
+
+def test_record_hash_ignores_formatting():
+    handler, client = _import_handler()
+
+    bill = {**BILL, "amount": 12}
+    reordered = json.dumps(dict(reversed(list({**BILL, "amount": 12.0}.items()))), indent=2)
+    event = {
+        "Records": [
+            _record("m1", bill),
+            {"messageId": "m2", "body": reordered.replace("txn_1", "txn_2")},
+        ]
+    }
+    handler.handler(event, None)
+
+    first = client.items[("USER#cust_1", "BILL#txn_1")]["record_hash"]
+    second = client.items[("USER#cust_1", "BILL#txn_2")]["record_hash"]
+    assert first != second
+
+    from common.models import BillingStorage
+    from common.utils import get_fingerprint
+
+    assert first == get_fingerprint(BillingStorage(**{**BILL, "amount": 12.0}))
+    assert get_fingerprint(BillingStorage(**bill), "blake2b") != first
+
+
+def test_decode_batch_isolates_errors():
+    handler, _client = _import_handler()
+
+    records = [
+        _record("m1", LEAD),
+        # Two JSON values in one body must not shift the records after it
+        {"messageId": "m2", "body": json.dumps(LEAD) + "," + json.dumps(BILL)},
+        _record("m3", {**BILL, "amount": "lots"}),
+        _record("m4", BILL),
+    ]
+    decoded, errors = handler.decode_batch(records)
+
+    assert [r.message_id for r in decoded] == ["m1", "m4"]
+    assert [message_id for message_id, _ in errors] == ["m2", "m3"]
+    assert decoded[1].payload.transaction_id == "txn_1"
+
+
+def test_billing_totals_counted_once():
+    from decimal import Decimal
+
+    handler, client = _import_handler()
+
+    event = {
+        "Records": [
+            _record("m1", BILL),
+            _record("m2", {**BILL, "transaction_id": "txn_2", "amount": 0.1}),
+            _record("m3", {**BILL, "transaction_id": "txn_3", "currency": "EUR"}),
+        ]
+    }
+    assert handler.handler(event, None) == {"batchItemFailures": []}
+    # Redelivered bills fail their condition and take their increment with them
+    event["Records"].append(_record("m4", {**BILL, "transaction_id": "txn_4"}))
+    assert handler.handler(event, None) == {"batchItemFailures": []}
+
+    usd = client.items[("USER#cust_1", "AGG#BILLING#USD")]
+    assert usd["total_amount"] == Decimal("25.1")
+    assert usd["bill_count"] == 3
+    assert usd["currency"] == "USD"
+    assert client.items[("USER#cust_1", "AGG#BILLING#EUR")]["bill_count"] == 1
+
+
+def test_poison_records_quarantined(monkeypatch):
+    handler, client = _import_handler()
+    monkeypatch.setattr(handler, "QUARANTINE_QUEUE_URL", "quarantine")
+
+    sent = []
+
+    class FakeSQS:
+        def send_message_batch(self, QueueUrl, Entries):
+            sent.extend(json.loads(e["MessageBody"]) for e in Entries)
+            return {"Successful": [{"Id": e["Id"]} for e in Entries]}
+
+    handler.SQS = FakeSQS()
+
+    event = {
+        "Records": [
+            _record("m1", LEAD),
+            _record("m2", {**BILL, "amount": "lots"}),
+            {"messageId": "m3", "body": "{not json"},
+        ]
+    }
+    assert handler.handler(event, None) == {"batchItemFailures": []}
+    assert len(client.items) == 1
+
+    assert [q["message_id"] for q in sent] == ["m2", "m3"]
+    assert json.loads(sent[0]["body"])["amount"] == "lots"
+    assert "amount" in sent[0]["error"]
+
+    # If the quarantine is unreachable they are retried rather than lost
+    handler.SQS = None
+    monkeypatch.setattr(handler, "get_sqs", lambda: None)
+    assert handler.handler(event, None) == {
+        "batchItemFailures": [{"itemIdentifier": "m2"}, {"itemIdentifier": "m3"}]
+    }
+
+
+def test_oversized_poison_records_quarantined_in_bounds(monkeypatch):
+    handler, client = _import_handler()
+    monkeypatch.setattr(handler, "QUARANTINE_QUEUE_URL", "quarantine")
+
+    calls = []
+
+    class FakeSQS:
+        def send_message_batch(self, QueueUrl, Entries):
+            calls.append(Entries)
+            return {"Successful": [{"Id": e["Id"]} for e in Entries]}
+
+    parked = {}
+
+    class FakeS3:
+        def put_object(self, Bucket, Key, Body):
+            parked[(Bucket, Key)] = Body
+
+    handler.SQS = FakeSQS()
+    handler.S3 = FakeS3()
+
+    # Random hex compresses to about half, so ten of these still overflow one call
+    poison = [
+        {"messageId": f"m{i}", "body": "{" + secrets.token_hex(30 * 1024)} for i in range(10)
+    ]
+    huge = {"messageId": "huge", "body": "{" + secrets.token_hex(250 * 1024)}
+
+    monkeypatch.setattr(handler, "PAYLOAD_BUCKET", None)
+    event = {"Records": poison + [huge]}
+    # Too big to quarantine without a bucket, so it stays on the queue
+    assert handler.handler(event, None) == {"batchItemFailures": [{"itemIdentifier": "huge"}]}
+    assert len(calls) > 1
+    for entries in calls:
+        assert len(entries) <= MAX_BATCH_ENTRIES
+        assert (
+            sum(message_size(e["MessageBody"], e.get("MessageAttributes")) for e in entries)
+            <= MAX_BATCH_BYTES
+        )
+    wrappers = [
+        json.loads(
+            decode_body(
+                e["MessageBody"],
+                e.get("MessageAttributes", {}).get(BODY_ENCODING, {}).get("StringValue"),
+            )
+        )
+        for entries in calls
+        for e in entries
+    ]
+    assert [(w["message_id"], w["body"]) for w in wrappers] == [
+        (r["messageId"], r["body"]) for r in poison
+    ]
+
+    # With a bucket it is parked there and the queue gets a pointer
+    calls.clear()
+    monkeypatch.setattr(handler, "PAYLOAD_BUCKET", "payloads")
+    assert handler.handler({"Records": [huge]}, None) == {"batchItemFailures": []}
+    [[entry]] = calls
+    assert entry["MessageAttributes"][BODY_ENCODING]["StringValue"] == S3_POINTER
+    wrapper = json.loads(
+        decode_body(entry["MessageBody"], S3_POINTER, lambda b, k: parked[(b, k)])
+    )
+    assert wrapper["body"] == huge["body"]
+
+
+class FakeContext:
+    def __init__(self, remaining_ms):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+
+def _throttle_first(monkeypatch, client, times, error=None):
+    """Make the first ``times`` transactions fail with a throttle"""
+    real = client.transact_write_items
+    calls = []
+
+    def throttled(TransactItems):
+        calls.append(TransactItems)
+        if len(calls) > times:
+            return real(TransactItems)
+        if error == "reason":
+            e = botocore.exceptions.ClientError(
+                {"Error": {"Code": "TransactionCanceledException"}}, "TransactWriteItems"
+            )
+            e.response["CancellationReasons"] = [{"Code": "ThrottlingError"}] + [
+                {"Code": "None"}
+            ] * (len(TransactItems) - 1)
+            raise e
+        raise botocore.exceptions.ClientError(
+            {"Error": {"Code": "ProvisionedThroughputExceededException"}},
+            "TransactWriteItems",
+        )
+
+    monkeypatch.setattr(client, "transact_write_items", throttled)
+    return calls
+
+
+def test_throttled_writes_retried_in_invocation(monkeypatch):
+    handler, client = _import_handler()
+    monkeypatch.setattr(handler.time, "sleep", lambda _seconds: None)
+    calls = _throttle_first(monkeypatch, client, 2)
+
+    event = {"Records": [_record("m1", LEAD), _record("m2", BILL)]}
+    assert handler.handler(event, FakeContext(60000)) == {"batchItemFailures": []}
+    assert len(calls) == 3
+    assert len(client.items) == 3
+
+    # Both throttles came within the cooldown, so the rate halved once
+    assert handler.governor.rate == handler.INGEST_WRITE_RATE / 2 + 50
+
+    handler, client = _import_handler()
+    monkeypatch.setattr(handler.time, "sleep", lambda _seconds: None)
+    _throttle_first(monkeypatch, client, 1, error="reason")
+    assert handler.handler(event, FakeContext(60000)) == {"batchItemFailures": []}
+    assert len(client.items) == 3
+
+
+def test_unwritten_records_returned_before_timeout(monkeypatch):
+    handler, client = _import_handler()
+    calls = _throttle_first(monkeypatch, client, 100)
+
+    # The same lead twice collides, so m2 waits for a second transaction
+    event = {"Records": [_record("m1", LEAD), _record("m2", LEAD), _record("m3", BILL)]}
+    context = FakeContext(handler.DEADLINE_MARGIN_MS)
+    assert handler.handler(event, context) == {
+        "batchItemFailures": [
+            {"itemIdentifier": "m1"},
+            {"itemIdentifier": "m3"},
+            {"itemIdentifier": "m2"},
+        ]
+    }
+    # No time to back off, and none left for the second transaction
+    assert len(calls) == 1
+
+
+def test_conflicts_give_up_after_max_attempts(monkeypatch):
+    handler, client = _import_handler()
+    sleeps = []
+    monkeypatch.setattr(handler.time, "sleep", sleeps.append)
+    rate = handler.governor.rate
+    calls = []
+
+    def conflict(TransactItems):
+        calls.append(TransactItems)
+        e = botocore.exceptions.ClientError(
+            {"Error": {"Code": "TransactionCanceledException"}}, "TransactWriteItems"
+        )
+        e.response["CancellationReasons"] = [{"Code": "TransactionConflict"}] * len(
+            TransactItems
+        )
+        raise e
+
+    monkeypatch.setattr(client, "transact_write_items", conflict)
+
+    payload = handler.adapter.validate_python(LEAD)
+    units = [handler.WriteUnit("m1", handler.process_item(payload, "uid"))]
+    # No deadline, as for a direct backfill: the attempts still run out
+    assert handler.save_to_db(units) == ["m1"]
+    assert len(calls) == handler.MAX_WRITE_ATTEMPTS
+    assert len(sleeps) == handler.MAX_WRITE_ATTEMPTS - 1
+    # Conflicts aren't throttles, the write rate is left alone
+    assert handler.governor.rate >= rate
+
+
+def test_write_governor_aimd():
+    handler, _client = _import_handler()
+    now = [0.0]
+    governor = handler.WriteGovernor(
+        rate=100, min_rate=10, max_rate=120, increase=50, clock=lambda: now[0]
+    )
+
+    governor.on_success()
+    assert governor.rate == 120
+    governor.on_throttle()
+    governor.on_throttle()
+    assert governor.rate == 60
+    now[0] = 1
+    governor.on_throttle()
+    assert governor.rate == 30
+
+    # The bucket was emptied, 30 items take a second to earn
+    assert not governor.acquire(30, deadline=1.5)
+    now[0] = 2
+    assert governor.acquire(30, deadline=2)
+
+
+def test_claim_checked_bodies_resolved(monkeypatch):
+    from common.claim_check import encode_body
+
+    handler, client = _import_handler()
+
+    parked = {}
+
+    def offload(data):
+        parked[("payloads", "k")] = data
+        return "payloads", "k"
+
+    fetched = []
+
+    def fetch_payload(bucket, key):
+        fetched.append(key)
+        if key == "missing":
+            raise RuntimeError("NoSuchKey")
+        return parked[(bucket, key)]
+
+    monkeypatch.setattr(handler, "fetch_payload", fetch_payload)
+
+    def encoded(message_id, body, compress, offload_min):
+        message, encoding = encode_body(
+            json.dumps(body).encode(), compress, offload_min, offload
+        )
+        record = {"messageId": message_id, "body": message}
+        if encoding:
+            record["messageAttributes"] = {
+                "body_encoding": {"stringValue": encoding, "dataType": "String"}
+            }
+        return record
+
+    missing = encoded("m4", LEAD, 1, 1)
+    missing["body"] = json.dumps({"bucket": "payloads", "key": "missing"})
+
+    event = {
+        "Records": [
+            _record("m1", LEAD),
+            encoded("m2", BILL, 1, 10**6),
+            encoded("m3", {**LEAD, "lead_id": "lead_2"}, 1, 1),
+            missing,
+        ]
+    }
+    assert handler.handler(event, None) == {"batchItemFailures": [{"itemIdentifier": "m4"}]}
+
+    assert ("USER#cust_1", "BILL#txn_1") in client.items
+    assert ("USER#lead@example.com", "LEAD#lead_2") in client.items
+    assert sorted(fetched) == ["k", "missing"]
+
+
+def test_compact_and_legacy_bodies_decoded(monkeypatch):
+    from common import codec
+    from common.models import BillingStorage
+    from common.models import LeadStorage
+
+    handler, client = _import_handler()
+    monkeypatch.setattr(handler, "QUARANTINE_QUEUE_URL", "quarantine")
+
+    sent = []
+
+    class FakeSQS:
+        def send_message_batch(self, QueueUrl, Entries):
+            sent.extend(json.loads(e["MessageBody"]) for e in Entries)
+            return {"Successful": [{"Id": e["Id"]} for e in Entries]}
+
+    handler.SQS = FakeSQS()
+
+    def compact(message_id, body):
+        return {
+            "messageId": message_id,
+            "body": body,
+            "messageAttributes": {
+                "wire_format": {"stringValue": "compact", "dataType": "String"}
+            },
+        }
+
+    event = {
+        "Records": [
+            # Queued before the codec, no attribute
+            _record("m1", LEAD),
+            compact("m2", codec.encode(BillingStorage(**BILL)).decode()),
+            # Trailing defaults can be left off
+            compact("m3", json.dumps([1, 1, "lead_2", "b@example.com"])),
+            compact("m4", json.dumps({"not": "compact"})),
+            # From a newer producer, retried until this code catches up
+            compact("m5", json.dumps([99, 1, "lead_3"])),
+            # Headers that aren't integers are malformed, not unhashable
+            compact("m6", json.dumps([[1], 1])),
+            compact("m7", json.dumps([1, {"tag": 1}, "lead_4"])),
+        ]
+    }
+    assert handler.handler(event, None) == {"batchItemFailures": [{"itemIdentifier": "m5"}]}
+
+    assert ("USER#lead@example.com", "LEAD#lead_1") in client.items
+    assert ("USER#cust_1", "BILL#txn_1") in client.items
+    assert client.items[("USER#b@example.com", "LEAD#lead_2")]["status"] == "new"
+
+    # The quarantined body keeps its wire format so it can be replayed
+    assert [q["message_id"] for q in sent] == ["m4", "m6", "m7"]
+    assert sent[0]["attributes"] == {"wire_format": "compact"}
+
+    # Compact and plain bodies of the same payload validate the same
+    lead = LeadStorage(**LEAD)
+    results = handler._validate_bodies([codec.decode(codec.encode(lead)), json.dumps(LEAD)])
+    assert results == [lead, lead]
+
+
+def test_every_registered_type_is_stored_and_queueable():
+    from common import codec
+    from common.registry import WEBHOOK_TYPES
+
+    handler, client = _import_handler()
+
+    for webhook_id, webhook_type in WEBHOOK_TYPES.items():
+        # The current wire schema carries every storage field
+        fields = set(webhook_type.storage_model.model_fields) - {"webhook_id"}
+        assert set(codec.SCHEMAS[codec.CURRENT_VERSION][webhook_id]) == fields
+
+    signup = {
+        "webhook_id": "user_signup",
+        "username": "new_user",
+        "email": "user@example.com",
+    }
+    event = {"Records": [_record("m1", LEAD), _record("m2", BILL), _record("m3", signup)]}
+    assert handler.handler(event, None) == {"batchItemFailures": []}
+
+    assert set(client.items) == {
+        ("USER#lead@example.com", "LEAD#lead_1"),
+        ("USER#cust_1", "BILL#txn_1"),
+        ("USER#cust_1", "AGG#BILLING#USD"),
+        ("USER#user@example.com", "METADATA"),
+    }
+
+
+def test_hot_partition_writes_sharded(monkeypatch):
+    from common import sharding
+
+    handler, client = _import_handler()
+    monkeypatch.setattr(sharding, "HOT_PARTITIONS", {"USER#cust_1": 4})
+
+    bills = [{**BILL, "transaction_id": f"txn_{i}"} for i in range(8)]
+    event = {
+        "Records": [_record(f"m{i}", bill) for i, bill in enumerate(bills)]
+        + [_record("lead", LEAD)]
+    }
+    assert handler.handler(event, None) == {"batchItemFailures": []}
+
+    # Each item sits on the shard its SK hashes to, other partitions are untouched
+    for pk, sk in client.items:
+        if sk == "LEAD#lead_1":
+            assert pk == "USER#lead@example.com"
+        elif sk.startswith("AGG#"):
+            # Shares of the total follow the bills they count
+            assert sharding.logical_key(pk) == "USER#cust_1" != pk
+        else:
+            assert pk == sharding.write_key("USER#cust_1", sk) != "USER#cust_1"
+    assert len({pk for pk, _ in client.items}) > 2
+
+    # A retried bill lands on the same shard and is still written once
+    assert handler.handler({"Records": [_record("again", bills[0])]}, None) == {
+        "batchItemFailures": []
+    }
+    shares = [item for (_, sk), item in client.items.items() if sk == "AGG#BILLING#USD"]
+    assert len(shares) > 1
+    assert sum(share["bill_count"] for share in shares) == 8
+
+
+def test_sharded_bills_spread_over_lanes(monkeypatch):
+    from common import sharding
+
+    handler, client = _import_handler()
+    monkeypatch.setattr(sharding, "HOT_PARTITIONS", {"USER#cust_1": 4})
+
+    def unit(message_id, raw):
+        payload = handler.adapter.validate_python(raw)
+        process = handler.PROCESSORS.get(payload.webhook_id, handler.process_item)
+        return handler.WriteUnit(message_id, process(payload, message_id))
+
+    # Each bill and its share of the total sit on the bill's own shard
+    bills = [unit(f"m{i}", {**BILL, "transaction_id": f"txn_{i}"}) for i in range(12)]
+    assert all(len(bill.partitions) == 1 for bill in bills)
+
+    # Shards can be written in parallel
+    assert len(handler._split_lanes(bills, 4)) > 1
+
+    records = [_record(f"m{i}", {**BILL, "transaction_id": f"txn_{i}"}) for i in range(12)]
+    assert handler.handler({"Records": records}, None) == {"batchItemFailures": []}
+    # In one lane, bills on different shards share transactions rather than
+    # each having its own as when they all updated one total
+    assert len(client.calls) < 12
+    assert max(len(call) for call in client.calls) > 2
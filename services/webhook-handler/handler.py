@@ -1,7 +1,9 @@
+import base64
 import json
 import logging
 import os
 import sys
+from typing import Any
 from typing import Dict
 
 import boto3
@@ -9,31 +11,24 @@ import botocore.exceptions
 from fastapi import FastAPI
 from fastapi import HTTPException
 from fastapi import status
+from fastapi.encoders import jsonable_encoder
 from mangum import Mangum
+from pydantic import TypeAdapter
+from pydantic import ValidationError
 
-from common.models import DiscriminatedIngestionPayload as IngestionPayload
-from common.models import DiscriminatedStoragePayload as StoragePayload
-from common.models import BillingIngest
-from common.models import BillingStorage
-from common.models import LeadIngest
-from common.models import LeadStorage
-from common.models import UserSignupIngest
-from common.models import UserSignupStorage
-
-SECRETS_CACHE: Dict[str, str] = {}
-
-
-def get_secret_for_webhook(webhook_id: str) -> str | None:
-    global SECRETS_CACHE
-
-    if not SECRETS_CACHE:
-        client = boto3.client("secretsmanager")
-        secret_id = os.environ["SECRETS_ARN"]
-
-        response = client.get_secret_value(SecretId=secret_id)
-        SECRETS_CACHE = json.loads(response["SecretString"])
-
-    return SECRETS_CACHE.get(webhook_id)
+from common import codec
+from common.cache import LRUCache
+from common.claim_check import BODY_ENCODING
+from common.claim_check import encode_body
+from common.claim_check import payload_key
+from common.models import set_secret_provider
+from common.registry import DiscriminatedIngestionPayload as IngestionPayload
+from common.registry import dump_storage_json
+from common.secret_providers import SecretsManagerProvider
+from common.sqs import SendEntryError
+from common.sqs import SendMessageBatcher
+from common.sqs import string_attributes
+from common.utils import get_fingerprint
 
 
 def setup_logging() -> logging.Logger:
@@ -52,6 +47,28 @@ def setup_logging() -> logging.Logger:
 
 
 QUEUE_URL = os.environ.get("QUEUE_URL")
+SECRETS_ARN = os.environ.get("SECRETS_ARN")
+SECRETS_TTL_SECONDS = float(os.environ.get("SECRETS_TTL_SECONDS", "300"))
+# How long the first webhook in a batch waits for others to join it. Lambda
+# serves one request per environment, so nothing ever joins there and this
+# stays 0; raise it only when running under a multi-request server
+SQS_BATCH_WINDOW_MS = float(os.environ.get("SQS_BATCH_WINDOW_MS", "0"))
+
+# Bodies from this size are gzipped, and from the second parked in S3 with
+# only a pointer queued (needs PAYLOAD_BUCKET)
+SQS_COMPRESS_MIN_BYTES = int(os.environ.get("SQS_COMPRESS_MIN_BYTES", str(8 * 1024)))
+SQS_OFFLOAD_MIN_BYTES = int(os.environ.get("SQS_OFFLOAD_MIN_BYTES", str(192 * 1024)))
+PAYLOAD_BUCKET = os.environ.get("PAYLOAD_BUCKET")
+
+# "json" queues plain storage JSON, "compact" the versioned wire format. SQS
+# bills by the 64 KB chunk, so compact only pays off for bodies near that
+SQS_WIRE_FORMAT = os.environ.get("SQS_WIRE_FORMAT", "json")
+
+# Vendor retries of a payload we already queued within the window are dropped
+recent_webhooks = LRUCache(
+    max_size=int(os.environ.get("DEDUPE_MAX_ENTRIES", "10000")),
+    ttl_seconds=float(os.environ.get("DEDUPE_WINDOW_SECONDS", "300")),
+)
 
 app = FastAPI(title="CRM Ingestion Webhook")
 
@@ -68,15 +85,36 @@ def get_sqs_client():
     return _sqs_client
 
 
-def transmute_to_storage(ingest_data: IngestionPayload) -> StoragePayload:
-    """Converts any Ingest model to its corresponding Storage model, stripping secrets."""
-    if isinstance(ingest_data, LeadIngest):
-        return LeadStorage.model_validate(ingest_data, from_attributes=True)
-    if isinstance(ingest_data, BillingIngest):
-        return BillingStorage.model_validate(ingest_data, from_attributes=True)
-    if isinstance(ingest_data, UserSignupIngest):
-        return UserSignupStorage.model_validate(ingest_data, from_attributes=True)
-    raise ValueError("Unknown payload type")
+_s3_client = None
+
+
+def get_s3_client():
+    """Lazily create and return a boto3 S3 client."""
+    global _s3_client
+    if _s3_client is None:
+        _s3_client = boto3.client("s3")
+    return _s3_client
+
+
+def offload_payload(data: bytes) -> tuple[str, str]:
+    """Park a compressed payload in S3 and return where it went"""
+    key = payload_key(data)
+    get_s3_client().put_object(Bucket=PAYLOAD_BUCKET, Key=key, Body=data)
+    return PAYLOAD_BUCKET, key
+
+
+secret_provider = None
+if SECRETS_ARN:
+    # Fetched during Lambda init so the first request doesn't pay for it
+    secret_provider = SecretsManagerProvider(
+        lambda: boto3.client("secretsmanager"), SECRETS_ARN, SECRETS_TTL_SECONDS
+    )
+    secret_provider.prefetch()
+    set_secret_provider(secret_provider)
+
+sqs_batcher = SendMessageBatcher(
+    get_sqs_client, QUEUE_URL, window_seconds=SQS_BATCH_WINDOW_MS / 1000
+)
 
 
 @app.get("/", status_code=status.HTTP_200_OK)
@@ -85,12 +123,30 @@ async def root() -> Dict[str, str]:
     return {"status": "online"}
 
 
+@app.get("/health", status_code=status.HTTP_200_OK)
+async def health() -> Dict[str, int | str]:
+    """Returns service status and duplicate suppression counters"""
+    return {
+        "status": "online",
+        "duplicates_suppressed": recent_webhooks.hits,
+        "recent_webhooks": len(recent_webhooks),
+    }
+
+
 @app.post("/webhook", status_code=status.HTTP_202_ACCEPTED)
 def receive_webhook(data: IngestionPayload) -> Dict[str, str]:
     """Accepts a payload and send to SQS Queue
     Raises:
         HTTPException if no data received
     """
+    return enqueue(data)
+
+
+def enqueue(data: IngestionPayload) -> Dict[str, str]:
+    """Send a validated payload to SQS, shared by FastAPI and the fast path
+    Raises:
+        HTTPException if no data received or it could not be queued
+    """
     logger.info(f"Received Webhook Data: {data}")
 
     if not data:
@@ -101,12 +157,31 @@ def receive_webhook(data: IngestionPayload) -> Dict[str, str]:
         )
 
     try:
-        storage_data = transmute_to_storage(data)
-        get_sqs_client().send_message(
-            QueueUrl=QUEUE_URL, MessageBody=json.dumps(storage_data.model_dump())
+        # Ingest and storage models fingerprint the same, secret_key is ignored
+        fingerprint = get_fingerprint(data)
+        if recent_webhooks.get(fingerprint):
+            logger.info(f"Suppressed duplicate webhook {fingerprint}")
+            return {"status": "accepted"}
+
+        if SQS_WIRE_FORMAT == codec.COMPACT:
+            payload, wire_format = codec.encode(data), codec.COMPACT
+        else:
+            payload, wire_format = dump_storage_json(data), None
+
+        body, encoding = encode_body(
+            payload,
+            SQS_COMPRESS_MIN_BYTES,
+            SQS_OFFLOAD_MIN_BYTES,
+            offload_payload if PAYLOAD_BUCKET else None,
+        )
+        attributes = string_attributes(
+            {BODY_ENCODING: encoding, codec.WIRE_FORMAT: wire_format}
         )
+        sqs_batcher.send(body, attributes)
+        # Only remember what actually made it onto the queue
+        recent_webhooks.set(fingerprint, True)
         return {"status": "accepted"}
-    except botocore.exceptions.ClientError as error:
+    except (botocore.exceptions.ClientError, SendEntryError):
         logger.exception("Failed to send to SQS")
         raise HTTPException(
             status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -120,5 +195,71 @@ def receive_webhook(data: IngestionPayload) -> Dict[str, str]:
         )
 
 
-# Mangum wrapper for Lambda
-handler = Mangum(app, lifespan="off")
+ingestion_adapter = TypeAdapter(IngestionPayload)
+
+
+def _is_fast_path(event: Dict[str, Any]) -> bool:
+    """Function URL (payload v2) JSON POSTs to /webhook"""
+    http = event.get("requestContext", {}).get("http", {})
+    content_type = event.get("headers", {}).get("content-type", "")
+    return (
+        event.get("version") == "2.0"
+        and http.get("method") == "POST"
+        and event.get("rawPath") == "/webhook"
+        and bool(event.get("body"))
+        and content_type.split(";")[0].strip().endswith("json")
+    )
+
+
+def _response(status_code: int, content: Any) -> Dict[str, Any]:
+    return {
+        "statusCode": status_code,
+        "headers": {"content-type": "application/json"},
+        "body": json.dumps(jsonable_encoder(content), separators=(",", ":")),
+        "isBase64Encoded": False,
+    }
+
+
+def fast_webhook(event: Dict[str, Any]) -> Dict[str, Any] | None:
+    """Handle POST /webhook without Starlette routing or FastAPI's body parsing.
+
+    Returns None when the request should go through FastAPI instead, so the
+    rare malformed JSON cases keep FastAPI's exact error response.
+    """
+    body = event["body"]
+    if event.get("isBase64Encoded"):
+        body = base64.b64decode(body)
+
+    # Non-object bodies fail differently in validate_json, leave them to FastAPI
+    if not body.lstrip().startswith(b"{" if isinstance(body, bytes) else "{"):
+        return None
+
+    context = {"secret_provider": secret_provider} if secret_provider else None
+    try:
+        data = ingestion_adapter.validate_json(body, context=context)
+    except ValidationError as e:
+        errors = e.errors(include_url=False)
+        if any(error["type"] == "json_invalid" for error in errors):
+            return None
+        # Same shape as FastAPI's RequestValidationError response
+        for error in errors:
+            error["loc"] = ("body", *error["loc"])
+        return _response(422, {"detail": errors})
+
+    try:
+        return _response(status.HTTP_202_ACCEPTED, enqueue(data))
+    except HTTPException as e:
+        return _response(e.status_code, {"detail": e.detail})
+
+
+# Mangum wrapper for Lambda, used for everything but the fast path
+asgi_handler = Mangum(app, lifespan="off")
+
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    if _is_fast_path(event):
+        response = fast_webhook(event)
+        if response is not None:
+            return response
+
+    return asgi_handler(event, context)
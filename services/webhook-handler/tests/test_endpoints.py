@@ -28,6 +28,15 @@ def _import_handler_with_dummy(monkeypatch):
             self.sent.append({"QueueUrl": QueueUrl, "MessageBody": MessageBody})
             return {"MessageId": "msg-1"}
 
+        def send_message_batch(self, QueueUrl, Entries):
+            successful = []
+            for entry in Entries:
+                self.send_message(QueueUrl, entry["MessageBody"])
+                if "MessageAttributes" in entry:
+                    self.sent[-1]["MessageAttributes"] = entry["MessageAttributes"]
+                successful.append({"Id": entry["Id"], "MessageId": "msg-1"})
+            return {"Successful": successful, "Failed": []}
+
     dummy = DummySQS()
 
     # Ensure QUEUE_URL exists so handler doesn't pass None to SQS
@@ -70,6 +79,17 @@ def _import_handler_with_dummy(monkeypatch):
     return handler, dummy
 
 
+def _queued_payload(message, body=None):
+    """A queued message's payload as a storage dict, whatever its wire format"""
+    from common import codec
+
+    body = message["MessageBody"] if body is None else body
+    wire_format = message.get("MessageAttributes", {}).get("wire_format", {})
+    if wire_format.get("StringValue") == codec.COMPACT:
+        return codec.decode(body)
+    return json.loads(body)
+
+
 def test_root(monkeypatch):
     handler, _dummy = _import_handler_with_dummy(monkeypatch)
     client = TestClient(handler.app)
@@ -97,9 +117,10 @@ def test_lead_payload_accepted(monkeypatch):
 
     # Ensure message was sent to SQS
     assert len(dummy.sent) == 1
-    body = json.loads(dummy.sent[0]["MessageBody"])
+    body = _queued_payload(dummy.sent[0])
     assert body["webhook_id"] == "lead_ingest"
     assert body["lead_id"] == "lead_123"
+    assert "secret_key" not in body
 
 
 def test_billing_payload_accepted(monkeypatch):
@@ -120,7 +141,7 @@ def test_billing_payload_accepted(monkeypatch):
     assert resp.json() == {"status": "accepted"}
 
     assert len(dummy.sent) == 1
-    body = json.loads(dummy.sent[0]["MessageBody"])
+    body = _queued_payload(dummy.sent[0])
     assert body["webhook_id"] == "billing_update"
     assert body["transaction_id"] == "txn_001"
 
@@ -143,11 +164,39 @@ def test_user_signup_payload_accepted(monkeypatch):
     assert resp.json() == {"status": "accepted"}
 
     assert len(dummy.sent) == 1
-    body = json.loads(dummy.sent[0]["MessageBody"])
+    body = _queued_payload(dummy.sent[0])
     assert body["webhook_id"] == "user_signup"
     assert body["username"] == "new_user"
 
 
+def test_wire_format_attribute(monkeypatch):
+    handler, dummy = _import_handler_with_dummy(monkeypatch)
+    client = TestClient(handler.app)
+
+    payload = {
+        "webhook_id": "lead_ingest",
+        "secret_key": "super-secret-123",
+        "lead_id": "lead_123",
+        "email": "lead@example.com",
+    }
+    # Plain storage JSON by default
+    assert handler.SQS_WIRE_FORMAT == "json"
+    assert client.post("/webhook", json=payload).status_code == 202
+
+    message = dummy.sent[0]
+    assert "MessageAttributes" not in message
+    assert json.loads(message["MessageBody"])["lead_id"] == "lead_123"
+
+    monkeypatch.setattr(handler, "SQS_WIRE_FORMAT", "compact")
+    assert client.post("/webhook", json={**payload, "lead_id": "lead_124"}).status_code == 202
+
+    message = dummy.sent[1]
+    assert message["MessageAttributes"] == {
+        "wire_format": {"DataType": "String", "StringValue": "compact"}
+    }
+    assert json.loads(message["MessageBody"]) == [1, 1, "lead_124", "lead@example.com", "new"]
+
+
 def test_invalid_secret_rejected(monkeypatch):
     handler, _dummy = _import_handler_with_dummy(monkeypatch)
     client = TestClient(handler.app)
@@ -194,3 +243,296 @@ def test_unknown_webhook_id_rejected(monkeypatch):
     resp = client.post("/webhook", json=payload)
     # Discriminator should reject unknown webhook_id
     assert resp.status_code == 422
+
+
+def test_failed_batch_entry_returns_500(monkeypatch):
+    handler, dummy = _import_handler_with_dummy(monkeypatch)
+    client = TestClient(handler.app)
+
+    def reject_all(QueueUrl, Entries):
+        return {
+            "Successful": [],
+            "Failed": [
+                {"Id": e["Id"], "Code": "InternalError", "SenderFault": False}
+                for e in Entries
+            ],
+        }
+
+    monkeypatch.setattr(dummy, "send_message_batch", reject_all)
+
+    payload = {
+        "webhook_id": "lead_ingest",
+        "secret_key": "super-secret-123",
+        "lead_id": "lead_500",
+        "email": "lead@example.com",
+    }
+
+    resp = client.post("/webhook", json=payload)
+    assert resp.status_code == 500
+    assert resp.json()["detail"]["message"] == "Internal storage failure"
+
+
+def test_concurrent_sends_are_coalesced(monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from common.sqs import SendEntryError
+    from common.sqs import SendMessageBatcher
+
+    calls = []
+
+    class BatchSQS:
+        def send_message_batch(self, QueueUrl, Entries):
+            calls.append([e["MessageBody"] for e in Entries])
+            # Reject one body so we can check failures reach the right caller
+            return {
+                "Successful": [
+                    {"Id": e["Id"], "MessageId": f"id-{e['MessageBody']}"}
+                    for e in Entries
+                    if e["MessageBody"] != "3"
+                ],
+                "Failed": [
+                    {"Id": e["Id"], "Code": "InvalidMessageContents", "SenderFault": True}
+                    for e in Entries
+                    if e["MessageBody"] == "3"
+                ],
+            }
+
+    sqs = BatchSQS()
+    batcher = SendMessageBatcher(lambda: sqs, "queue", window_seconds=0.2)
+
+    def send(i):
+        try:
+            return batcher.send(str(i))
+        except SendEntryError as e:
+            return e.code
+
+    with ThreadPoolExecutor(max_workers=12) as pool:
+        results = list(pool.map(send, range(12)))
+
+    assert results[3] == "InvalidMessageContents"
+    assert [r for i, r in enumerate(results) if i != 3] == [
+        f"id-{i}" for i in range(12) if i != 3
+    ]
+    assert all(len(c) <= 10 for c in calls)
+    assert len(calls) < 12
+
+
+def test_lone_send_does_not_wait(monkeypatch):
+    import time
+
+    handler, dummy = _import_handler_with_dummy(monkeypatch)
+
+    # One request per Lambda environment, so there is nobody to wait for
+    assert handler.sqs_batcher.window_seconds == 0
+    started = time.monotonic()
+    handler.sqs_batcher.send("alone")
+    assert time.monotonic() - started < 0.005
+    assert [m["MessageBody"] for m in dummy.sent] == ["alone"]
+
+
+def test_retried_webhook_suppressed(monkeypatch):
+    handler, dummy = _import_handler_with_dummy(monkeypatch)
+    client = TestClient(handler.app)
+
+    payload = {
+        "webhook_id": "lead_ingest",
+        "secret_key": "super-secret-123",
+        "lead_id": "lead_retry",
+        "email": "lead@example.com",
+    }
+
+    for _ in range(3):
+        resp = client.post("/webhook", json=payload)
+        assert resp.status_code == 202
+        assert resp.json() == {"status": "accepted"}
+
+    assert len(dummy.sent) == 1
+
+    health = client.get("/health").json()
+    assert health["duplicates_suppressed"] == 2
+
+
+def test_secrets_refresh_in_background():
+    import threading
+
+    from common.secret_providers import SecretsManagerProvider
+
+    released = threading.Event()
+
+    class FakeSecretsManager:
+        def __init__(self):
+            self.calls = 0
+
+        def get_secret_value(self, SecretId):
+            self.calls += 1
+            if self.calls > 1:
+                released.wait(5)
+            secret = "old" if self.calls == 1 else "rotated"
+            return {"SecretString": json.dumps({"lead_ingest": secret})}
+
+    sm = FakeSecretsManager()
+    now = [0.0]
+    provider = SecretsManagerProvider(lambda: sm, "arn", ttl_seconds=60, clock=lambda: now[0])
+
+    provider.prefetch()
+    assert sm.calls == 1
+    assert provider.get("lead_ingest") == "old"
+
+    # Stale values are served while the refresh is still in flight
+    now[0] = 61
+    assert provider.get("lead_ingest") == "old"
+    released.set()
+
+    for _ in range(100):
+        if provider.get("lead_ingest") == "rotated":
+            break
+        threading.Event().wait(0.01)
+    assert provider.get("lead_ingest") == "rotated"
+
+
+def test_validation_context_provider():
+    import pydantic
+    import pytest
+
+    from common.models import LeadIngest
+    from common.secret_providers import StaticSecretProvider
+
+    payload = {
+        "webhook_id": "lead_ingest",
+        "secret_key": "from-context",
+        "lead_id": "lead_ctx",
+        "email": "lead@example.com",
+    }
+    context = {"secret_provider": StaticSecretProvider({"lead_ingest": "from-context"})}
+
+    assert LeadIngest.model_validate(payload, context=context).lead_id == "lead_ctx"
+
+    with pytest.raises(pydantic.ValidationError):
+        LeadIngest.model_validate(payload)
+
+
+def _function_url_event(body, path="/webhook", method="POST"):
+    return {
+        "version": "2.0",
+        "routeKey": "$default",
+        "rawPath": path,
+        "rawQueryString": "",
+        "headers": {"content-type": "application/json", "host": "example.com"},
+        "requestContext": {
+            "http": {
+                "method": method,
+                "path": path,
+                "protocol": "HTTP/1.1",
+                "sourceIp": "127.0.0.1",
+                "userAgent": "pytest",
+            },
+            "domainName": "example.lambda-url.eu-north-1.on.aws",
+            "requestId": "req-1",
+            "stage": "$default",
+        },
+        "body": body,
+        "isBase64Encoded": False,
+    }
+
+
+def test_fast_path_matches_fastapi(monkeypatch):
+    handler, dummy = _import_handler_with_dummy(monkeypatch)
+    client = TestClient(handler.app)
+
+    fallbacks = []
+    monkeypatch.setattr(
+        handler, "asgi_handler", lambda event, context: fallbacks.append(event)
+    )
+
+    bodies = [
+        {
+            "webhook_id": "billing_update",
+            "secret_key": "money-talks-99",
+            "customer_id": "cust_007",
+            "amount": 123.45,
+            "transaction_id": "txn_fast",
+        },
+        {"webhook_id": "lead_ingest", "secret_key": "wrong", "lead_id": "l", "email": "e"},
+        {"webhook_id": "billing_update", "secret_key": "money-talks-99", "amount": "x"},
+        {"webhook_id": "does_not_exist"},
+    ]
+    for body in bodies:
+        raw = json.dumps(body)
+        fast = handler.handler(_function_url_event(raw), None)
+        # Clear dedupe so FastAPI doesn't see the fast path's send as a retry
+        handler.recent_webhooks.clear()
+        slow = client.post("/webhook", content=raw, headers={"content-type": "application/json"})
+
+        assert fast["statusCode"] == slow.status_code
+        assert json.loads(fast["body"]) == slow.json()
+
+    assert len(dummy.sent) == 2
+    assert fallbacks == []
+
+
+def test_other_requests_fall_back_to_fastapi(monkeypatch):
+    handler, _dummy = _import_handler_with_dummy(monkeypatch)
+
+    resp = handler.handler(_function_url_event(None, path="/", method="GET"), None)
+    assert resp["statusCode"] == 200
+    assert json.loads(resp["body"]) == {"status": "online"}
+
+    resp = handler.handler(_function_url_event("{bad"), None)
+    assert resp["statusCode"] == 422
+    assert json.loads(resp["body"])["detail"][0]["type"] == "json_invalid"
+
+    resp = handler.handler(_function_url_event("[]"), None)
+    assert resp["statusCode"] == 422
+    assert json.loads(resp["body"])["detail"][0]["type"] == "model_attributes_type"
+
+
+def test_large_bodies_compressed_or_offloaded(monkeypatch):
+    import gzip
+
+    from common.claim_check import decode_body
+
+    handler, dummy = _import_handler_with_dummy(monkeypatch)
+    client = TestClient(handler.app)
+
+    class FakeS3:
+        objects = {}
+
+        def put_object(self, Bucket, Key, Body):
+            self.objects[(Bucket, Key)] = Body
+
+    s3 = FakeS3()
+    monkeypatch.setattr(handler, "_s3_client", s3)
+    monkeypatch.setattr(handler, "SQS_COMPRESS_MIN_BYTES", 512)
+    monkeypatch.setattr(handler, "SQS_OFFLOAD_MIN_BYTES", 4096)
+    monkeypatch.setattr(handler, "PAYLOAD_BUCKET", "payloads")
+
+    payload = {
+        "webhook_id": "lead_ingest",
+        "secret_key": "super-secret-123",
+        "lead_id": "lead_123",
+        "email": "lead@example.com",
+    }
+    small = {**payload, "status": "new"}
+    notes = {**payload, "status": "call back " * 200}
+    # Hex barely compresses, so this stays too big for the queue
+    huge = {**payload, "status": os.urandom(8192).hex()}
+
+    for body in (small, notes, huge):
+        assert client.post("/webhook", json=body).status_code == 202
+
+    encodings = [
+        m.get("MessageAttributes", {}).get("body_encoding", {}).get("StringValue")
+        for m in dummy.sent
+    ]
+    assert encodings == [None, "gzip+base64", "s3+gzip"]
+    assert len(dummy.sent[1]["MessageBody"]) < 512
+
+    def fetch(bucket, key):
+        return s3.objects[(bucket, key)]
+
+    for message, encoding, original in zip(dummy.sent, encodings, (small, notes, huge)):
+        decoded = _queued_payload(message, decode_body(message["MessageBody"], encoding, fetch))
+        assert decoded["status"] == original["status"]
+
+    stored = next(iter(s3.objects.values()))
+    assert _queued_payload(dummy.sent[2], gzip.decompress(stored))["lead_id"] == "lead_123"
@@ -0,0 +1 @@
+"""Operational command line tools, run from the repository root with python -m tools.<name>"""
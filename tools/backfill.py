@@ -0,0 +1,495 @@
+"""Bulk load historical events into the ingestion pipeline.
+
+Reads an NDJSON or CSV file of storage payloads (no ``secret_key``), validates
+every row and either queues it for the ingestion handler or writes it straight
+to the table through the handler's own save path. Run from the repository root:
+
+    python -m tools.backfill events.ndjson --queue-url "$QUEUE_URL" --rate 2000
+    python -m tools.backfill events.csv --direct --table data-table \\
+        --checkpoint events.offset --rejects events.rejects.ndjson
+
+With ``--checkpoint`` the offset of the next unwritten row is saved after
+every chunk, and a rerun with the same file carries on from there. A chunk
+with rows that failed for reasons worth retrying (throttling, outages) stops
+the run without moving the checkpoint past it.
+"""
+import argparse
+import csv
+import importlib.util
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any
+from typing import Callable
+from typing import Iterator
+from typing import List
+from typing import TextIO
+from typing import Tuple
+
+from pydantic import TypeAdapter
+from pydantic import ValidationError
+
+from common.claim_check import encode_body
+from common.claim_check import message_attributes
+from common.claim_check import payload_key
+from common.registry import DiscriminatedStoragePayload as StoragePayload
+from common.sqs import MAX_BATCH_BYTES
+from common.sqs import MAX_BATCH_ENTRIES
+from common.sqs import message_size
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+logger = logging.getLogger("backfill")
+
+adapter = TypeAdapter(StoragePayload)
+
+# Retries for entries SQS rejected without it being our fault
+SEND_ATTEMPTS = 3
+
+# Bodies are gzipped and parked in S3 from the same sizes as the webhook's
+SQS_COMPRESS_MIN_BYTES = int(os.environ.get("SQS_COMPRESS_MIN_BYTES", str(8 * 1024)))
+SQS_OFFLOAD_MIN_BYTES = int(os.environ.get("SQS_OFFLOAD_MIN_BYTES", str(192 * 1024)))
+
+# Errors for a whole SendMessageBatch call that sending it again won't fix
+REJECTED_REQUEST_ERRORS = {
+    "BatchRequestTooLong",
+    "AWS.SimpleQueueService.BatchRequestTooLong",
+    "InvalidParameterValue",
+}
+
+# (offset, body, MessageAttributes)
+Entry = Tuple[int, str, Any]
+
+# (offset, validated payload)
+Row = Tuple[int, Any]
+
+# (offset, error, whether sending it again could work)
+Failure = Tuple[int, str, bool]
+
+
+def read_rows(
+    path: str, fmt: str | None = None, start: int = 0
+) -> Iterator[Tuple[int, Any]]:
+    """Yield (offset, raw row) from ``start`` onwards.
+
+    The offset is the row's position in the file, a line for NDJSON and a
+    record after the header for CSV, so it is stable across runs. NDJSON rows
+    are left as text for validate_json, empty CSV cells are dropped so
+    optional fields fall back to their defaults.
+    """
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "ndjson")
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = csv.DictReader(f) if fmt == "csv" else f
+        for offset, row in enumerate(rows):
+            if offset < start:
+                continue
+            if fmt == "csv":
+                yield offset, {
+                    k: v for k, v in row.items() if k is not None and v not in ("", None)
+                }
+            elif row.strip():
+                yield offset, row
+
+
+def validate(raw: Any):
+    if isinstance(raw, str):
+        return adapter.validate_json(raw)
+    return adapter.validate_python(raw)
+
+
+class RateLimiter:
+    """Token bucket allowing ``rate`` rows a second, 0 for no limit"""
+
+    def __init__(self, rate: float, clock: Callable[[], float] = time.monotonic) -> None:
+        self.rate = rate
+        self.clock = clock
+        self.tokens = rate
+        self.updated = clock()
+
+    def acquire(self, count: int = 1) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            now = self.clock()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # A chunk bigger than a second's worth is let through on a full bucket
+            if self.tokens >= min(count, self.rate):
+                self.tokens -= count
+                return
+            time.sleep((min(count, self.rate) - self.tokens) / self.rate)
+
+
+class Checkpoint:
+    """Offset of the next row to load, kept in a small text file"""
+
+    def __init__(self, path: str | None) -> None:
+        self.path = path
+
+    def load(self) -> int:
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        with open(self.path) as f:
+            return int(f.read().strip() or 0)
+
+    def save(self, offset: int) -> None:
+        if not self.path:
+            return
+        # Replace rather than rewrite, so a crash never leaves it half written
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(str(offset))
+        os.replace(tmp, self.path)
+
+
+class SqsSink:
+    """Queues rows for the ingestion handler with parallel SendMessageBatch calls.
+
+    Bodies are encoded like the webhook's (``common.claim_check``): big ones
+    gzipped and, with ``offload``, huge ones parked in S3. A row that still
+    doesn't fit in a message is rejected.
+    """
+
+    def __init__(
+        self,
+        client,
+        queue_url: str,
+        concurrency: int = 8,
+        offload: Callable[[bytes], Tuple[str, str]] | None = None,
+    ) -> None:
+        self.client = client
+        self.queue_url = queue_url
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.offload = offload
+
+    def write(self, rows: List[Row]) -> List[Failure]:
+        """Send rows, returning a Failure for each that could not be queued"""
+        failed: List[Failure] = []
+        entries: List[Entry] = []
+        for offset, payload in rows:
+            body, encoding = encode_body(
+                payload.model_dump_json().encode("utf-8"),
+                SQS_COMPRESS_MIN_BYTES,
+                SQS_OFFLOAD_MIN_BYTES,
+                self.offload,
+            )
+            attributes = message_attributes(encoding)
+            size = message_size(body, attributes)
+            if size > MAX_BATCH_BYTES:
+                error = f"Message of {size} bytes is over the SQS limit, see --payload-bucket"
+                failed.append((offset, error, False))
+            else:
+                entries.append((offset, body, attributes))
+
+        for batch_failures in self.executor.map(self._send, self._batches(entries)):
+            failed.extend(batch_failures)
+        return failed
+
+    @staticmethod
+    def _batches(entries: List[Entry]) -> Iterator[List[Entry]]:
+        """Group entries that fit one SendMessageBatch call"""
+        batch: List[Entry] = []
+        size = 0
+        for entry in entries:
+            entry_size = message_size(entry[1], entry[2])
+            full = len(batch) >= MAX_BATCH_ENTRIES or size + entry_size > MAX_BATCH_BYTES
+            if batch and full:
+                yield batch
+                batch, size = [], 0
+            batch.append(entry)
+            size += entry_size
+        if batch:
+            yield batch
+
+    def _send(self, batch: List[Entry]) -> List[Failure]:
+        pending = {str(offset): (body, attributes) for offset, body, attributes in batch}
+        errors: dict = {}
+        rejected: dict = {}
+        for attempt in range(SEND_ATTEMPTS):
+            if attempt:
+                time.sleep(0.1 * 2**attempt)
+            entries = []
+            for i, (body, attributes) in pending.items():
+                entry = {"Id": i, "MessageBody": body}
+                if attributes:
+                    entry["MessageAttributes"] = attributes
+                entries.append(entry)
+            try:
+                response = self.client.send_message_batch(
+                    QueueUrl=self.queue_url, Entries=entries
+                )
+            except Exception as e:
+                code = getattr(e, "response", {}).get("Error", {}).get("Code")
+                if code in REJECTED_REQUEST_ERRORS:
+                    # The request itself is wrong, it will be every time
+                    rejected.update({i: str(e) for i in pending})
+                    errors, pending = {}, {}
+                    break
+                errors = {i: str(e) for i in pending}
+                continue
+
+            errors = {}
+            for success in response.get("Successful", []):
+                pending.pop(success["Id"], None)
+            for failure in response.get("Failed", []):
+                message = f"{failure.get('Code')}: {failure.get('Message', '')}"
+                # Our own fault won't get better by sending it again
+                if failure.get("SenderFault"):
+                    rejected[failure["Id"]] = message
+                    pending.pop(failure["Id"], None)
+                else:
+                    errors[failure["Id"]] = message
+
+            if not pending:
+                break
+
+        for i in pending:
+            errors.setdefault(i, "No result for entry")
+        return [(int(i), error, True) for i, error in errors.items()] + [
+            (int(i), error, False) for i, error in rejected.items()
+        ]
+
+
+class DirectSink:
+    """Writes rows to the table through the ingestion handler itself.
+
+    The rows go through the same decode, routing and transactional writes as
+    queued messages, without the queue.
+    """
+
+    def __init__(self, handler) -> None:
+        self.handler = handler
+
+    def write(self, rows: List[Row]) -> List[Failure]:
+        records = [
+            {"messageId": str(offset), "body": payload.model_dump_json()}
+            for offset, payload in rows
+        ]
+        result = self.handler.handler({"Records": records}, None)
+        # The rows already validated, so whatever failed is worth retrying
+        return [
+            (int(failure["itemIdentifier"]), "Write failed, see the handler log", True)
+            for failure in result["batchItemFailures"]
+        ]
+
+
+def load_ingestion_handler():
+    path = os.path.join(ROOT, "services", "ingestion-handler", "handler.py")
+    spec = importlib.util.spec_from_file_location("ingestion_handler", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@dataclass
+class Stats:
+    read: int = 0
+    loaded: int = 0
+    invalid: int = 0
+    failed: int = 0
+    offset: int = 0
+    # Set when the run stopped early on failures worth retrying
+    stopped: bool = False
+
+
+class Progress:
+    """Logs a line of counters at most every ``interval`` seconds"""
+
+    def __init__(self, stats: Stats, interval: float = 5.0) -> None:
+        self.stats = stats
+        self.interval = interval
+        self.started = time.monotonic()
+        self.last = self.started
+
+    def update(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self.last < self.interval:
+            return
+        self.last = now
+        rate = self.stats.loaded / max(now - self.started, 1e-9)
+        logger.info(
+            f"offset {self.stats.offset}: {self.stats.loaded} loaded, "
+            f"{self.stats.invalid} invalid, {self.stats.failed} failed, {rate:.0f} rows/s"
+        )
+
+
+def run(
+    rows: Iterator[Tuple[int, Any]],
+    sink,
+    chunk_size: int = 500,
+    limiter: RateLimiter | None = None,
+    checkpoint: Checkpoint | None = None,
+    rejects: TextIO | None = None,
+    progress_interval: float = 5.0,
+) -> Stats:
+    """Validate rows and hand them to ``sink`` a chunk at a time.
+
+    Rows that don't validate, or that the sink rejected for good, are
+    counted, logged and, with ``rejects``, copied there as NDJSON with their
+    error so they can be fixed and loaded again.
+
+    Rows that failed for reasons worth retrying stop the run at their chunk.
+    The checkpoint stays at the start of that chunk, so a rerun sends it
+    again (writes are idempotent) and reports its rejects then.
+    """
+    stats = Stats()
+    progress = Progress(stats, progress_interval)
+
+    def reject(offset: int, raw: Any, error: str) -> None:
+        logger.warning(f"Row {offset} rejected: {error}")
+        if rejects is not None:
+            line = {"offset": offset, "row": raw, "error": error}
+            rejects.write(json.dumps(line) + "\n")
+
+    def flush(
+        chunk: List[Tuple[int, Any, Any]],
+        invalid: List[Tuple[int, Any, str]],
+        start: int,
+        next_offset: int,
+    ) -> bool:
+        """Write a chunk, returning False if the run has to stop before it"""
+        failures: List[Failure] = []
+        if chunk:
+            if limiter is not None:
+                limiter.acquire(len(chunk))
+            failures = sink.write([(offset, payload) for offset, _, payload in chunk])
+
+        retryable = [f for f in failures if f[2]]
+        if retryable:
+            for offset, error, _ in retryable:
+                logger.error(f"Row {offset} failed: {error}")
+            stats.failed += len(retryable)
+            stats.stopped = True
+            logger.error(
+                f"Stopping at offset {start}, {len(retryable)} rows in its chunk "
+                "may succeed on a rerun"
+            )
+            progress.update(force=True)
+            return False
+
+        raw_rows = {offset: raw for offset, raw, _ in chunk}
+        for offset, raw, error in invalid:
+            reject(offset, raw, error)
+        for offset, error, _ in failures:
+            reject(offset, raw_rows[offset], error)
+        stats.invalid += len(invalid)
+        stats.failed += len(failures)
+        stats.loaded += len(chunk) - len(failures)
+
+        # Everything before next_offset has been written or rejected
+        stats.offset = next_offset
+        if checkpoint is not None:
+            checkpoint.save(next_offset)
+        progress.update()
+        return True
+
+    chunk: List[Tuple[int, Any, Any]] = []
+    invalid: List[Tuple[int, Any, str]] = []
+    start = None
+    last = None
+    for offset, raw in rows:
+        if start is None:
+            start = offset
+        last = offset
+        stats.read += 1
+        try:
+            chunk.append((offset, raw, validate(raw)))
+        except ValidationError as e:
+            invalid.append((offset, raw, str(e)))
+
+        if len(chunk) >= chunk_size:
+            if not flush(chunk, invalid, start, offset + 1):
+                return stats
+            chunk, invalid, start = [], [], None
+
+    if last is not None and start is not None:
+        if not flush(chunk, invalid, start, last + 1):
+            return stats
+    progress.update(force=True)
+    return stats
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m tools.backfill",
+        description="Load historical events into the ingestion pipeline",
+    )
+    parser.add_argument("path", help="NDJSON or CSV file of storage payloads")
+    parser.add_argument(
+        "--format", choices=["ndjson", "csv"], help="Default from the extension"
+    )
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--queue-url", default=os.environ.get("QUEUE_URL"))
+    target.add_argument(
+        "--direct", action="store_true", help="Write to the table, skipping the queue"
+    )
+    parser.add_argument("--table", help="TABLE_NAME for --direct")
+    parser.add_argument(
+        "--rate", type=float, default=0, help="Rows per second, 0 for no limit"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=8, help="SendMessageBatch calls in flight"
+    )
+    parser.add_argument("--chunk-size", type=int, default=500, help="Rows per checkpoint")
+    parser.add_argument("--checkpoint", help="File holding the offset to resume from")
+    parser.add_argument(
+        "--start", type=int, help="Offset to start from, overrides --checkpoint"
+    )
+    parser.add_argument("--rejects", help="Append invalid and failed rows here as NDJSON")
+    parser.add_argument(
+        "--payload-bucket",
+        default=os.environ.get("PAYLOAD_BUCKET"),
+        help="Park rows too big for a message here, as the webhook does",
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    if args.direct:
+        if args.table:
+            os.environ["TABLE_NAME"] = args.table
+        sink = DirectSink(load_ingestion_handler())
+    elif args.queue_url:
+        import boto3
+
+        offload = None
+        if args.payload_bucket:
+            s3 = boto3.client("s3")
+
+            def offload(data: bytes) -> Tuple[str, str]:
+                key = payload_key(data)
+                s3.put_object(Bucket=args.payload_bucket, Key=key, Body=data)
+                return args.payload_bucket, key
+
+        sink = SqsSink(boto3.client("sqs"), args.queue_url, args.concurrency, offload)
+    else:
+        parser.error("one of --queue-url (or QUEUE_URL) or --direct is required")
+
+    checkpoint = Checkpoint(args.checkpoint)
+    start = args.start if args.start is not None else checkpoint.load()
+    if start:
+        logger.info(f"Resuming from offset {start}")
+
+    rejects = open(args.rejects, "a", encoding="utf-8") if args.rejects else None
+    try:
+        stats = run(
+            read_rows(args.path, args.format, start),
+            sink,
+            chunk_size=args.chunk_size,
+            limiter=RateLimiter(args.rate),
+            checkpoint=checkpoint,
+            rejects=rejects,
+        )
+    finally:
+        if rejects is not None:
+            rejects.close()
+
+    return 1 if stats.invalid or stats.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
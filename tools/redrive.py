@@ -0,0 +1,191 @@
+"""Move messages from the dead letter or quarantine queue back into the ingestion queue.
+
+Messages are received and re-sent ten at a time, and only deleted from the
+source once the target has accepted them. Run from the repository root:
+
+    python -m tools.redrive --source "$(pulumilocal stack output dead_letter_queue_url)" \\
+        --target "$(pulumilocal stack output ingestion_queue_url)"
+
+Quarantined messages wrap the original body with its error, so fix whatever
+was wrong with them first and pass ``--from-quarantine`` to unwrap them. A
+wrapper too big for the queue was parked in the payload bucket, and is
+fetched from there.
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+from dataclasses import dataclass
+from typing import Callable
+from typing import List
+from typing import Tuple
+
+from common.claim_check import BODY_ENCODING
+from common.claim_check import decode_body
+from common.sqs import MAX_BATCH_BYTES
+from common.sqs import MAX_BATCH_ENTRIES
+from common.sqs import message_size
+from common.sqs import string_attributes
+
+logger = logging.getLogger("redrive")
+
+
+@dataclass
+class Stats:
+    moved: int = 0
+    failed: int = 0
+
+
+def _unwrap(
+    message: dict, fetch: Callable[[str, str], bytes] | None = None
+) -> Tuple[str, dict | None]:
+    """Original body and message attributes of a quarantine message"""
+    encoding = message.get("MessageAttributes", {}).get(BODY_ENCODING, {}).get("StringValue")
+    wrapper = json.loads(decode_body(message["Body"], encoding, fetch))
+    return wrapper["body"], string_attributes(wrapper["attributes"])
+
+
+def _size_batches(entries: List[dict]) -> List[List[dict]]:
+    """Split entries so no SendMessageBatch call is over the request size limit"""
+    batches: List[List[dict]] = []
+    batch: List[dict] = []
+    size = 0
+    for entry in entries:
+        entry_size = message_size(entry["MessageBody"], entry.get("MessageAttributes"))
+        if batch and size + entry_size > MAX_BATCH_BYTES:
+            batches.append(batch)
+            batch, size = [], 0
+        batch.append(entry)
+        size += entry_size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def redrive(
+    client,
+    source: str,
+    target: str,
+    from_quarantine: bool = False,
+    fetch: Callable[[str, str], bytes] | None = None,
+    max_messages: int | None = None,
+    idle_polls: int = 2,
+    wait_seconds: int = 1,
+    max_backoff: float = 30.0,
+    sleep: Callable[[float], None] = time.sleep,
+) -> Stats:
+    """Replay messages until the source is empty or ``max_messages`` have moved.
+
+    A batch with failures backs off exponentially before the next one. Failed
+    messages stay on the source and show up again once their visibility
+    timeout runs out.
+    """
+    stats = Stats()
+    idle = 0
+    failures_in_a_row = 0
+
+    while max_messages is None or stats.moved < max_messages:
+        count = MAX_BATCH_ENTRIES
+        if max_messages is not None:
+            count = min(count, max_messages - stats.moved)
+
+        messages = client.receive_message(
+            QueueUrl=source,
+            MaxNumberOfMessages=count,
+            WaitTimeSeconds=wait_seconds,
+            MessageAttributeNames=["All"],
+        ).get("Messages", [])
+        if not messages:
+            idle += 1
+            if idle >= idle_polls:
+                break
+            continue
+        idle = 0
+
+        entries = []
+        receipts = {}
+        for position, message in enumerate(messages):
+            body, attributes = message["Body"], message.get("MessageAttributes")
+            if from_quarantine:
+                try:
+                    body, attributes = _unwrap(message, fetch)
+                except (ValueError, KeyError, TypeError):
+                    logger.error(f"Not a quarantine message, left in place: {message['MessageId']}")
+                    stats.failed += 1
+                    continue
+
+            entry = {"Id": str(position), "MessageBody": body}
+            if attributes:
+                entry["MessageAttributes"] = attributes
+            entries.append(entry)
+            receipts[entry["Id"]] = message["ReceiptHandle"]
+
+        sent = []
+        # Ten messages that each fit can still be too big for one call together
+        for batch in _size_batches(entries):
+            try:
+                response = client.send_message_batch(QueueUrl=target, Entries=batch)
+                sent.extend(s["Id"] for s in response.get("Successful", []))
+                for failure in response.get("Failed", []):
+                    logger.error(f"Target rejected a message: {failure.get('Code')}")
+            except Exception as e:
+                logger.error(f"Failed to send batch: {e}")
+
+        if sent:
+            client.delete_message_batch(
+                QueueUrl=source,
+                Entries=[{"Id": i, "ReceiptHandle": receipts[i]} for i in sent],
+            )
+
+        stats.moved += len(sent)
+        stats.failed += len(entries) - len(sent)
+        logger.info(f"{stats.moved} moved, {stats.failed} failed")
+
+        if len(sent) < len(messages):
+            failures_in_a_row += 1
+            sleep(min(max_backoff, 0.5 * 2 ** (failures_in_a_row - 1)))
+        else:
+            failures_in_a_row = 0
+
+    return stats
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m tools.redrive",
+        description="Replay dead lettered or quarantined messages into the ingestion queue",
+    )
+    parser.add_argument("--source", required=True, help="Queue URL to drain")
+    parser.add_argument("--target", required=True, help="Queue URL to send to")
+    parser.add_argument(
+        "--from-quarantine",
+        action="store_true",
+        help="Unwrap the original body from quarantine messages",
+    )
+    parser.add_argument("--max-messages", type=int, help="Stop after moving this many")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    import boto3
+
+    s3 = boto3.client("s3")
+
+    def fetch(bucket: str, key: str) -> bytes:
+        return s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+
+    stats = redrive(
+        boto3.client("sqs"),
+        args.source,
+        args.target,
+        from_quarantine=args.from_quarantine,
+        fetch=fetch,
+        max_messages=args.max_messages,
+    )
+    logger.info(f"Done: {stats.moved} moved, {stats.failed} failed")
+    return 1 if stats.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
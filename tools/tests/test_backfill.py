@@ -0,0 +1,240 @@
+import gzip
+import json
+import secrets
+import types
+
+import botocore.exceptions
+
+from tools import backfill
+
+LEAD = {
+    "webhook_id": "lead_ingest",
+    "lead_id": "lead_1",
+    "email": "lead@example.com",
+    "status": "new",
+}
+
+
+class FakeSQS:
+    """Fails every entry whose body mentions "flaky" once, and "bad" always."""
+
+    def __init__(self):
+        self.calls = []
+        self.seen = set()
+
+    def send_message_batch(self, QueueUrl, Entries):
+        self.calls.append(Entries)
+        response = {"Successful": [], "Failed": []}
+        for entry in Entries:
+            body = json.loads(entry["MessageBody"])
+            if body["lead_id"] == "bad":
+                response["Failed"].append(
+                    {"Id": entry["Id"], "Code": "InvalidMessageContents", "SenderFault": True}
+                )
+            elif body["lead_id"] == "flaky" and entry["Id"] not in self.seen:
+                self.seen.add(entry["Id"])
+                response["Failed"].append(
+                    {"Id": entry["Id"], "Code": "InternalError", "SenderFault": False}
+                )
+            else:
+                response["Successful"].append({"Id": entry["Id"], "MessageId": "x"})
+        return response
+
+
+def _write_ndjson(path, rows):
+    path.write_text("".join(json.dumps(row) + "\n" for row in rows))
+
+
+def test_queue_with_rejects_and_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.setattr(backfill.time, "sleep", lambda _seconds: None)
+    rows = [{**LEAD, "lead_id": f"lead_{i}"} for i in range(25)]
+    rows[3] = {**LEAD, "status": None}
+    rows[7]["lead_id"] = "flaky"
+    rows[9]["lead_id"] = "bad"
+    source = tmp_path / "events.ndjson"
+    _write_ndjson(source, rows)
+
+    sqs = FakeSQS()
+    checkpoint = backfill.Checkpoint(str(tmp_path / "offset"))
+    rejects = tmp_path / "rejects.ndjson"
+    with open(rejects, "w") as f:
+        stats = backfill.run(
+            backfill.read_rows(str(source)),
+            backfill.SqsSink(sqs, "queue", concurrency=2),
+            chunk_size=12,
+            checkpoint=checkpoint,
+            rejects=f,
+        )
+
+    assert (stats.read, stats.loaded, stats.invalid, stats.failed) == (25, 23, 1, 1)
+    assert all(len(call) <= 10 for call in sqs.calls)
+    assert checkpoint.load() == 25
+
+    rejected = [json.loads(line) for line in rejects.read_text().splitlines()]
+    assert [r["offset"] for r in rejected] == [3, 9]
+    assert json.loads(rejected[1]["row"])["lead_id"] == "bad"
+
+
+class DownSQS:
+    """Fails every entry with a server side error until brought back up."""
+
+    def __init__(self):
+        self.up = False
+        self.sent = 0
+
+    def send_message_batch(self, QueueUrl, Entries):
+        if self.up:
+            self.sent += len(Entries)
+            return {"Successful": [{"Id": e["Id"], "MessageId": "x"} for e in Entries]}
+        return {
+            "Failed": [
+                {"Id": e["Id"], "Code": "InternalError", "SenderFault": False}
+                for e in Entries
+            ]
+        }
+
+
+def test_outage_stops_without_checkpointing(tmp_path, monkeypatch):
+    monkeypatch.setattr(backfill.time, "sleep", lambda _seconds: None)
+    rows = [{**LEAD, "lead_id": f"lead_{i}"} for i in range(30)]
+    rows[2] = {**LEAD, "status": None}
+    source = tmp_path / "events.ndjson"
+    _write_ndjson(source, rows)
+
+    sqs = DownSQS()
+    checkpoint = backfill.Checkpoint(str(tmp_path / "offset"))
+    rejects = tmp_path / "rejects.ndjson"
+
+    def load():
+        with open(rejects, "a") as f:
+            return backfill.run(
+                backfill.read_rows(str(source), start=checkpoint.load()),
+                backfill.SqsSink(sqs, "queue"),
+                chunk_size=10,
+                checkpoint=checkpoint,
+                rejects=f,
+            )
+
+    stats = load()
+    assert stats.stopped
+    assert (stats.read, stats.loaded, stats.failed) == (11, 0, 10)
+    assert checkpoint.load() == 0
+    # Nothing rejected yet, the rerun reports the invalid row once
+    assert rejects.read_text() == ""
+
+    sqs.up = True
+    stats = load()
+    assert not stats.stopped
+    assert (stats.loaded, stats.invalid, stats.failed) == (29, 1, 0)
+    assert sqs.sent == 29
+    assert checkpoint.load() == 30
+    assert [json.loads(line)["offset"] for line in rejects.read_text().splitlines()] == [2]
+
+
+class RecordingSQS:
+    """Accepts everything, or fails whole calls over the request size limit."""
+
+    def __init__(self):
+        self.entries = []
+
+    def send_message_batch(self, QueueUrl, Entries):
+        if sum(len(e["MessageBody"]) for e in Entries) > backfill.MAX_BATCH_BYTES:
+            raise botocore.exceptions.ClientError(
+                {"Error": {"Code": "BatchRequestTooLong"}}, "SendMessageBatch"
+            )
+        self.entries.extend(Entries)
+        return {"Successful": [{"Id": e["Id"], "MessageId": "x"} for e in Entries]}
+
+
+def test_oversized_rows_rejected_or_parked(tmp_path):
+    # Doesn't compress below the SQS limit
+    big = {**LEAD, "lead_id": "big", "status": secrets.token_hex(300_000)}
+    rows = [{**LEAD, "lead_id": "small"}, big]
+    source = tmp_path / "events.ndjson"
+    _write_ndjson(source, rows)
+
+    sqs = RecordingSQS()
+    checkpoint = backfill.Checkpoint(str(tmp_path / "offset"))
+    stats = backfill.run(
+        backfill.read_rows(str(source)), backfill.SqsSink(sqs, "queue"), checkpoint=checkpoint
+    )
+    # A permanent failure, the run carries on rather than sticking at the row
+    assert not stats.stopped
+    assert (stats.loaded, stats.failed) == (1, 1)
+    assert checkpoint.load() == 2
+
+    parked = {}
+
+    def offload(data):
+        parked["k"] = data
+        return "payloads", "k"
+
+    sqs = RecordingSQS()
+    stats = backfill.run(
+        backfill.read_rows(str(source)), backfill.SqsSink(sqs, "queue", offload=offload)
+    )
+    assert (stats.loaded, stats.failed) == (2, 0)
+    pointer = sqs.entries[-1]
+    assert pointer["MessageAttributes"]["body_encoding"]["StringValue"] == "s3+gzip"
+    assert json.loads(gzip.decompress(parked["k"]))["lead_id"] == "big"
+
+
+def test_request_errors_are_permanent(monkeypatch):
+    monkeypatch.setattr(backfill.time, "sleep", lambda _seconds: None)
+
+    class Client:
+        calls = 0
+
+        def send_message_batch(self, QueueUrl, Entries):
+            self.calls += 1
+            raise botocore.exceptions.ClientError(
+                {"Error": {"Code": "InvalidParameterValue"}}, "SendMessageBatch"
+            )
+
+    client = Client()
+    payload = backfill.adapter.validate_python(LEAD)
+    failures = backfill.SqsSink(client, "queue").write([(0, payload)])
+    assert [(offset, retryable) for offset, _, retryable in failures] == [(0, False)]
+    assert client.calls == 1
+
+
+def test_resume_from_checkpoint(tmp_path):
+    source = tmp_path / "events.csv"
+    source.write_text(
+        "webhook_id,customer_id,amount,currency,transaction_id\n"
+        + "".join(f"billing_update,cust_1,{i}.5,,txn_{i}\n" for i in range(6))
+    )
+
+    written = []
+    sink = types.SimpleNamespace(write=lambda rows: written.extend(rows) or [])
+
+    stats = backfill.run(backfill.read_rows(str(source), start=4), sink)
+    assert [offset for offset, _ in written] == [4, 5]
+    assert written[0][1].amount == 4.5
+    # Empty cells fall back to the model default
+    assert written[0][1].currency == "USD"
+    assert stats.offset == 6
+
+
+def test_direct_write_through_ingestion_handler(tmp_path, monkeypatch):
+    handler = backfill.load_ingestion_handler()
+    items = {}
+
+    def transact_write_items(TransactItems):
+        for action in TransactItems:
+            if "Put" in action:
+                item = action["Put"]["Item"]
+                items[(item["PK"], item["SK"])] = item
+
+    handler.TABLE = types.SimpleNamespace(
+        name="data-table",
+        meta=types.SimpleNamespace(
+            client=types.SimpleNamespace(transact_write_items=transact_write_items)
+        ),
+    )
+    source = tmp_path / "events.ndjson"
+    _write_ndjson(source, [LEAD, {**LEAD, "lead_id": "lead_2"}])
+
+    stats = backfill.run(backfill.read_rows(str(source)), backfill.DirectSink(handler))
+    assert stats.loaded == 2
+    assert ("USER#lead@example.com", "LEAD#lead_2") in items
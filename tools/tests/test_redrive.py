@@ -0,0 +1,147 @@
+import json
+
+from common.claim_check import encode_body
+from common.claim_check import message_attributes
+from common.sqs import MAX_BATCH_BYTES
+from common.sqs import message_size
+from tools import redrive
+
+
+class FakeSQS:
+    """Two in-memory queues. Received messages stay put until deleted."""
+
+    def __init__(self, source_bodies, reject=()):
+        self.queues = {
+            "source": [
+                {"MessageId": str(i), "ReceiptHandle": f"r{i}", "Body": body}
+                for i, body in enumerate(source_bodies)
+            ],
+            "target": [],
+        }
+        self.reject = set(reject)
+        self.in_flight = set()
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages, **kwargs):
+        visible = [
+            m for m in self.queues[QueueUrl] if m["ReceiptHandle"] not in self.in_flight
+        ][:MaxNumberOfMessages]
+        self.in_flight |= {m["ReceiptHandle"] for m in visible}
+        return {"Messages": visible}
+
+    def send_message_batch(self, QueueUrl, Entries):
+        response = {"Successful": [], "Failed": []}
+        for entry in Entries:
+            if entry["MessageBody"] in self.reject:
+                response["Failed"].append({"Id": entry["Id"], "Code": "InternalError"})
+            else:
+                message = {"Body": entry["MessageBody"]}
+                if "MessageAttributes" in entry:
+                    message["MessageAttributes"] = entry["MessageAttributes"]
+                self.queues[QueueUrl].append(message)
+                response["Successful"].append({"Id": entry["Id"]})
+        return response
+
+    def delete_message_batch(self, QueueUrl, Entries):
+        handles = {e["ReceiptHandle"] for e in Entries}
+        self.queues[QueueUrl] = [
+            m for m in self.queues[QueueUrl] if m["ReceiptHandle"] not in handles
+        ]
+
+
+def test_redrive_moves_in_batches_and_backs_off():
+    bodies = [json.dumps({"n": i}) for i in range(23)]
+    sqs = FakeSQS(bodies, reject={bodies[4]})
+    sleeps = []
+
+    stats = redrive.redrive(sqs, "source", "target", sleep=sleeps.append)
+
+    assert (stats.moved, stats.failed) == (22, 1)
+    assert [m["Body"] for m in sqs.queues["target"]] == bodies[:4] + bodies[5:]
+    # Only the rejected message is left behind
+    assert [m["Body"] for m in sqs.queues["source"]] == [bodies[4]]
+    assert sleeps == [0.5]
+
+
+def test_redrive_unwraps_quarantined_messages():
+    original = json.dumps({"webhook_id": "lead_ingest"})
+    wrapped = json.dumps({"message_id": "m1", "body": original, "attributes": {}, "error": "bad"})
+    compact = json.dumps(
+        {
+            "message_id": "m2",
+            "body": "[1,1]",
+            "attributes": {"wire_format": "compact"},
+            "error": "bad",
+        }
+    )
+    sqs = FakeSQS([wrapped, compact, "not wrapped"])
+
+    stats = redrive.redrive(
+        sqs, "source", "target", from_quarantine=True, max_messages=5, sleep=lambda _: None
+    )
+
+    assert (stats.moved, stats.failed) == (2, 1)
+    # The original message attributes come back with the body
+    assert sqs.queues["target"] == [
+        {"Body": original},
+        {
+            "Body": "[1,1]",
+            "MessageAttributes": {
+                "wire_format": {"DataType": "String", "StringValue": "compact"}
+            },
+        },
+    ]
+
+
+def test_redrive_unwraps_compressed_and_parked_quarantine():
+    parked = {}
+
+    def offload(data):
+        parked[("payloads", "k")] = data
+        return "payloads", "k"
+
+    def quarantined(message_id, body, offload_min):
+        wrapper = json.dumps(
+            {"message_id": message_id, "body": body, "attributes": {}, "error": "bad"}
+        )
+        encoded, encoding = encode_body(wrapper.encode(), 0, offload_min, offload)
+        assert encoding is not None
+        return {"Body": encoded, "MessageAttributes": message_attributes(encoding)}
+
+    bodies = [json.dumps({"n": n, "notes": "x" * 2000}) for n in range(2)]
+    sqs = FakeSQS([])
+    sqs.queues["source"] = [
+        {"ReceiptHandle": f"r{i}", **message}
+        for i, message in enumerate(
+            [quarantined("m1", bodies[0], 10**9), quarantined("m2", bodies[1], 0)]
+        )
+    ]
+
+    stats = redrive.redrive(
+        sqs,
+        "source",
+        "target",
+        from_quarantine=True,
+        fetch=lambda bucket, key: parked[(bucket, key)],
+        sleep=lambda _: None,
+    )
+
+    assert (stats.moved, stats.failed) == (2, 0)
+    assert sqs.queues["target"] == [{"Body": body} for body in bodies]
+
+
+def test_redrive_keeps_batches_under_request_size():
+    bodies = [str(i) * (60 * 1024) for i in range(10)]
+    sqs = FakeSQS(bodies)
+    calls = []
+    send = sqs.send_message_batch
+
+    def recording_send(QueueUrl, Entries):
+        calls.append(sum(message_size(e["MessageBody"]) for e in Entries))
+        return send(QueueUrl, Entries)
+
+    sqs.send_message_batch = recording_send
+
+    stats = redrive.redrive(sqs, "source", "target", sleep=lambda _: None)
+
+    assert stats.moved == 10
+    assert len(calls) > 1 and max(calls) <= MAX_BATCH_BYTES